@@ -1 +1,4 @@
-from .client import RevClient
\ No newline at end of file
+from .client import RevClient
+from .asyncclient import AsyncRevClient
+from .upload import UploadManager
+from .pool import RevClientPool
\ No newline at end of file
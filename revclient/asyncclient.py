@@ -0,0 +1,199 @@
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict
+from .client import RevClient, ScrollCursor, MAX_INT
+from .utils import NamespacedClient
+from .video import migrate_params, patch_operations, transcription_args
+from .upload import DEFAULT_CHUNK_SIZE
+from .download import DownloadResult, DEFAULT_DOWNLOAD_CHUNK_SIZE, DEFAULT_RANGE_SIZE, DEFAULT_DOWNLOAD_WORKERS
+from .watch import WaitResult, DEFAULT_MIN_POLL_INTERVAL, DEFAULT_MAX_POLL_INTERVAL, DEFAULT_WATCH_WORKERS, DEFAULT_PROCESSING_BYTES_PER_SEC
+
+DEFAULT_MAX_CONCURRENCY = 10
+
+# asyncio.get_running_loop is python 3.7+
+get_running_loop = getattr(asyncio, 'get_running_loop', asyncio.get_event_loop)
+
+async def read_ahead(pages, depth = 1):
+    # async version of utils.read_ahead - fetch pages in a background task
+    buffer = asyncio.Queue(maxsize=depth)
+    end = object()
+
+    async def produce():
+        try:
+            async for page in pages:
+                await buffer.put((page, None))
+            await buffer.put((end, None))
+        except Exception as err:
+            await buffer.put((end, err))
+
+    task = asyncio.ensure_future(produce())
+    try:
+        while True:
+            page, err = await buffer.get()
+            if page is end:
+                if err:
+                    raise err
+                return
+            yield page
+    finally:
+        task.cancel()
+
+#%%
+class AsyncRevClient():
+    def __init__(self, url, apiKey = None, secret = None, username = None, password = None, max_concurrency = DEFAULT_MAX_CONCURRENCY, **kwargs):
+        self.url = url
+        self.max_concurrency = max_concurrency
+
+        # blocking client does the actual I/O, so its session and connection pool are shared
+        kwargs.setdefault('pool_maxsize', max_concurrency)
+        self.client = RevClient(url, apiKey, secret, username, password, **kwargs)
+        self.session = self.client.session
+        self.executor = ThreadPoolExecutor(max_workers=max_concurrency)
+        # created on first use so it's bound to the running event loop
+        self._semaphore = None
+        self.video = AsyncVideoClient(self)
+
+    async def close(self):
+        self.executor.shutdown(wait=False)
+        self.client.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        await self.close()
+
+    @property
+    def semaphore(self):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    # run a blocking call on the executor, counted against max_concurrency.
+    # Every request goes through here - the HTTP calls themselves are made by RevClient on executor threads,
+    # not on the event loop, so concurrency is still bounded by max_concurrency threads. That keeps retries,
+    # re-login, rate limits, the cache and hooks in one blocking implementation shared with RevClient
+    async def run(self, fn, *args, **kwargs):
+        call = functools.partial(fn, *args, **kwargs)
+        async with self.semaphore:
+            return await get_running_loop().run_in_executor(self.executor, call)
+
+    async def request(self, method='GET', endpoint='', payload=None, options={}, **kwargs):
+        return await self.run(self.client.request, method, endpoint, payload, options, **kwargs)
+    async def get(self, endpoint='', payload=None, options={}, **kwargs):
+        return await self.request('GET', endpoint, payload, options, **kwargs)
+    async def post(self, endpoint='', payload=None, options={}, **kwargs):
+        return await self.request('POST', endpoint, payload, options, **kwargs)
+    async def put(self, endpoint='', payload=None, options={}, **kwargs):
+        return await self.request('PUT', endpoint, payload, options, **kwargs)
+    async def patch(self, endpoint='', payload=None, options={}, **kwargs):
+        return await self.request('PATCH', endpoint, payload, options, **kwargs)
+    async def delete(self, endpoint='', payload=None, options={}, **kwargs):
+        return await self.request('DELETE', endpoint, payload, options, **kwargs)
+
+    # session calls run on the wrapped client, under its auth lock - so they're single-flight with the re-login
+    # RevClient does after a 401 on one of the executor threads
+    async def connect(self):
+        return await self.run(self.client.connect)
+    async def disconnect(self):
+        await self.run(self.client.disconnect)
+    async def extend_session(self):
+        await self.run(self.client.extend_session)
+    async def verify_session(self):
+        return await self.run(self.client.verify_session)
+
+    # extends / does a login only if necessary
+    async def lazy_extend_session(self, refresh_threshold_minutes = 3, verify = True):
+        # fast path - no need to use a thread if the session is fresh
+        if not verify and self.session.seconds_till_expires >= refresh_threshold_minutes * 60:
+            return False
+        return await self.run(self.client.lazy_extend_session, refresh_threshold_minutes, verify)
+
+    @property
+    def token(self):
+        return self.session.token
+
+    @property
+    def seconds_till_expires(self):
+        return self.session.seconds_till_expires
+
+    def _scroll(self, endpoint, totalKey, hitsKey, params = {}, max_results = MAX_INT, prefetch = 0):
+        pages = self._scroll_pages(endpoint, totalKey, hitsKey, params, max_results or MAX_INT)
+        if prefetch > 0:
+            return read_ahead(pages, prefetch)
+        return pages
+
+    async def _scroll_pages(self, endpoint, totalKey, hitsKey, params, max_results):
+        cursor = ScrollCursor(totalKey, hitsKey, params, max_results)
+        while not cursor.done:
+            page = cursor.advance(await self.get(endpoint, cursor.query))
+            if page is None:
+                break
+            yield page
+
+#%%
+class AsyncVideoClient(NamespacedClient):
+    async def status(self, video_id: str) -> Dict:
+        return await self.client.get(f'/api/v2/videos/{video_id}/status')
+
+    async def details(self, video_id: str) -> Dict:
+        return await self.client.get(f'/api/v2/videos/{video_id}/details')
+
+    async def wait_for_status(self, video_ids, target = 'Ready', timeout = None, min_interval = DEFAULT_MIN_POLL_INTERVAL, max_interval = DEFAULT_MAX_POLL_INTERVAL, rate = None, max_workers = DEFAULT_WATCH_WORKERS, on_complete = None, on_change = None, processing_bytes_per_sec = DEFAULT_PROCESSING_BYTES_PER_SEC) -> WaitResult:
+        # the scheduler runs on the thread pool - callbacks are called from there, not the event loop
+        return await self.client.run(self.client.client.video.wait_for_status, video_ids, target, timeout, min_interval, max_interval, rate, max_workers, on_complete, on_change, processing_bytes_per_sec)
+
+    async def update(self, video_id: str, metadata: dict) -> None:
+        await self.client.put(f'/api/v2/videos/{video_id}', metadata)
+
+    async def migrate(self, video_id: str, username = None, when_uploaded = None, when_published = None) -> Dict:
+        params = migrate_params(username, when_uploaded, when_published)
+        await self.client.put(f'/api/v2/videos/{video_id}/migration', json = params)
+
+    async def patch(self, video_id: str, metadata: dict, strict = False) -> None:
+        operations, invalid = patch_operations(metadata, strict)
+
+        if (len(operations) > 0):
+            await self.client.patch(f'/api/v2/videos/{video_id}', json=operations)
+
+        if len(invalid) > 0:
+            return { 'invalid': invalid }
+        else:
+            return {}
+
+    async def upload(self, file, metadata: dict, filename = None, content_type = None, on_progress = None, chunk_size = DEFAULT_CHUNK_SIZE, checkpoint = None, retries = 0):
+        # streaming upload reads the file as it sends, so run the whole thing on the executor
+        return await self.client.run(self.client.client.video.upload, file, metadata, filename, content_type, on_progress, chunk_size, checkpoint, retries)
+
+    async def upload_transcription(self, video_id: str, file, language: str = 'en', filename: str = 'subtitle.srt', content_type: str = 'application/x-subrip'):
+        files, data = transcription_args(file, language, filename, content_type)
+
+        return await self.client.post(f'/api/uploads/transcription-files/{video_id}', files = files, data = data)
+
+    async def download(self, video_id: str, dest, chunk_size = DEFAULT_DOWNLOAD_CHUNK_SIZE, parallel = 1, range_size = DEFAULT_RANGE_SIZE, on_progress = None, retries = 2) -> DownloadResult:
+        # writes to disk as it reads, so run the whole thing on the executor
+        return await self.client.run(self.client.client.video.download, video_id, dest, chunk_size, parallel, range_size, on_progress, retries)
+
+    async def download_thumbnail(self, video_id: str, dest, retries = 2) -> DownloadResult:
+        return await self.client.run(self.client.client.video.download_thumbnail, video_id, dest, retries)
+
+    async def download_transcription(self, video_id: str, transcription_id: str, dest, retries = 2) -> DownloadResult:
+        return await self.client.run(self.client.client.video.download_transcription, video_id, transcription_id, dest, retries)
+
+    async def bulk_download(self, video_ids, dest_dir, max_workers = DEFAULT_DOWNLOAD_WORKERS, parallel = 1, range_size = DEFAULT_RANGE_SIZE, chunk_size = DEFAULT_DOWNLOAD_CHUNK_SIZE, skip_existing = True, ordered = False, on_progress = None) -> list:
+        # returns the list of BulkResults - the job manages its own download threads
+        job = self.client.client.video.bulk_download(video_ids, dest_dir, max_workers, parallel, range_size, chunk_size, skip_existing, ordered, on_progress)
+        return await self.client.run(list, job)
+
+    async def search_stream(self, query: dict = {}, max_results = None, on_page = None, prefetch = 0):
+        pager = self.client._scroll('/api/v2/videos/search', 'totalVideos', 'videos', query, max_results=max_results, prefetch=prefetch)
+
+        async for page in pager:
+            if on_page:
+                on_page(page)
+            for vid in page['items']:
+                yield vid
+
+    async def search(self, query: dict = {}, max_results = None, on_page = None, prefetch = 0):
+        return [ vid async for vid in self.search_stream(query, max_results, on_page, prefetch) ]
@@ -0,0 +1,116 @@
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from .utils import percentile
+
+# keep below the default connection pool size (10) so workers don't wait on connections
+DEFAULT_BULK_WORKERS = 8
+
+#%%
+class BulkResult():
+    __slots__ = ('index', 'key', 'value', 'error', 'elapsed')
+
+    def __init__(self, index, key, value = None, error = None, elapsed = 0):
+        self.index = index
+        self.key = key
+        self.value = value
+        self.error = error
+        self.elapsed = elapsed
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    def __repr__(self):
+        return f'BulkResult(key={self.key!r}, ok={self.ok}, elapsed={self.elapsed:.3f})'
+
+class BulkSummary():
+    def __init__(self, latencies, errors, seconds):
+        latencies = sorted(latencies)
+        self.count = len(latencies)
+        self.errors = errors
+        self.seconds = seconds
+        self.items_per_sec = self.count / seconds if seconds > 0 else 0
+        self.p50 = percentile(latencies, 50)
+        self.p95 = percentile(latencies, 95)
+
+    def as_dict(self):
+        return dict(vars(self))
+
+    def __repr__(self):
+        return f'BulkSummary(count={self.count}, errors={self.errors}, seconds={self.seconds:.2f}, items_per_sec={self.items_per_sec:.1f}, p50={self.p50}, p95={self.p95})'
+
+#%%
+class BulkJob():
+    # runs fn(*args) for each (key, args) in items on a bounded worker pool
+    def __init__(self, fn, items, max_workers = DEFAULT_BULK_WORKERS, ordered = False, on_progress = None, total = None):
+        self.fn = fn
+        self.items = items
+        self.max_workers = max_workers
+        self.ordered = ordered
+        self.on_progress = on_progress
+        self.total = total
+        self.summary = None
+
+    def _run(self, index, key, args):
+        start = time.perf_counter()
+        try:
+            value = self.fn(*args)
+            return BulkResult(index, key, value, None, time.perf_counter() - start)
+        except Exception as err:
+            return BulkResult(index, key, None, err, time.perf_counter() - start)
+
+    def __iter__(self):
+        # never queue more than this many items ahead - keeps memory flat for huge inputs
+        window = self.max_workers * 2
+        items = enumerate(self.items)
+        pending = set()
+        # completed out-of-order results, only used when ordered = True
+        buffered = {}
+        next_index = 0
+        submitted = 0
+        done_count = 0
+        errors = 0
+        latencies = []
+        exhausted = False
+        start = time.perf_counter()
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            while True:
+                while not exhausted and (submitted - next_index if self.ordered else len(pending)) < window:
+                    try:
+                        index, (key, args) = next(items)
+                    except StopIteration:
+                        exhausted = True
+                        break
+                    pending.add(pool.submit(self._run, index, key, args))
+                    submitted += 1
+
+                if not pending:
+                    break
+
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                completed = []
+                for future in done:
+                    result = future.result()
+                    done_count += 1
+                    latencies.append(result.elapsed)
+                    if not result.ok:
+                        errors += 1
+                    if self.on_progress:
+                        self.on_progress(done_count, self.total, result)
+                    completed.append(result)
+
+                if self.ordered:
+                    for result in completed:
+                        buffered[result.index] = result
+                    while next_index in buffered:
+                        yield buffered.pop(next_index)
+                        next_index += 1
+                else:
+                    for result in completed:
+                        yield result
+
+        self.summary = BulkSummary(latencies, errors, time.perf_counter() - start)
+
+    def results(self):
+        return list(self)
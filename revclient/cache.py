@@ -0,0 +1,132 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import urlencode
+
+# path segments that identify a single resource (guids, numeric ids) rather than a sub-resource name
+id_segment_re = re.compile(r'^([0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}|\d+)$')
+
+# search results are scrolled page by page and change underneath, so they're never cached unless ttls says otherwise
+DEFAULT_TTLS = ((r'/search(/|$)', 0),)
+
+#%%
+class CacheEntry():
+    __slots__ = ('path', 'content', 'content_type', 'encoding', 'etag', 'expires', 'size')
+
+    def __init__(self, path, content, content_type, encoding, etag, expires):
+        self.path = path
+        self.content = content
+        self.content_type = content_type
+        self.encoding = encoding
+        self.etag = etag
+        self.expires = expires
+        self.size = len(content)
+
+    @property
+    def is_fresh(self):
+        return time.monotonic() < self.expires
+
+class ResponseCache():
+    # ttls is a list of (regex, seconds) matched against the path - first match wins, 0 means don't cache.
+    # Then DEFAULT_TTLS are checked, and paths that match neither use the default ttl
+    def __init__(self, ttl = 60, ttls = (), max_entries = 1024, max_bytes = None):
+        self.ttl = ttl
+        self.ttls = [ (re.compile(pattern), seconds) for pattern, seconds in list(ttls) + list(DEFAULT_TTLS) ]
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.revalidations = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def ttl_for(self, path):
+        for pattern, seconds in self.ttls:
+            if pattern.search(path):
+                return seconds
+        return self.ttl
+
+    def key(self, path, params = None):
+        if not params:
+            return path
+        return f'{path}?{urlencode(sorted(params.items()), doseq=True)}'
+
+    def lookup(self, key):
+        # returns fresh entries, and stale ones that can be revalidated with an ETag
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry.is_fresh:
+                self.hits += 1
+                self.entries.move_to_end(key)
+                return entry
+            if entry.etag:
+                return entry
+            self._remove(key)
+            self.misses += 1
+            return None
+
+    def revalidated(self, key, entry):
+        # server responded 304 Not Modified - entry is good for another ttl
+        with self.lock:
+            self.revalidations += 1
+            entry.expires = time.monotonic() + self.ttl_for(entry.path)
+            if key in self.entries:
+                self.entries.move_to_end(key)
+
+    def store(self, key, path, resp):
+        ttl = self.ttl_for(path)
+        if ttl <= 0:
+            return
+        entry = CacheEntry(path, resp.content, resp.headers.get('Content-Type'), resp.encoding, resp.headers.get('ETag'), time.monotonic() + ttl)
+        if self.max_bytes and entry.size > self.max_bytes:
+            return
+        with self.lock:
+            if key in self.entries:
+                self._remove(key)
+            self.entries[key] = entry
+            self.bytes += entry.size
+            while len(self.entries) > self.max_entries or (self.max_bytes and self.bytes > self.max_bytes):
+                self._remove(next(iter(self.entries)))
+                self.evictions += 1
+
+    def invalidate(self, path):
+        # a write to /videos/{id} or /videos/{id}/migration drops everything cached under /videos/{id}
+        path = path.rstrip('/')
+        parent, _, last = path.rpartition('/')
+        if not id_segment_re.match(last) and id_segment_re.match(parent.rpartition('/')[2]):
+            path = parent
+        with self.lock:
+            stale = [ key for key, entry in self.entries.items() if entry.path == path or entry.path.startswith(path + '/') ]
+            for key in stale:
+                self._remove(key)
+            self.invalidations += len(stale)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.bytes = 0
+
+    def _remove(self, key):
+        entry = self.entries.pop(key)
+        self.bytes -= entry.size
+
+    @property
+    def stats(self):
+        with self.lock:
+            return {
+                'entries': len(self.entries),
+                'bytes': self.bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'revalidations': self.revalidations,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations
+            }
@@ -2,13 +2,27 @@
 from typing import Generator
 import requests
 from requests import HTTPError
-from urllib.parse import urljoin
+from urllib.parse import urljoin, urlparse
 import re
+import threading
+from json import loads as json_loads
+import time
+import logging
 from datetime import datetime, timezone
-from .utils import parse_iso, format_iso, now_iso, omit
+from .utils import parse_iso, format_iso, now_iso, omit, read_ahead
 from .video import VideoClient
+from .transport import HttpTransport, DEFAULT_POOL_CONNECTIONS, DEFAULT_POOL_MAXSIZE
+from .retry import RetryPolicy, RetryStats
+from .ratelimit import RateLimiter
+from .cache import ResponseCache
+from .jsonstream import iter_array_items
+from .metrics import RequestEvent, HOOK_EVENTS
+
+log = logging.getLogger(__name__)
 
 MAX_INT = (2**31 - 1)
+# read size for incrementally decoded responses
+STREAM_CHUNK_SIZE = 64 * 1024
 
 #%%
 class RevSession():
@@ -97,17 +111,128 @@ class RevSession():
             }
         return None
 
+#%%
+class ScrollCursor():
+    # paging state for scrolled search endpoints, shared by RevClient and AsyncRevClient which only differ in
+    # how they fetch each page: pass cursor.query to the endpoint, then the response to advance()
+    def __init__(self, totalKey, hitsKey, params, max_results):
+        self.totalKey = totalKey
+        self.hitsKey = hitsKey
+        self.query = params.copy()
+        self.max_results = max_results
+        self.total = None
+        self.current = 0
+        self.done = max_results <= 0
+
+    def advance(self, resp):
+        # returns the page, or None if the response was empty
+        if not resp:
+            self.done = True
+            return None
+
+        items = resp.get(self.hitsKey, [])
+
+        scrollId = resp.get('scrollId', None)
+        self.query['scrollId'] = scrollId
+
+        if not self.total:
+            self.total = min(resp.get(self.totalKey, MAX_INT), self.max_results)
+
+        items_left = self.max_results - self.current
+        if len(items) > items_left:
+            items = items[:items_left]
+
+        page = {
+            'items': items,
+            'current': self.current,
+            'total': self.total
+        }
+
+        self.current += len(items)
+        # an empty page ends the scroll too, even if it came with a scrollId
+        self.done = not scrollId or not items or self.current >= self.max_results
+        return page
+
 #%%
 is_text_mime_re = re.compile('text|application/(xml|javascript|x-subrip)')
 class RevClient():
-    def __init__(self, url, apiKey = None, secret = None, username = None, password = None, **kwargs):
+    def __init__(self, url, apiKey = None, secret = None, username = None, password = None, pool_connections = DEFAULT_POOL_CONNECTIONS, pool_maxsize = DEFAULT_POOL_MAXSIZE, pool_block = False, keep_alive = True, retry_policy: RetryPolicy = None, rate_limiter: RateLimiter = None, cache: ResponseCache = None, transport: HttpTransport = None, concurrency = None, compression = None, http2 = False, **kwargs):
         self.url = url
 
         # populate session from input arguments (apiKey etc.)
         self.session = RevSession(**omit(vars(), 'self'))
+        # persistent connection pool, reused across calls
+        # pass a transport to share its connections between clients - it's left open when this client is closed
+        self._owns_transport = transport is None
+        if transport is None and http2:
+            # optional dependency, only imported when asked for
+            from .http2 import Http2Transport
+            transport = Http2Transport(pool_maxsize, keep_alive, compression)
+        self.transport = transport or HttpTransport(pool_connections, pool_maxsize, pool_block, keep_alive, compression)
         self.video = VideoClient(self)
+        # pass RetryPolicy(max_retries=0, reauthenticate=False) to disable retries
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.retry_stats = RetryStats()
+        # optional client-side throttling, applied to every attempt including retries
+        self.rate_limiter = rate_limiter
+        # optional cache of GET responses, invalidated by writes to the same resource
+        self.cache = cache
+        # optional limit on requests in flight, entered around each attempt (see RevClientPool)
+        self.concurrency = concurrency
+        # request instrumentation callbacks, see add_hook
+        self.hooks = { event: [] for event in HOOK_EVENTS }
+
+        # only one thread logs in / extends at a time, the rest wait for its result
+        self._auth_lock = threading.RLock()
+        # incremented after every completed session check, so waiting threads know the work was done for them
+        self._auth_generation = 0
+        self._refresher = None
+        self._refresher_stop = threading.Event()
+
+    def close(self):
+        self.stop_auto_refresh()
+        if self._owns_transport:
+            self.transport.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def add_hook(self, event, fn):
+        # fn(RequestEvent) is called on:
+        #   pre_request - before every attempt is sent
+        #   post_response - once per call, after the final response is decoded
+        #   on_error - connection errors and error statuses
+        #   on_retry - before sleeping to retry a failed attempt
+        if event not in self.hooks:
+            raise TypeError(f'unknown hook event {event}, expected one of {HOOK_EVENTS}')
+        self.hooks[event].append(fn)
+        return fn
+
+    def remove_hook(self, event, fn):
+        if fn in self.hooks.get(event, []):
+            self.hooks[event].remove(fn)
+
+    def _emit(self, event, info):
+        for fn in self.hooks[event]:
+            fn(info)
+
+    def _finish(self, event, decode = None):
+        value = None
+        if decode:
+            start = time.perf_counter()
+            value = decode()
+            event.timings['decode'] = time.perf_counter() - start
+        event.timings['total'] = time.perf_counter() - event.started
+        if event.error is not None:
+            self._emit('on_error', event)
+        if event.status is not None:
+            self._emit('post_response', event)
+        return value
     
-    def request(self, method='GET', endpoint='', payload=None, options={}, payload_only=True, json=None, data=None, files=None, **kwargs):
+    def request(self, method='GET', endpoint='', payload=None, options={}, payload_only=True, json=None, data=None, files=None, retry=True, use_cache=True, **kwargs):
         url = urljoin(self.url, endpoint)
 
         method = method.upper()
@@ -123,8 +248,7 @@ class RevClient():
             del headers['Content-Type']
         
         # add token if not already specified
-        if 'Authorization' not in headers:
-            self.session.add_headers(headers)
+        use_session_auth = 'Authorization' not in headers
 
         if 'Accept' not in headers:
             headers['Accept'] = 'application/json'
@@ -145,33 +269,139 @@ class RevClient():
         if files:
             req_opts['files'] = files
 
-        resp = requests.request(method, url, **req_opts)
+        path = urlparse(url).path
+        event = RequestEvent(method, url, path, headers)
+
+        cache_key = None
+        cached = None
+        if self.cache and use_cache and method == 'GET' and payload_only and not req_opts.get('stream', False):
+            cache_key = self.cache.key(path, req_opts.get('params'))
+            cached = self.cache.lookup(cache_key)
+            if cached and cached.is_fresh:
+                event.status = 200
+                event.cached = True
+                return self._finish(event, lambda: self._decode(cached.content, cached.content_type, cached.encoding, headers))
+            # stale, ask server if it's changed
+            if cached:
+                headers['If-None-Match'] = cached.etag
+
+        # files are read as they're sent, so can't be resent
+        policy = self.retry_policy if retry and not files else None
+        resp = self._send(method, url, req_opts, use_session_auth, policy, event)
+
+        if self.cache and method != 'GET' and resp.ok:
+            self.cache.invalidate(path)
+
+        if cached and resp.status_code == 304:
+            self.cache.revalidated(cache_key, cached)
+            return self._finish(event, lambda: self._decode(cached.content, cached.content_type, cached.encoding, headers))
 
         # if return actual response object
         if not payload_only:
-            return resp
+            return self._finish(event, lambda: resp)
 
         # throw error if not okay
-        resp.raise_for_status()
+        try:
+            resp.raise_for_status()
+        except HTTPError as err:
+            event.error = err
+            self._finish(event)
+            raise
 
         # return stream objects as file-like
         if req_opts.get('stream', False):
-            return resp.raw
+            return self._finish(event, lambda: resp.raw)
+
+        if cache_key:
+            self.cache.store(cache_key, path, resp)
+
+        return self._finish(event, lambda: self._decode(resp.content, resp.headers.get('Content-Type'), resp.encoding, headers))
 
+    def _decode(self, content, content_type, encoding, headers):
         # empty response
-        if len(resp.content) == 0:
+        if len(content) == 0:
             return None
 
         # if no mimetype in response then assume JSON unless otherwise specified
-        content_type = resp.headers.get('Content-Type') or headers.get('Accept') or ''
+        content_type = content_type or headers.get('Accept') or ''
 
         if content_type.startswith('application/json'):
-            return resp.json()
+            return json_loads(content)
 
         if is_text_mime_re.match(content_type):
-            return resp.text()
+            return content.decode(encoding or 'utf-8', errors='replace')
+
+        return content
+    def _send(self, method, url, req_opts, use_session_auth, policy, event):
+        headers = req_opts['headers']
+        attempt = 0
+        reauthenticated = False
+        while True:
+            event.attempt = attempt
+            if self.rate_limiter:
+                start = time.perf_counter()
+                self.rate_limiter.acquire(method, event.path)
+                event.timings['rate_limit'] += time.perf_counter() - start
+            token = self.session.token
+            if use_session_auth:
+                headers.pop('Authorization', None)
+                self.session.add_headers(headers)
+            self._emit('pre_request', event)
+
+            try:
+                if self.concurrency:
+                    start = time.perf_counter()
+                    with self.concurrency:
+                        event.timings['queue'] += time.perf_counter() - start
+                        resp = self.transport.request(method, url, **req_opts)
+                else:
+                    resp = self.transport.request(method, url, **req_opts)
+            except (requests.ConnectionError, requests.Timeout) as err:
+                event.error = err
+                if not (policy and policy.should_retry(method, attempt)):
+                    self._finish(event)
+                    raise
+                delay = policy.backoff(attempt)
+                self._retry(event, delay)
+                attempt += 1
+                continue
+
+            event.response(resp)
+            status = resp.status_code
+            if status == 401 and policy and policy.reauthenticate and use_session_auth and not reauthenticated:
+                reauthenticated = True
+                if self._reauthenticate(token):
+                    resp.close()
+                    continue
+            elif policy and policy.should_retry(method, attempt, status):
+                delay = policy.backoff(attempt, resp)
+                resp.close()
+                self._retry(event, delay, throttled=(status == 429))
+                attempt += 1
+                continue
+            return resp
+
+    def _retry(self, event, delay, throttled = False):
+        event.retry_delay = delay
+        self.retry_stats.record_retry(delay, throttled=throttled)
+        self._emit('on_retry', event)
+        time.sleep(delay)
+        event.timings['backoff'] += delay
+        event.error = None
+
+    def _reauthenticate(self, stale_token):
+        with self._auth_lock:
+            # another thread already logged in again
+            if self.session.token and self.session.token != stale_token:
+                return True
+            try:
+                self.connect()
+            except (AssertionError, HTTPError):
+                # no credentials, or login itself failed - return the original 401
+                return False
+            self.retry_stats.record_reauthentication()
+            return True
 
-        return resp.content
     def get(self, endpoint='', payload=None, options={}, **kwargs):
         return self.request('GET', endpoint, payload, options, **kwargs)
     def post(self, endpoint='', payload=None, options={}, **kwargs):
@@ -184,6 +414,11 @@ class RevClient():
         return self.request('DELETE', endpoint, payload, options, **kwargs)
     
     def connect(self):
+        with self._auth_lock:
+            response = self._connect()
+            self._auth_generation += 1
+            return response
+    def _connect(self):
         # make sure the authorization header isn't added
         self.session.clear()
 
@@ -194,7 +429,7 @@ class RevClient():
         
         for attempt in range(max_attempts):
             try:
-                response = self.request(**req_args)
+                response = self.request(**req_args, retry=False)
                 # includes token, expiration and id
                 self.session.update(response)
                 return response
@@ -213,38 +448,52 @@ class RevClient():
         req_args = self.session.logoff_request()
 
         try:
-            response = self.request(**req_args)
+            response = self.request(**req_args, retry=False)
         except HTTPError as err:
-            # TODO log error correctly
-            print(f'Error in logging off, ignoring: {err}')
+            log.warning('Error in logging off, ignoring: %s', err)
         finally:
             self.session.clear()
     def extend_session(self):
-        req_args = self.session.extend_request()
+        with self._auth_lock:
+            req_args = self.session.extend_request()
 
-        response = self.request(**req_args)
-        # update expires time
-        self.session.update(response)
+            response = self.request(**req_args, retry=False)
+            # update expires time
+            self.session.update(response)
+            self._auth_generation += 1
     def verify_session(self):
-        response = self.get('/api/v2/user/session', payload_only=False)
+        response = self.get('/api/v2/user/session', payload_only=False, retry=False)
         # ends up with a error status code if not valid session
         return response.ok
 
     # extends / does a login only if necessary
     def lazy_extend_session(self, refresh_threshold_minutes = 3, verify = True):
+        # fast path - no need to wait on other threads if the session is fresh
+        if not verify and self.session.seconds_till_expires >= refresh_threshold_minutes * 60:
+            return False
+
+        generation = self._auth_generation
+        with self._auth_lock:
+            # another thread already checked/refreshed the session while this one was waiting
+            if generation != self._auth_generation:
+                return False
+            did_refresh = self._lazy_extend_session(refresh_threshold_minutes, verify)
+            self._auth_generation += 1
+            return did_refresh
+
+    def _lazy_extend_session(self, refresh_threshold_minutes, verify):
         time_till_expires = self.session.seconds_till_expires
 
         do_login = False
         did_refresh = False
         if time_till_expires < 0:
             do_login = True
-        elif time_till_expires < refresh_threshold_minutes * 60000:
+        elif time_till_expires < refresh_threshold_minutes * 60:
             try:
                 self.extend_session()
                 did_refresh = True
             except Exception as err:
-                # TODO log error correctly
-                print(f'Error extending session - re-logging in {err}')
+                log.warning('Error extending session - re-logging in: %s', err)
                 do_login = True
         elif verify:
             # need to login if verify fails
@@ -255,6 +504,32 @@ class RevClient():
             did_refresh = True
         return did_refresh
     
+    # keep the session alive on a background thread, so request threads don't have to wait on extend calls
+    def start_auto_refresh(self, refresh_threshold_minutes = 3, max_interval_seconds = 60):
+        if self._refresher and self._refresher.is_alive():
+            return
+        self._refresher_stop.clear()
+
+        def refresh():
+            while True:
+                # wake up when the session is about to hit the threshold, checking at least every max_interval_seconds
+                wait_seconds = self.session.seconds_till_expires - refresh_threshold_minutes * 60
+                if self._refresher_stop.wait(min(max(wait_seconds, 1), max_interval_seconds)):
+                    return
+                try:
+                    self.lazy_extend_session(refresh_threshold_minutes, verify=False)
+                except Exception as err:
+                    log.warning('Error refreshing session in background, retrying: %s', err)
+
+        self._refresher = threading.Thread(target=refresh, name='revclient-session-refresh', daemon=True)
+        self._refresher.start()
+
+    def stop_auto_refresh(self):
+        self._refresher_stop.set()
+        if self._refresher and self._refresher is not threading.current_thread():
+            self._refresher.join()
+        self._refresher = None
+
     @property
     def token(self):
         return self.session.token
@@ -263,38 +538,48 @@ class RevClient():
     def seconds_till_expires(self):
         return self.session.seconds_till_expires
 
-    def _scroll(self, endpoint, totalKey, hitsKey, params = {}, max_results = MAX_INT):
+    def _scroll(self, endpoint, totalKey, hitsKey, params = {}, max_results = MAX_INT, prefetch = 0):
+        pages = self._scroll_pages(endpoint, totalKey, hitsKey, params, max_results or MAX_INT)
+        # fetch up to prefetch pages in the background while the caller processes the current one
+        if prefetch > 0:
+            return read_ahead(pages, prefetch)
+        return pages
+
+    # like _scroll, but yields individual items as they're decoded from the response instead of whole pages
+    def _scroll_items(self, endpoint, totalKey, hitsKey, params = {}, max_results = MAX_INT, on_page = None, chunk_size = STREAM_CHUNK_SIZE):
         query = params.copy()
-        
+        max_results = max_results or MAX_INT
+
         total = None
         current = 0
         while current < max_results:
-            resp = self.get(endpoint, query)
-            if not resp:
-                break
+            resp = self.get(endpoint, query, options={ 'stream': True }, payload_only=False)
+            meta = {}
+            page_start = current
+            try:
+                resp.raise_for_status()
+                for item in iter_array_items(resp.iter_content(chunk_size), hitsKey, meta):
+                    yield item
+                    current += 1
+                    if current >= max_results:
+                        break
+            finally:
+                resp.close()
 
-            items = resp.get(hitsKey, [])
-            
-            scrollId = resp.get('scrollId', None)
-            query['scrollId'] = scrollId
-            
             if not total:
-                total = min(resp.get(totalKey, MAX_INT), max_results)
-            
-            items_left = max_results - current
-            if len(items) > items_left:
-                items = items[:items_left]
-
-            yield {
-                'items': items,
-                'current': current,
-                'total': total
-            }
-
-            current += len(items)
+                total = min(meta.get(totalKey, MAX_INT), max_results)
+            if on_page:
+                on_page({ 'current': page_start, 'total': total, 'count': current - page_start })
 
-            if not scrollId:
+            scrollId = meta.get('scrollId', None)
+            query['scrollId'] = scrollId
+            if not scrollId or current == page_start:
                 break
 
-
-
+    def _scroll_pages(self, endpoint, totalKey, hitsKey, params, max_results):
+        cursor = ScrollCursor(totalKey, hitsKey, params, max_results)
+        while not cursor.done:
+            page = cursor.advance(self.get(endpoint, cursor.query))
+            if page is None:
+                break
+            yield page
@@ -0,0 +1,255 @@
+import mimetypes
+import json
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING
+import requests
+from .utils import write_json
+
+if TYPE_CHECKING:
+    from .client import RevClient
+
+MB = 1024 * 1024
+DEFAULT_DOWNLOAD_CHUNK_SIZE = MB
+# files are split into ranges of this size for parallel downloads
+DEFAULT_RANGE_SIZE = 64 * MB
+DEFAULT_DOWNLOAD_WORKERS = 4
+
+content_range_re = re.compile(r'bytes (\d+)-(\d+)/(\d+|\*)')
+filename_re = re.compile(r'filename\*?=(?:UTF-8\'\')?"?([^";]+)"?', re.I)
+
+# mid-download network failures that can be resumed from the last byte written
+RESUMABLE_ERRORS = (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError)
+
+def _extension(resp):
+    match = filename_re.search(resp.headers.get('Content-Disposition', ''))
+    if match:
+        ext = os.path.splitext(os.path.basename(match.group(1)))[1]
+        if ext:
+            return ext
+    content_type = resp.headers.get('Content-Type', '').split(';')[0].strip()
+    return mimetypes.guess_extension(content_type) or '' if content_type else ''
+
+#%%
+class DownloadResult():
+    def __init__(self, path, size = 0, seconds = 0, resumed = 0, ranges = 1, attempts = 1, skipped = False):
+        self.path = path
+        self.size = size
+        self.seconds = seconds
+        # bytes already on disk from an earlier attempt
+        self.resumed = resumed
+        self.ranges = ranges
+        self.attempts = attempts
+        self.skipped = skipped
+
+    @property
+    def mb_per_sec(self):
+        return (self.size - self.resumed) / MB / self.seconds if self.seconds > 0 and not self.skipped else 0
+
+    def __repr__(self):
+        return f'DownloadResult(path={self.path!r}, size={self.size}, resumed={self.resumed}, ranges={self.ranges}, skipped={self.skipped}, seconds={self.seconds:.2f})'
+
+class FileDownload():
+    # streams endpoint to disk through a .part file, with a .part.json sidecar describing what's been written so
+    # an interrupted download resumes with a Range request. dest can be a file path, or a directory to save
+    # {name}{extension} to. parallel > 1 splits large files into range_size pieces downloaded concurrently
+    def __init__(self, client: 'RevClient', endpoint, dest, name = 'download', chunk_size = DEFAULT_DOWNLOAD_CHUNK_SIZE, parallel = 1, range_size = DEFAULT_RANGE_SIZE, on_progress = None, retries = 2):
+        self.client = client
+        self.endpoint = endpoint
+        self.chunk_size = chunk_size
+        self.parallel = parallel
+        self.range_size = range_size
+        self.on_progress = on_progress
+        self.retries = retries
+
+        if os.path.isdir(dest):
+            self.directory = dest
+            self.dest = None
+            self.part = os.path.join(dest, f'{name}.part')
+        else:
+            self.directory = None
+            self.dest = dest
+            self.part = f'{dest}.part'
+        self.name = name
+        self.state_path = f'{self.part}.json'
+        self.lock = threading.Lock()
+        self.received = 0
+        self.total = None
+        self.started = None
+
+    def run(self) -> DownloadResult:
+        self.started = time.perf_counter()
+        state = self._load_state()
+        resumed = (sum(end - start + 1 for start, end in state['done']) if 'done' in state else os.path.getsize(self.part)) if state else 0
+
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                path, size, ranges = self._download()
+                break
+            except RESUMABLE_ERRORS:
+                if attempt > self.retries:
+                    raise
+                time.sleep(min(2 ** attempt, 30))
+
+        return DownloadResult(path, size, time.perf_counter() - self.started, resumed, ranges, attempt)
+
+    def _load_state(self):
+        if not (os.path.exists(self.part) and os.path.exists(self.state_path)):
+            return {}
+        with open(self.state_path, 'r') as fh:
+            state = json.load(fh)
+        return state if state.get('endpoint') == self.endpoint else {}
+
+    def _save_state(self, state):
+        write_json(self.state_path, dict(state, endpoint=self.endpoint))
+
+    def _request(self, headers):
+        headers = dict(headers, Accept='*/*')
+        # no Content-Type on GET
+        headers['Content-Type'] = ''
+        return self.client.request('GET', self.endpoint, options={ 'headers': headers, 'stream': True }, payload_only=False, use_cache=False)
+
+    def _progress(self, count):
+        with self.lock:
+            self.received += count
+            received = self.received
+        if self.on_progress:
+            self.on_progress(received, self.total, time.perf_counter() - self.started)
+
+    def _download(self):
+        state = self._load_state()
+        if 'done' in state:
+            # resume a parallel download - If-Range on each piece catches the file changing in between
+            return self._download_ranges(state)
+
+        offset = os.path.getsize(self.part) if state else 0
+        headers = {}
+        if offset:
+            headers['Range'] = f'bytes={offset}-'
+            if state.get('validator'):
+                headers['If-Range'] = state['validator']
+        elif self.parallel > 1:
+            # ask for the first piece - a 206 response says ranges are supported, and how big the file is
+            headers['Range'] = f'bytes=0-{self.range_size - 1}'
+
+        resp = self._request(headers)
+        try:
+            if resp.status_code == 416 and offset and offset == state.get('size'):
+                # everything was already written before the last attempt stopped
+                return self._complete(state['path']), offset, 1
+            resp.raise_for_status()
+
+            if resp.status_code == 206:
+                match = content_range_re.match(resp.headers.get('Content-Range', ''))
+                if not match or int(match.group(1)) != offset:
+                    raise requests.HTTPError(f'Unexpected Content-Range {resp.headers.get("Content-Range")!r} for {self.endpoint}', response=resp)
+                total = int(match.group(3)) if match.group(3) != '*' else None
+            else:
+                # full body - the server ignored Range, or the file changed since the last attempt
+                offset = 0
+                total = int(resp.headers['Content-Length']) if 'Content-Length' in resp.headers else None
+
+            state = {
+                'size': total,
+                'validator': resp.headers.get('ETag') or resp.headers.get('Last-Modified'),
+                'path': self.dest or state.get('path') or os.path.join(self.directory, self.name + _extension(resp))
+            }
+            self.total = total
+            self.received = offset
+
+            if resp.status_code == 206 and self.parallel > 1 and total and total > self.range_size:
+                state['done'] = []
+                # the rest of the file is fetched alongside this response
+                first, resp = resp, None
+                return self._download_ranges(state, first)
+
+            self._save_state(state)
+            with open(self.part, 'r+b' if offset else 'wb') as fh:
+                fh.seek(offset)
+                fh.truncate()
+                for chunk in resp.iter_content(self.chunk_size):
+                    fh.write(chunk)
+                    self._progress(len(chunk))
+        finally:
+            if resp is not None:
+                resp.close()
+
+        if total is not None and self.received != total:
+            raise requests.ConnectionError(f'Download of {self.endpoint} ended after {self.received} of {total} bytes')
+        return self._complete(state['path']), self.received, 1
+
+    def _download_ranges(self, state, first = None):
+        total = state['size']
+        self.total = total
+        done = [ tuple(piece) for piece in state['done'] ]
+        finished = set(start for start, end in done)
+        self.received = sum(end - start + 1 for start, end in done)
+
+        if not done or not os.path.exists(self.part):
+            done = []
+            self.received = 0
+            with open(self.part, 'wb') as fh:
+                fh.truncate(total)
+        self._save_state(dict(state, done=done))
+
+        pieces = [ (start, min(start + self.range_size, total) - 1) for start in range(0, total, self.range_size) if start not in finished ]
+        changed = []
+
+        def fetch(start, end, resp = None):
+            if resp is None:
+                headers = { 'Range': f'bytes={start}-{end}' }
+                if state.get('validator'):
+                    headers['If-Range'] = state['validator']
+                resp = self._request(headers)
+            written = 0
+            try:
+                resp.raise_for_status()
+                if resp.status_code != 206:
+                    # whole file sent instead of the range - it changed since the download started
+                    changed.append(start)
+                    raise requests.HTTPError(f'{self.endpoint} changed during download, restart it', response=resp)
+                with open(self.part, 'r+b') as fh:
+                    fh.seek(start)
+                    for chunk in resp.iter_content(self.chunk_size):
+                        fh.write(chunk)
+                        written += len(chunk)
+                        self._progress(len(chunk))
+            finally:
+                resp.close()
+            if written != end - start + 1:
+                # partial piece is downloaded again in full on the next attempt
+                self._progress(-written)
+                raise requests.ConnectionError(f'Range {start}-{end} of {self.endpoint} ended after {written} bytes')
+            with self.lock:
+                done.append((start, end))
+                self._save_state(dict(state, done=done))
+
+        try:
+            with ThreadPoolExecutor(max_workers=self.parallel) as pool:
+                futures = [ pool.submit(fetch, start, end, first if first and start == 0 else None) for start, end in pieces ]
+                try:
+                    for future in futures:
+                        future.result()
+                except Exception:
+                    for future in futures:
+                        future.cancel()
+                    raise
+        finally:
+            if first:
+                first.close()
+            # pieces already written are from the old version, so start over next time
+            if changed and os.path.exists(self.state_path):
+                os.remove(self.state_path)
+
+        return self._complete(state['path']), total, len(pieces)
+
+    def _complete(self, path):
+        os.replace(self.part, path)
+        if os.path.exists(self.state_path):
+            os.remove(self.state_path)
+        return path
@@ -0,0 +1,195 @@
+import asyncio
+import io
+import threading
+import time
+from datetime import timedelta
+import requests
+from requests.structures import CaseInsensitiveDict
+from .transport import TransferStats, ACCEPT_ENCODINGS, COMPRESSIONS, DEFAULT_COMPRESS_MIN_BYTES, DEFAULT_POOL_MAXSIZE, brotli, decompress, encode_body
+
+# seconds to wait for a connection / response before giving up
+DEFAULT_HTTP2_TIMEOUT = 60
+
+class _StreamReader():
+    # file-like view of a streamed httpx response, used as resp.raw so iter_content and incremental decoding work
+    def __init__(self, transport: 'Http2Transport', response):
+        self.transport = transport
+        self.response = response
+        self.chunks = response.aiter_bytes()
+        self.buffer = bytearray()
+        self.done = False
+
+    def _next_chunk(self):
+        try:
+            return self.transport._run(self.chunks.__anext__())
+        except StopAsyncIteration:
+            self.done = True
+            return None
+
+    def read(self, amount = None):
+        while not self.done and (amount is None or len(self.buffer) < amount):
+            chunk = self._next_chunk()
+            if chunk is not None:
+                self.buffer += chunk
+        amount = len(self.buffer) if amount is None else min(amount, len(self.buffer))
+        data = bytes(self.buffer[:amount])
+        del self.buffer[:amount]
+        return data
+
+    def tell(self):
+        # bytes off the wire so far
+        return self.response.num_bytes_downloaded
+
+    def close(self):
+        if not self.response.is_closed:
+            self.transport._run(self.response.aclose())
+
+#%%
+class Http2Transport():
+    # sends requests with httpx over HTTP/2, so concurrent requests to a host are multiplexed over one connection
+    # instead of needing a connection each. Needs the optional dependency: pip install revclient[http2]
+    # http1 = False talks HTTP/2 to plain http:// urls too (prior knowledge), otherwise that's only negotiated for https.
+    # Connections are driven by an event loop on a thread of its own - calling threads wait for their response
+    def __init__(self, max_connections = DEFAULT_POOL_MAXSIZE, keep_alive = True, compression = None, compress_min_bytes = DEFAULT_COMPRESS_MIN_BYTES, http1 = True, timeout = DEFAULT_HTTP2_TIMEOUT):
+        try:
+            import httpx
+            # httpx only speaks HTTP/2 with h2 installed
+            import h2
+        except ImportError:
+            raise ImportError('Http2Transport needs httpx with HTTP/2 support: pip install revclient[http2]')
+        if compression not in (None,) + COMPRESSIONS:
+            raise TypeError(f'compression must be one of {COMPRESSIONS}')
+        if compression == 'br' and brotli is None:
+            raise ImportError('br compression needs the brotli package: pip install revclient[brotli]')
+        self.httpx = httpx
+        self.compression = compression
+        self.compress_min_bytes = compress_min_bytes
+        self.transfer_stats = TransferStats()
+        # new connections opened, to compare against the requests sent
+        self.connections = 0
+
+        # httpx's threaded HTTP/2 connections can hand two threads the same stream, so all requests go through one loop
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name='revclient-http2', daemon=True)
+        self.thread.start()
+
+        limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections if keep_alive else 0)
+        self.http = httpx.AsyncClient(http1=http1, http2=True, limits=limits, timeout=timeout)
+        self.http.headers['Accept-Encoding'] = ACCEPT_ENCODINGS[compression] if compression else 'gzip, deflate'
+
+    def _run(self, coroutine):
+        # runs coroutine on the transport's event loop, and waits for its result
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+
+    async def _upload(self, chunks):
+        # streamed request bodies are read on another thread, so a slow file doesn't hold up other streams
+        chunks = iter(chunks)
+        while True:
+            chunk = await self.loop.run_in_executor(None, next, chunks, None)
+            if chunk is None:
+                break
+            # chunks can be views into a reused buffer (MultipartEncoder), so copy each before it's queued
+            yield bytes(chunk)
+
+    async def _send(self, request, stream, follow_redirects):
+        start = time.perf_counter()
+        response = await self.http.send(request, stream=True, follow_redirects=follow_redirects)
+        headers_at = time.perf_counter()
+        wire_body = None
+        if not stream:
+            wire_body = b''.join([ chunk async for chunk in response.aiter_raw() ])
+            await response.aclose()
+        return response, start, headers_at, wire_body, time.perf_counter()
+
+    def request(self, method, url, **kwargs):
+        timings = { 'connect': 0.0, 'tls': 0.0, 'server': 0.0, 'download': 0.0, 'decompress': 0.0 }
+        stream = kwargs.get('stream', False)
+        if self.compression:
+            kwargs = encode_body(kwargs, self.compression, self.compress_min_bytes, self.transfer_stats)
+
+        started = {}
+        async def trace(name, info):
+            # httpcore calls this as the connection is set up
+            phase = 'connect' if name.startswith('connection.connect_tcp') else 'tls' if name.startswith('connection.start_tls') else None
+            if phase and name.endswith('.started'):
+                started[phase] = time.perf_counter()
+            elif phase and name.endswith('.complete') and phase in started:
+                timings[phase] += time.perf_counter() - started[phase]
+                if phase == 'connect':
+                    # only ever called on the event loop thread
+                    self.connections += 1
+
+        data = kwargs.get('data')
+        headers = kwargs.get('headers')
+        # request bodies that aren't form fields go as content
+        content = data if data is not None and not isinstance(data, dict) else None
+        if content is not None and not isinstance(content, (str, bytes)):
+            if hasattr(content, '__len__'):
+                # streamed upload of known size, sent with Content-Length rather than chunked
+                headers = dict(headers or {}, **{ 'Content-Length': str(len(content)) })
+            content = self._upload(content)
+        try:
+            request = self.http.build_request(
+                method, url,
+                params=kwargs.get('params'),
+                headers=headers,
+                json=kwargs.get('json'),
+                content=content,
+                data=data if isinstance(data, dict) else None,
+                files=kwargs.get('files'),
+                timeout=kwargs.get('timeout', self.http.timeout),
+                extensions={ 'trace': trace }
+            )
+            response, start, headers_at, wire_body, downloaded = self._run(self._send(request, stream, kwargs.get('allow_redirects', True)))
+        except self.httpx.TimeoutException as err:
+            raise requests.Timeout(err)
+        except self.httpx.TransportError as err:
+            raise requests.ConnectionError(err)
+
+        resp = requests.Response()
+        resp.status_code = response.status_code
+        resp.headers = CaseInsensitiveDict(response.headers)
+        resp.url = str(response.url)
+        resp.reason = response.reason_phrase
+        resp.encoding = requests.utils.get_encoding_from_headers(resp.headers)
+        resp.elapsed = timedelta(seconds=headers_at - start)
+        # 'HTTP/2' or 'HTTP/1.1'
+        resp.http_version = response.http_version
+
+        prepared = requests.PreparedRequest()
+        prepared.method = method
+        prepared.url = str(request.url)
+        prepared.headers = CaseInsensitiveDict(request.headers)
+        resp.request = prepared
+
+        if stream:
+            resp.raw = _StreamReader(self, response)
+        else:
+            decompress_start = time.perf_counter()
+            resp._content = decompress(wire_body, resp.headers.get('Content-Encoding'))
+            resp._content_consumed = True
+            timings['decompress'] = time.perf_counter() - decompress_start
+            timings['download'] = downloaded - headers_at
+            # tell() is the compressed size, as for urllib3 responses
+            resp.raw = io.BytesIO(wire_body)
+            resp.raw.seek(0, io.SEEK_END)
+            if self.compression:
+                self.transfer_stats.record_response(len(resp._content), len(wire_body), timings['decompress'])
+
+        timings['server'] = max(headers_at - start - timings['connect'] - timings['tls'], 0.0)
+        resp.timings = timings
+        return resp
+
+    def close(self):
+        if self.loop.is_closed():
+            return
+        self._run(self.http.aclose())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,134 @@
+import codecs
+import json
+
+_decoder = json.JSONDecoder()
+_whitespace = ' \t\n\r'
+_delimiters = _whitespace + ',:]}'
+
+#%%
+class _Reader():
+    # text buffer over an iterable of utf-8 byte chunks, decoding one JSON value at a time
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.utf8 = codecs.getincrementaldecoder('utf-8')()
+        self.buf = ''
+        self.pos = 0
+        self.done = False
+
+    def fill(self):
+        if self.done:
+            return False
+        try:
+            text = self.utf8.decode(next(self.chunks))
+        except StopIteration:
+            text = self.utf8.decode(b'', final=True)
+            self.done = True
+        # drop already-parsed text so the buffer only holds the value being decoded
+        self.buf = self.buf[self.pos:] + text
+        self.pos = 0
+        return True
+
+    def peek(self):
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in _whitespace:
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self.fill():
+                return ''
+
+    def next_char(self, expected):
+        char = self.peek()
+        if char not in expected:
+            raise ValueError(f'Invalid JSON - expected one of {expected!r} at offset {self.pos}, found {char!r}')
+        self.pos += 1
+        return char
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                obj, end = _decoder.raw_decode(self.buf, self.pos)
+                # only accept once the value is followed by a delimiter - a number cut off
+                # mid-chunk (e.g. '-0' of '-0.5') would otherwise decode successfully
+                if (end < len(self.buf) and self.buf[end] in _delimiters) or self.done:
+                    self.pos = end
+                    return obj
+            except ValueError:
+                if self.done:
+                    raise
+            self.fill()
+
+def iter_array_items(chunks, array_key, meta = None):
+    # yields each element of the top-level array_key of a JSON object as soon as it's decoded.
+    # All other top-level keys are added to meta
+    reader = _Reader(chunks)
+    if meta is None:
+        meta = {}
+    # empty body
+    if not reader.peek():
+        return
+    reader.next_char('{')
+    if reader.peek() == '}':
+        return
+    while True:
+        key = reader.value()
+        reader.next_char(':')
+        if key == array_key and reader.peek() == '[':
+            reader.next_char('[')
+            if reader.peek() == ']':
+                reader.next_char(']')
+            else:
+                while True:
+                    yield reader.value()
+                    if reader.next_char(',]') == ']':
+                        break
+        else:
+            meta[key] = reader.value()
+        if reader.next_char(',}') == '}':
+            return
+
+#%%
+class Record():
+    # compact fixed-field record with read-only dict style access
+    __slots__ = ()
+
+    @classmethod
+    def from_dict(cls, values):
+        record = cls.__new__(cls)
+        for key in cls.__slots__:
+            if key in values:
+                setattr(record, key, values[key])
+        return record
+
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key)
+
+    def get(self, key, default = None):
+        return getattr(self, key, default)
+
+    def keys(self):
+        return [ key for key in self.__slots__ if hasattr(self, key) ]
+
+    def as_dict(self):
+        return { key: getattr(self, key) for key in self.keys() }
+
+    def __repr__(self):
+        return f'{type(self).__name__}({self.as_dict()})'
+
+def record_type(fields, name = 'VideoRecord'):
+    return type(name, (Record,), { '__slots__': tuple(fields) })
+
+def projection(fields = None, compact = False):
+    # returns a function that trims decoded items down to fields, or None if items should be left as is
+    if not fields:
+        if compact:
+            raise TypeError('compact records require a list of fields')
+        return None
+    if compact:
+        return record_type(fields).from_dict
+    fields = tuple(fields)
+    return lambda item: { key: item[key] for key in fields if key in item }
@@ -0,0 +1,252 @@
+import bisect
+import threading
+import time
+from collections import deque
+from functools import lru_cache
+from .cache import id_segment_re
+from .utils import percentile
+
+# hook events RevClient.request emits, see RevClient.add_hook
+HOOK_EVENTS = ('pre_request', 'post_response', 'on_error', 'on_retry')
+
+# latency histogram buckets, in seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# recent durations kept per endpoint for p50/p95/p99
+DEFAULT_SAMPLE_SIZE = 1024
+
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+OPENMETRICS_CONTENT_TYPE = 'application/openmetrics-text; version=1.0.0; charset=utf-8'
+
+# segments following these are identifiers even when they don't look like one (api keys)
+key_parents = ('tokens', 'extend-session-timeout')
+
+@lru_cache(maxsize=4096)
+def endpoint_template(path):
+    # /api/v2/videos/3fa85f64-5717-4562-b3fc-2c963f66afa6/details -> /api/v2/videos/{id}/details
+    segments = path.split('?', 1)[0].split('/')
+    for index, segment in enumerate(segments):
+        if id_segment_re.match(segment):
+            segments[index] = '{id}'
+        elif segment and index > 0 and segments[index - 1] in key_parents:
+            segments[index] = '{key}'
+    return '/'.join(segments)
+
+#%%
+class RequestEvent():
+    # passed to every hook. timings (seconds) has connect, tls, server, download, decompress and decode for the last attempt,
+    # rate_limit, queue and backoff summed over all attempts, and total for the whole call including retries
+    __slots__ = ('method', 'url', 'path', 'template', 'headers', 'attempt', 'status', 'bytes_sent', 'bytes_received', 'timings', 'error', 'retry_delay', 'cached', 'started')
+
+    def __init__(self, method, url, path, headers):
+        self.method = method
+        self.url = url
+        self.path = path
+        self.template = endpoint_template(path)
+        # request headers - pre_request hooks can add to them
+        self.headers = headers
+        self.attempt = 0
+        self.status = None
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.timings = { 'connect': 0.0, 'tls': 0.0, 'server': 0.0, 'download': 0.0, 'decompress': 0.0, 'decode': 0.0, 'rate_limit': 0.0, 'queue': 0.0, 'backoff': 0.0, 'total': 0.0 }
+        self.error = None
+        self.retry_delay = None
+        # True when answered from the response cache without calling Rev
+        self.cached = False
+        self.started = time.perf_counter()
+
+    def response(self, resp):
+        self.status = resp.status_code
+        self.timings.update(getattr(resp, 'timings', None) or {})
+        self.bytes_sent = int(resp.request.headers.get('Content-Length') or 0) if resp.request is not None else 0
+        # bytes read off the wire (compressed size) - only known up front for streamed responses
+        raw_bytes = resp.raw.tell() if hasattr(resp.raw, 'tell') else 0
+        self.bytes_received = raw_bytes or int(resp.headers.get('Content-Length') or 0)
+
+    @property
+    def duration(self):
+        return self.timings['total']
+
+    def __repr__(self):
+        return f'RequestEvent({self.method} {self.template} status={self.status} attempt={self.attempt} total={self.timings["total"]:.3f}s)'
+
+#%%
+class EndpointStats():
+    __slots__ = ('method', 'template', 'buckets', 'bucket_counts', 'count', 'sum', 'samples', 'statuses', 'retries', 'bytes_sent', 'bytes_received', 'phases')
+
+    def __init__(self, method, template, buckets, sample_size):
+        self.method = method
+        self.template = template
+        self.buckets = buckets
+        # non-cumulative, last slot is +Inf
+        self.bucket_counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.samples = deque(maxlen=sample_size)
+        self.statuses = {}
+        self.retries = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.phases = {}
+
+    def add(self, event):
+        duration = event.timings['total']
+        self.bucket_counts[bisect.bisect_left(self.buckets, duration)] += 1
+        self.count += 1
+        self.sum += duration
+        self.samples.append(duration)
+        status = str(event.status) if event.status is not None else 'error'
+        self.statuses[status] = self.statuses.get(status, 0) + 1
+        self.bytes_sent += event.bytes_sent
+        self.bytes_received += event.bytes_received
+        for phase, seconds in event.timings.items():
+            if phase != 'total':
+                self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+
+    @property
+    def errors(self):
+        return sum(count for status, count in self.statuses.items() if status == 'error' or int(status) >= 400)
+
+    def percentiles(self, pcts = (50, 95, 99)):
+        values = sorted(self.samples)
+        return { f'p{pct}': percentile(values, pct) for pct in pcts }
+
+    def as_dict(self):
+        return {
+            'method': self.method,
+            'endpoint': self.template,
+            'count': self.count,
+            'errors': self.errors,
+            'retries': self.retries,
+            'mean': self.sum / self.count if self.count else 0.0,
+            **self.percentiles(),
+            'bytesSent': self.bytes_sent,
+            'bytesReceived': self.bytes_received,
+            'phases': { phase: seconds / self.count for phase, seconds in self.phases.items() } if self.count else {}
+        }
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _labels(**labels):
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + '}'
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class MetricsCollector():
+    # in-memory latency histograms per (method, endpoint template), fed by RevClient hooks:
+    #   metrics = MetricsCollector().attach(rev)
+    def __init__(self, buckets = DEFAULT_BUCKETS, sample_size = DEFAULT_SAMPLE_SIZE, prefix = 'revclient', include_cached = False):
+        self.buckets = tuple(sorted(buckets))
+        self.sample_size = sample_size
+        self.prefix = prefix
+        # cache hits skip the network, so by default they're left out of latency figures
+        self.include_cached = include_cached
+        self.endpoints = {}
+        self.lock = threading.Lock()
+
+    def attach(self, client):
+        client.add_hook('post_response', self.record)
+        client.add_hook('on_error', self.record_error)
+        client.add_hook('on_retry', self.record_retry)
+        return self
+
+    def detach(self, client):
+        client.remove_hook('post_response', self.record)
+        client.remove_hook('on_error', self.record_error)
+        client.remove_hook('on_retry', self.record_retry)
+
+    def _stats(self, event):
+        key = (event.method, event.template)
+        stats = self.endpoints.get(key)
+        if stats is None:
+            stats = self.endpoints[key] = EndpointStats(event.method, event.template, self.buckets, self.sample_size)
+        return stats
+
+    def record(self, event):
+        if event.cached and not self.include_cached:
+            return
+        with self.lock:
+            self._stats(event).add(event)
+
+    def record_error(self, event):
+        # error statuses are already counted by record - only count calls that got no response at all
+        if event.status is None:
+            with self.lock:
+                self._stats(event).add(event)
+
+    def record_retry(self, event):
+        with self.lock:
+            self._stats(event).retries += 1
+
+    def reset(self):
+        with self.lock:
+            self.endpoints.clear()
+
+    def summary(self):
+        # slowest endpoints first
+        with self.lock:
+            rows = [ stats.as_dict() for stats in self.endpoints.values() ]
+        return sorted(rows, key=lambda row: row['p95'] or 0.0, reverse=True)
+
+    def export(self, openmetrics = False):
+        # Prometheus text exposition format, or OpenMetrics with openmetrics=True
+        prefix = self.prefix
+        lines = []
+
+        def header(name, kind, help_text):
+            # OpenMetrics names counters without the _total suffix their samples have
+            if openmetrics and kind == 'counter':
+                name = name[:-len('_total')]
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+
+        with self.lock:
+            endpoints = sorted(self.endpoints.values(), key=lambda stats: (stats.template, stats.method))
+
+            header(f'{prefix}_request_duration_seconds', 'histogram', 'Rev API request duration, including retries.')
+            for stats in endpoints:
+                labels = { 'method': stats.method, 'endpoint': stats.template }
+                cumulative = 0
+                for bound, count in zip(self.buckets, stats.bucket_counts):
+                    cumulative += count
+                    lines.append(f'{prefix}_request_duration_seconds_bucket{_labels(**labels, le=_number(float(bound)))} {cumulative}')
+                lines.append(f'{prefix}_request_duration_seconds_bucket{_labels(**labels, le="+Inf")} {stats.count}')
+                lines.append(f'{prefix}_request_duration_seconds_sum{_labels(**labels)} {_number(stats.sum)}')
+                lines.append(f'{prefix}_request_duration_seconds_count{_labels(**labels)} {stats.count}')
+
+            header(f'{prefix}_request_latency_seconds', 'summary', f'Rev API request duration quantiles over the last {self.sample_size} requests.')
+            for stats in endpoints:
+                labels = { 'method': stats.method, 'endpoint': stats.template }
+                values = sorted(stats.samples)
+                for quantile in (0.5, 0.95, 0.99):
+                    lines.append(f'{prefix}_request_latency_seconds{_labels(**labels, quantile=_number(quantile))} {_number(percentile(values, quantile * 100) or 0.0)}')
+                lines.append(f'{prefix}_request_latency_seconds_sum{_labels(**labels)} {_number(sum(values))}')
+                lines.append(f'{prefix}_request_latency_seconds_count{_labels(**labels)} {len(values)}')
+
+            header(f'{prefix}_requests_total', 'counter', 'Rev API requests by response status ("error" when no response was received).')
+            for stats in endpoints:
+                for status, count in sorted(stats.statuses.items()):
+                    lines.append(f'{prefix}_requests_total{_labels(method=stats.method, endpoint=stats.template, status=status)} {count}')
+
+            header(f'{prefix}_request_retries_total', 'counter', 'Rev API request attempts that were retried.')
+            for stats in endpoints:
+                lines.append(f'{prefix}_request_retries_total{_labels(method=stats.method, endpoint=stats.template)} {stats.retries}')
+
+            header(f'{prefix}_request_sent_bytes_total', 'counter', 'Request body bytes sent to Rev.')
+            for stats in endpoints:
+                lines.append(f'{prefix}_request_sent_bytes_total{_labels(method=stats.method, endpoint=stats.template)} {stats.bytes_sent}')
+
+            header(f'{prefix}_request_received_bytes_total', 'counter', 'Response body bytes received from Rev.')
+            for stats in endpoints:
+                lines.append(f'{prefix}_request_received_bytes_total{_labels(method=stats.method, endpoint=stats.template)} {stats.bytes_received}')
+
+            header(f'{prefix}_request_phase_seconds_total', 'counter', 'Time spent in each phase of Rev API requests.')
+            for stats in endpoints:
+                for phase, seconds in sorted(stats.phases.items()):
+                    lines.append(f'{prefix}_request_phase_seconds_total{_labels(method=stats.method, endpoint=stats.template, phase=phase)} {_number(seconds)}')
+
+        if openmetrics:
+            lines.append('# EOF')
+        return '\n'.join(lines) + '\n'
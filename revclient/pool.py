@@ -0,0 +1,267 @@
+import logging
+import threading
+import time
+from collections import OrderedDict, deque
+import requests
+from .client import RevClient
+from .transport import HttpTransport, DEFAULT_POOL_MAXSIZE
+
+log = logging.getLogger(__name__)
+
+# requests in flight at once, across all tenants
+DEFAULT_POOL_CONCURRENCY = 20
+# most tenant clients kept logged in at once
+DEFAULT_MAX_CLIENTS = 100
+# tenant clients unused for this many seconds are closed
+DEFAULT_IDLE_TIMEOUT = 15 * 60
+
+#%%
+class FairScheduler():
+    # shares limit request slots between tenants. Once they're all taken, waiting requests are served round-robin
+    # by tenant instead of first come first served, so a tenant queueing hundreds of requests can't starve the rest.
+    # per_tenant optionally caps how many slots a single tenant can hold
+    def __init__(self, limit, per_tenant = None):
+        self.limit = limit
+        self.per_tenant = per_tenant
+        self.lock = threading.Lock()
+        self.available = limit
+        # tenant -> requests in flight
+        self.active = {}
+        # tenant -> deque of threading.Event, one per waiting request
+        self.queues = {}
+        # tenants with waiting requests, in the order they're next served
+        self.turns = deque()
+        self.granted = 0
+        self.waited_seconds = 0.0
+
+    def _can_start(self, tenant):
+        return self.available > 0 and not (self.per_tenant and self.active.get(tenant, 0) >= self.per_tenant)
+
+    def _start(self, tenant):
+        self.available -= 1
+        self.active[tenant] = self.active.get(tenant, 0) + 1
+        self.granted += 1
+
+    def acquire(self, tenant) -> float:
+        with self.lock:
+            # tenants still waiting after a dispatch are at their per_tenant cap, so they don't need to go first
+            if not self.queues.get(tenant) and self._can_start(tenant):
+                self._start(tenant)
+                return 0.0
+            ready = threading.Event()
+            queue = self.queues.get(tenant)
+            if not queue:
+                queue = self.queues[tenant] = deque()
+                self.turns.append(tenant)
+            queue.append(ready)
+
+        start = time.perf_counter()
+        ready.wait()
+        waited = time.perf_counter() - start
+        with self.lock:
+            self.waited_seconds += waited
+        return waited
+
+    def release(self, tenant):
+        with self.lock:
+            self.available += 1
+            self.active[tenant] -= 1
+            if not self.active[tenant]:
+                del self.active[tenant]
+            self._dispatch()
+
+    def _dispatch(self):
+        # hand free slots to waiting tenants in turn, one request each
+        blocked = 0
+        while self.available > 0 and blocked < len(self.turns):
+            tenant = self.turns[0]
+            self.turns.rotate(-1)
+            if not self._can_start(tenant):
+                blocked += 1
+                continue
+            blocked = 0
+            queue = self.queues[tenant]
+            ready = queue.popleft()
+            if not queue:
+                del self.queues[tenant]
+                # it was just rotated to the back
+                self.turns.pop()
+            self._start(tenant)
+            ready.set()
+
+    def in_flight(self, tenant = None):
+        with self.lock:
+            return self.active.get(tenant, 0) if tenant is not None else self.limit - self.available
+
+    @property
+    def waiting(self):
+        with self.lock:
+            return { tenant: len(queue) for tenant, queue in self.queues.items() }
+
+class TenantSlot():
+    # RevClient.concurrency for a pooled client - entered around each request attempt
+    def __init__(self, scheduler: FairScheduler, tenant):
+        self.scheduler = scheduler
+        self.tenant = tenant
+        self.last_used = time.monotonic()
+
+    def __enter__(self):
+        self.scheduler.acquire(self.tenant)
+        return self
+
+    def __exit__(self, *args):
+        self.last_used = time.monotonic()
+        self.scheduler.release(self.tenant)
+
+#%%
+class RevClientPool():
+    # one RevClient (and RevSession) per Rev tenant, all over one shared connection pool and a global budget of
+    # max_concurrency requests in flight. Tenants log in on first use, and clients unused for idle_timeout seconds
+    # - or the least recently used past max_clients - are closed along with their connections
+    def __init__(self, max_concurrency = DEFAULT_POOL_CONCURRENCY, max_per_tenant = None, max_clients = DEFAULT_MAX_CLIENTS, idle_timeout = DEFAULT_IDLE_TIMEOUT, pool_maxsize = DEFAULT_POOL_MAXSIZE, logoff_on_evict = False, refresh_threshold_minutes = 3, **client_options):
+        self.max_clients = max_clients
+        self.idle_timeout = idle_timeout
+        # log off evicted sessions instead of leaving them to expire on the server
+        self.logoff_on_evict = logoff_on_evict
+        self.refresh_threshold_minutes = refresh_threshold_minutes
+        # passed to every RevClient, add_tenant options override them
+        self.client_options = client_options
+
+        # one connection pool per tenant host, limited to the clients kept
+        self.transport = HttpTransport(pool_connections=max_clients or DEFAULT_MAX_CLIENTS, pool_maxsize=pool_maxsize)
+        self.scheduler = FairScheduler(max_concurrency, max_per_tenant)
+        self.tenants = {}
+        # name -> RevClient, least recently used first
+        self.clients = OrderedDict()
+        self.lock = threading.RLock()
+        self.evictions = 0
+
+        self._evictor = None
+        self._evictor_stop = threading.Event()
+
+    def add_tenant(self, name, url, apiKey = None, secret = None, username = None, password = None, **options):
+        # registers a tenant - nothing is sent until the first get(name)
+        config = dict(self.client_options, url=url, apiKey=apiKey, secret=secret, username=username, password=password, **options)
+        with self.lock:
+            changed = self.tenants.get(name) != config
+            self.tenants[name] = config
+            client = self.clients.pop(name, None) if changed else None
+        if client:
+            self._close(client)
+
+    def remove_tenant(self, name):
+        with self.lock:
+            self.tenants.pop(name, None)
+            client = self.clients.pop(name, None)
+        if client:
+            self._close(client)
+
+    def get(self, name) -> RevClient:
+        # the tenant's client, logged in (or session extended) if needed
+        with self.lock:
+            client = self.clients.get(name)
+            if client is None:
+                if name not in self.tenants:
+                    raise KeyError(f'Unknown tenant {name!r}')
+                client = self.clients[name] = RevClient(transport=self.transport, concurrency=TenantSlot(self.scheduler, name), **self.tenants[name])
+            self.clients.move_to_end(name)
+            client.concurrency.last_used = time.monotonic()
+            evicted = self._collect(exclude=name)
+
+        # closed outside the lock since logging off calls Rev
+        for old in evicted:
+            self._close(old)
+        # other threads getting the same tenant wait for this login instead of sending their own
+        client.lazy_extend_session(self.refresh_threshold_minutes, verify=False)
+        return client
+
+    def __getitem__(self, name) -> RevClient:
+        return self.get(name)
+
+    def __contains__(self, name):
+        return name in self.tenants
+
+    def _collect(self, exclude = None):
+        # remove idle clients, then the least recently used over max_clients. Clients with requests in flight are kept
+        now = time.monotonic()
+        evicted = []
+        over = len(self.clients) - self.max_clients if self.max_clients else 0
+        for name, client in list(self.clients.items()):
+            if name == exclude or self.scheduler.in_flight(name):
+                continue
+            if over > 0 or (self.idle_timeout is not None and now - client.concurrency.last_used > self.idle_timeout):
+                evicted.append(self.clients.pop(name))
+                over -= 1
+        self.evictions += len(evicted)
+        return evicted
+
+    def _close(self, client):
+        if self.logoff_on_evict and client.session.token:
+            try:
+                client.disconnect()
+            except requests.RequestException as err:
+                log.warning('Error logging off evicted session, ignoring: %s', err)
+        # leaves the shared transport open
+        client.close()
+        with self.lock:
+            host_in_use = any(other.url == client.url for other in self.clients.values())
+        if not host_in_use:
+            self.transport.close_host(client.url)
+
+    def evict_idle(self):
+        # returns how many clients were closed
+        with self.lock:
+            evicted = self._collect()
+        for client in evicted:
+            self._close(client)
+        return len(evicted)
+
+    def start_auto_evict(self, interval_seconds = 60):
+        if self._evictor and self._evictor.is_alive():
+            return
+        self._evictor_stop.clear()
+
+        def evict():
+            while not self._evictor_stop.wait(interval_seconds):
+                try:
+                    self.evict_idle()
+                except Exception as err:
+                    log.warning('Error evicting idle clients, retrying: %s', err)
+
+        self._evictor = threading.Thread(target=evict, name='revclient-pool-evict', daemon=True)
+        self._evictor.start()
+
+    def stop_auto_evict(self):
+        self._evictor_stop.set()
+        if self._evictor and self._evictor is not threading.current_thread():
+            self._evictor.join()
+        self._evictor = None
+
+    @property
+    def stats(self):
+        with self.lock:
+            clients = len(self.clients)
+        return {
+            'tenants': len(self.tenants),
+            'clients': clients,
+            'inFlight': self.scheduler.in_flight(),
+            'waiting': self.scheduler.waiting,
+            'granted': self.scheduler.granted,
+            'waitedSeconds': self.scheduler.waited_seconds,
+            'evictions': self.evictions
+        }
+
+    def close(self):
+        self.stop_auto_evict()
+        with self.lock:
+            clients = list(self.clients.values())
+            self.clients.clear()
+        for client in clients:
+            self._close(client)
+        self.transport.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,112 @@
+import os
+import re
+import struct
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:
+    # windows
+    fcntl = None
+    import msvcrt
+
+#%%
+class TokenBucket():
+    # allows rate calls per second on average, with bursts of up to capacity. Shared by all threads using it
+    def __init__(self, rate, capacity = None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.lock = threading.Lock()
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def acquire(self, tokens = 1) -> float:
+        with self.lock:
+            wait = self._reserve(tokens, time.monotonic())
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    def _reserve(self, tokens, now):
+        # negative counts would add tokens past capacity
+        if tokens <= 0:
+            raise TypeError(f'tokens must be more than 0, got {tokens}')
+        # refill for time passed, then take tokens - going negative reserves future tokens so callers queue fairly
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= tokens
+        return -self.tokens / self.rate if self.tokens < 0 else 0
+
+class FileTokenBucket(TokenBucket):
+    # bucket state lives in a small locked file, so all processes on the host using the same path share one budget
+    def __init__(self, path, rate, capacity = None):
+        super().__init__(rate, capacity)
+        self.path = path
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        self.file = os.fdopen(fd, 'r+b', buffering=0)
+
+    def acquire(self, tokens = 1) -> float:
+        with self.lock:
+            self._lock_file()
+            try:
+                self.file.seek(0)
+                state = self.file.read(16)
+                # wall clock since processes don't share a monotonic clock
+                now = time.time()
+                if len(state) == 16:
+                    self.tokens, self.updated = struct.unpack('dd', state)
+                else:
+                    self.tokens, self.updated = self.capacity, now
+                wait = self._reserve(tokens, now)
+                self.file.seek(0)
+                self.file.write(struct.pack('dd', self.tokens, self.updated))
+            finally:
+                self._unlock_file()
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    def _lock_file(self):
+        if fcntl:
+            fcntl.flock(self.file.fileno(), fcntl.LOCK_EX)
+        else:
+            self.file.seek(0)
+            msvcrt.locking(self.file.fileno(), msvcrt.LK_LOCK, 1)
+
+    def _unlock_file(self):
+        if fcntl:
+            fcntl.flock(self.file.fileno(), fcntl.LOCK_UN)
+        else:
+            self.file.seek(0)
+            msvcrt.locking(self.file.fileno(), msvcrt.LK_UNLCK, 1)
+
+    def close(self):
+        self.file.close()
+
+#%%
+class RateLimiter():
+    # rules is a list of (regex, bucket) matched against the request path - first match wins.
+    # Requests that don't match any rule use the default bucket (or aren't limited if None)
+    def __init__(self, rules = (), default: TokenBucket = None):
+        self.rules = [ (re.compile(pattern), bucket) for pattern, bucket in rules ]
+        self.default = default
+        self.stats_lock = threading.Lock()
+        self.acquired = 0
+        self.waited_seconds = 0.0
+
+    def bucket_for(self, method, path):
+        for pattern, bucket in self.rules:
+            if pattern.search(path):
+                return bucket
+        return self.default
+
+    def acquire(self, method, path) -> float:
+        bucket = self.bucket_for(method, path)
+        if not bucket:
+            return 0
+        wait = bucket.acquire()
+        with self.stats_lock:
+            self.acquired += 1
+            self.waited_seconds += wait
+        return wait
@@ -0,0 +1,300 @@
+import base64
+import gzip
+import io
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from urllib.parse import urlencode, urlparse
+import requests
+from requests.structures import CaseInsensitiveDict
+from .metrics import endpoint_template, key_parents
+from .utils import format_iso, now_iso
+from .transport import HttpTransport
+
+# responses bigger than this (video downloads) are recorded by size only, and replayed as filler bytes
+DEFAULT_MAX_RECORDED_BODY = 1024 * 1024
+DEFAULT_REPLAY_WORKERS = 8
+
+# request/response JSON fields that are never written to a recording
+SENSITIVE_FIELDS = ('password', 'secret', 'apiKey', 'token')
+REDACTED = '[redacted]'
+# request headers worth keeping - Authorization and cookies are always left out
+RECORDED_REQUEST_HEADERS = ('Accept', 'Content-Type', 'Range', 'If-Range', 'If-None-Match')
+# request and response bodies of these endpoints are never written - they hold credentials, tokens and user ids
+LOGIN_PATHS = ('/api/v2/authenticate', '/api/v2/user/login')
+# replayed logins get a session good for this long
+REPLAY_SESSION_MINUTES = 20
+
+def _redact(value):
+    if isinstance(value, dict):
+        return { key: REDACTED if key in SENSITIVE_FIELDS else _redact(val) for key, val in value.items() }
+    if isinstance(value, list):
+        return [ _redact(val) for val in value ]
+    return value
+
+def _redact_path(path):
+    # api keys are part of some urls - /api/v2/tokens/{key}
+    segments = path.split('/')
+    for index in range(1, len(segments)):
+        if segments[index] and segments[index - 1] in key_parents:
+            segments[index] = REDACTED
+    return '/'.join(segments)
+
+def _request_key(method, path, params = None):
+    query = urlencode(sorted(params.items()), doseq=True) if isinstance(params, dict) else ''
+    return f'{method} {_redact_path(path)}' + (f'?{query}' if query else '')
+
+def _open(path, mode):
+    # recordings ending in .gz are compressed
+    return gzip.open(path, mode + 't', encoding='utf-8') if path.endswith('.gz') else open(path, mode, encoding='utf-8')
+
+def load_recording(path):
+    with _open(path, 'r') as fh:
+        return [ json.loads(line) for line in fh if line.strip() ]
+
+#%%
+class RecordingTransport():
+    # wraps a transport (a new HttpTransport by default) and appends every exchange to path as a JSON line:
+    #   rev = RevClient(url, apiKey=apiKey, secret=secret, transport=RecordingTransport('traffic.jsonl.gz'))
+    # Credentials, tokens and Authorization headers are redacted before anything is written
+    def __init__(self, path, transport: HttpTransport = None, max_body_bytes = DEFAULT_MAX_RECORDED_BODY):
+        self.path = path
+        self._owns_transport = transport is None
+        self.transport = transport or HttpTransport()
+        self.max_body_bytes = max_body_bytes
+        self.lock = threading.Lock()
+        self.file = _open(path, 'a')
+        self.started = time.perf_counter()
+        self.recorded = 0
+
+    def request(self, method, url, **kwargs):
+        offset = time.perf_counter() - self.started
+        start = time.perf_counter()
+        resp = self.transport.request(method, url, **kwargs)
+
+        content_type = resp.headers.get('Content-Type', '')
+        length = resp.headers.get('Content-Length')
+        body = None
+        # streamed downloads are passed through untouched, unless they're small enough to keep
+        if not kwargs.get('stream') or content_type.startswith(('application/json', 'text/')) or (length is not None and int(length) <= self.max_body_bytes):
+            body = resp.content
+            # readers of resp.raw get the body that was already read
+            resp.raw = io.BytesIO(body)
+        elapsed = time.perf_counter() - start
+
+        path = urlparse(url).path
+        entry = {
+            'offset': round(offset, 6),
+            'elapsed': round(elapsed, 6),
+            'method': method,
+            'path': _redact_path(path),
+            'key': _request_key(method, path, kwargs.get('params')),
+            'request': self._request(path, kwargs),
+            'status': resp.status_code,
+            'headers': { key: val for key, val in resp.headers.items() if key.lower() != 'set-cookie' },
+            'timings': { phase: round(seconds, 6) for phase, seconds in (getattr(resp, 'timings', None) or {}).items() }
+        }
+        entry.update(self._body(path, body, content_type, length))
+        line = json.dumps(entry, separators=(',', ':'))
+        with self.lock:
+            self.file.write(line + '\n')
+            self.recorded += 1
+        return resp
+
+    def _request(self, path, kwargs):
+        request = { 'headers': { key: val for key, val in (kwargs.get('headers') or {}).items() if key in RECORDED_REQUEST_HEADERS } }
+        if kwargs.get('params'):
+            request['params'] = _redact(kwargs['params'])
+        if path in LOGIN_PATHS and (kwargs.get('json') is not None or kwargs.get('data') is not None):
+            request['json'] = REDACTED
+        elif kwargs.get('json') is not None:
+            request['json'] = _redact(kwargs['json'])
+        return request
+
+    def _body(self, path, body, content_type, length):
+        if path in LOGIN_PATHS and body:
+            return { 'redacted': True }
+        if body is None or len(body) > self.max_body_bytes:
+            size = len(body) if body is not None else int(length or 0)
+            return { 'size': size }
+        if content_type.startswith('application/json') and body:
+            try:
+                payload = json.loads(body)
+            except ValueError:
+                return { 'body': body.decode('utf-8', errors='replace') }
+            if isinstance(payload, dict) and any(key in payload for key in SENSITIVE_FIELDS):
+                payload = _redact(payload)
+            return { 'json': payload }
+        try:
+            return { 'body': body.decode('utf-8') }
+        except UnicodeDecodeError:
+            return { 'body64': base64.b64encode(body).decode('ascii') }
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+        if self._owns_transport:
+            self.transport.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+class _FillerReader():
+    # stands in for a download recorded without its body
+    def __init__(self, size):
+        self.size = size
+        self.position = 0
+
+    def read(self, amount = None):
+        amount = self.size - self.position if amount is None else min(amount, self.size - self.position)
+        self.position += amount
+        return bytes(amount)
+
+    def tell(self):
+        return self.position
+
+    def close(self):
+        pass
+
+class ReplayTransport():
+    # answers requests from a recording instead of calling Rev. Requests are matched on method, path and query,
+    # then on method and endpoint template (so other video ids get a recorded details response), taking the
+    # recorded responses in order and starting over once they run out. speed = None answers right away,
+    # speed = 1 waits as long as the recorded request took, speed = 10 ten times faster
+    def __init__(self, path, speed = None, strict = True):
+        self.path = path
+        self.speed = speed
+        # raise for requests that have nothing recorded, instead of answering 404
+        self.strict = strict
+        self.entries = load_recording(path)
+        self.exact = {}
+        self.templates = {}
+        for entry in self.entries:
+            self.exact.setdefault(entry['key'], []).append(entry)
+            self.templates.setdefault((entry['method'], endpoint_template(entry['path'])), []).append(entry)
+        self.positions = {}
+        self.lock = threading.Lock()
+        self.replayed = 0
+        self.unmatched = 0
+
+    def _match(self, method, path, params):
+        for key, entries in ((_request_key(method, path, params), self.exact), ((method, endpoint_template(_redact_path(path))), self.templates)):
+            matches = entries.get(key)
+            if matches:
+                with self.lock:
+                    position = self.positions.get(key, 0)
+                    self.positions[key] = position + 1
+                    self.replayed += 1
+                return matches[position % len(matches)]
+        with self.lock:
+            self.unmatched += 1
+        return None
+
+    def request(self, method, url, **kwargs):
+        start = time.perf_counter()
+        # read request bodies as a server would, so encoding and upload progress callbacks still run
+        bytes_sent = self._drain(kwargs.get('data'))
+
+        path = urlparse(url).path
+        entry = self._match(method, path, kwargs.get('params'))
+        if entry is None:
+            if self.strict:
+                raise AssertionError(f'No recorded response for {method} {path}')
+            entry = { 'status': 404, 'headers': {}, 'json': { 'code': 'NotRecorded' }, 'elapsed': 0, 'timings': {} }
+
+        if self.speed:
+            delay = entry['elapsed'] / self.speed - (time.perf_counter() - start)
+            if delay > 0:
+                time.sleep(delay)
+        return self._response(method, url, kwargs, entry, bytes_sent, time.perf_counter() - start)
+
+    def _drain(self, data):
+        if data is None or isinstance(data, (str, bytes, dict, list, tuple)):
+            return len(data) if isinstance(data, (str, bytes)) else 0
+        if hasattr(data, 'read'):
+            return sum(len(chunk) for chunk in iter(lambda: data.read(1024 * 1024), b''))
+        return sum(len(chunk) for chunk in data)
+
+    def _response(self, method, url, kwargs, entry, bytes_sent, elapsed):
+        if entry.get('redacted'):
+            # login response wasn't recorded - stand in a session that's valid from now
+            session = { 'token': REDACTED, 'id': REDACTED, 'expiration': format_iso(now_iso() + timedelta(minutes=REPLAY_SESSION_MINUTES)) }
+            body = json.dumps(session if 200 <= entry['status'] < 300 else {}).encode()
+        elif 'json' in entry:
+            body = json.dumps(entry['json']).encode()
+        elif 'body64' in entry:
+            body = base64.b64decode(entry['body64'])
+        elif 'body' in entry:
+            body = entry['body'].encode()
+        else:
+            body = None
+
+        resp = requests.Response()
+        resp.status_code = entry['status']
+        resp.headers = CaseInsensitiveDict(entry['headers'])
+        # bodies are stored decoded
+        resp.headers.pop('Content-Encoding', None)
+        resp.headers.pop('Transfer-Encoding', None)
+        resp.headers['Content-Length'] = str(len(body) if body is not None else entry.get('size', 0))
+        resp.raw = io.BytesIO(body) if body is not None else _FillerReader(entry.get('size', 0))
+        resp.url = url
+        resp.encoding = requests.utils.get_encoding_from_headers(resp.headers)
+        resp.reason = 'Replayed'
+        resp.elapsed = timedelta(seconds=elapsed)
+
+        request = requests.PreparedRequest()
+        request.prepare(method=method, url=url, headers=kwargs.get('headers'), params=kwargs.get('params'))
+        if bytes_sent:
+            request.headers['Content-Length'] = str(bytes_sent)
+        resp.request = request
+        scale = 1 / self.speed if self.speed else 0
+        resp.timings = { phase: entry['timings'].get(phase, 0.0) * scale for phase in ('connect', 'tls', 'server', 'download') }
+        return resp
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+#%%
+def replay_traffic(client, path, speed = None, max_workers = DEFAULT_REPLAY_WORKERS, skip_auth = True) -> int:
+    # sends the requests in a recording through client, at their recorded offsets (divided by speed) or as fast
+    # as max_workers allow if speed is None. Login/logoff/extend calls are left to the client's own session,
+    # and uploads are skipped since their bodies aren't recorded
+    # logins can't be sent again either, their credentials are redacted
+    entries = [ entry for entry in load_recording(path) if not (entry['method'] in ('POST', 'PUT', 'PATCH') and entry.get('request', {}).get('json', REDACTED) == REDACTED) ]
+    if skip_auth:
+        entries = [ entry for entry in entries if not any(segment in entry['path'] for segment in ('/authenticate', '/user/login', '/user/logoff', 'extend-session-timeout', '/tokens/')) ]
+    start = time.perf_counter()
+
+    def send(entry):
+        request = entry.get('request', {})
+        options = { 'headers': request.get('headers', {}) }
+        if 'size' in entry:
+            options['stream'] = True
+        resp = client.request(entry['method'], entry['path'], request.get('params') or request.get('json'), options, payload_only=False, retry=False, use_cache=False)
+        # read the body, so streamed responses release their connection
+        for chunk in resp.iter_content(1024 * 1024):
+            pass
+        resp.close()
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = []
+        for entry in entries:
+            if speed:
+                delay = entry['offset'] / speed - (time.perf_counter() - start)
+                if delay > 0:
+                    time.sleep(delay)
+            futures.append(pool.submit(send, entry))
+        for future in futures:
+            future.result()
+    return len(entries)
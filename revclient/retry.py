@@ -0,0 +1,89 @@
+import random
+import threading
+from datetime import timezone
+from email.utils import parsedate_to_datetime
+from .utils import now_iso
+
+IDEMPOTENT_METHODS = frozenset(['GET', 'HEAD', 'PUT', 'DELETE', 'OPTIONS'])
+RETRY_STATUSES = frozenset([429, 500, 502, 503, 504])
+
+#%%
+class RetryPolicy():
+    def __init__(self, max_retries = 3, backoff_factor = 0.5, max_backoff = 30, jitter = True, statuses = RETRY_STATUSES, methods = IDEMPOTENT_METHODS, respect_retry_after = True, max_retry_after = 120, reauthenticate = True):
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+        self.statuses = statuses
+        self.methods = methods
+        self.respect_retry_after = respect_retry_after
+        self.max_retry_after = max_retry_after
+        # log in again once if a request fails with 401 (expired/revoked token)
+        self.reauthenticate = reauthenticate
+
+    def should_retry(self, method, attempt, status = None) -> bool:
+        if attempt >= self.max_retries:
+            return False
+        # throttled requests were rejected before being processed, so they're safe to resend for any method
+        if status == 429:
+            return 429 in self.statuses
+        if method not in self.methods:
+            return False
+        # status is None for connection errors
+        return status is None or status in self.statuses
+
+    def backoff(self, attempt, response = None) -> float:
+        if self.respect_retry_after and response is not None:
+            retry_after = parse_retry_after(response.headers.get('Retry-After'))
+            if retry_after is not None:
+                return min(retry_after, self.max_retry_after)
+
+        delay = min(self.backoff_factor * (2 ** attempt), self.max_backoff)
+        if self.jitter:
+            delay = random.uniform(delay / 2, delay)
+        return delay
+
+def parse_retry_after(value):
+    # Retry-After is either a number of seconds or an HTTP date
+    if not value:
+        return None
+    try:
+        return max(float(value), 0)
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max((when - now_iso()).total_seconds(), 0)
+
+#%%
+class RetryStats():
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.retries = 0
+        self.throttled = 0
+        self.throttled_seconds = 0.0
+        self.backoff_seconds = 0.0
+        self.reauthentications = 0
+
+    def record_retry(self, delay, throttled = False):
+        with self.lock:
+            self.retries += 1
+            self.backoff_seconds += delay
+            if throttled:
+                self.throttled += 1
+                self.throttled_seconds += delay
+
+    def record_reauthentication(self):
+        with self.lock:
+            self.reauthentications += 1
+
+    def as_dict(self):
+        with self.lock:
+            return { key: val for key, val in vars(self).items() if key != 'lock' }
+
+    def __repr__(self):
+        return f'RetryStats({self.as_dict()})'
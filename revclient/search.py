@@ -0,0 +1,104 @@
+import queue
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import TYPE_CHECKING
+from .utils import parse_iso, format_iso, now_iso
+
+if TYPE_CHECKING:
+    from .client import RevClient
+
+# lower bound of the date range searched when the query doesn't specify fromUploadDate
+DEFAULT_SEARCH_START = datetime(2000, 1, 1, tzinfo=timezone.utc)
+# windows with more results than this are split in two
+DEFAULT_WINDOW_RESULTS = 10000
+# ...unless they're already this small
+MIN_WINDOW = timedelta(minutes=1)
+
+#%%
+def parallel_search(client: 'RevClient', query: dict = {}, partitions = 4, max_workers = None, max_window_results = DEFAULT_WINDOW_RESULTS, buffer_size = 1000):
+    # scrolls disjoint upload date windows concurrently and merges the results into one stream, de-duplicated by id
+    start = query.get('fromUploadDate', DEFAULT_SEARCH_START)
+    end = query.get('toUploadDate') or now_iso()
+    start = start if isinstance(start, datetime) else parse_iso(start)
+    end = end if isinstance(end, datetime) else parse_iso(end)
+
+    windows = queue.Queue()
+    step = (end - start) / partitions
+    for index in range(partitions):
+        windows.put((start + step * index, end if index == partitions - 1 else start + step * (index + 1)))
+
+    results = queue.Queue(maxsize=buffer_size)
+    stop = threading.Event()
+    lock = threading.Lock()
+    # windows queued or being scanned - workers exit once it reaches zero
+    pending = [partitions]
+    end_marker = object()
+
+    def put(entry):
+        while not stop.is_set():
+            try:
+                results.put(entry, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def scan(window_start, window_end):
+        window_query = dict(query, fromUploadDate=format_iso(window_start), toUploadDate=format_iso(window_end))
+        pages = client._scroll('/api/v2/videos/search', 'totalVideos', 'videos', window_query)
+        try:
+            for page in pages:
+                if page['current'] == 0 and page['total'] > max_window_results and window_end - window_start > MIN_WINDOW:
+                    middle = window_start + (window_end - window_start) / 2
+                    with lock:
+                        pending[0] += 2
+                    windows.put((window_start, middle))
+                    windows.put((middle, window_end))
+                    return
+                for video in page['items']:
+                    if not put((video, None)):
+                        return
+        finally:
+            pages.close()
+
+    def worker():
+        while not stop.is_set():
+            try:
+                window = windows.get(timeout=0.1)
+            except queue.Empty:
+                with lock:
+                    if pending[0] == 0:
+                        return
+                continue
+            try:
+                scan(*window)
+            except Exception as err:
+                put((end_marker, err))
+                stop.set()
+            finally:
+                with lock:
+                    pending[0] -= 1
+                    finished = pending[0] == 0
+                if finished:
+                    put((end_marker, None))
+
+    threads = [ threading.Thread(target=worker, daemon=True) for _ in range(max_workers or partitions) ]
+    for thread in threads:
+        thread.start()
+
+    seen = set()
+    try:
+        while True:
+            video, err = results.get()
+            if video is end_marker:
+                if err:
+                    raise err
+                return
+            # windows share their boundary timestamps, so the same video can show up twice
+            video_id = video.get('id')
+            if video_id in seen:
+                continue
+            seen.add(video_id)
+            yield video
+    finally:
+        stop.set()
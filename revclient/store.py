@@ -0,0 +1,224 @@
+import json
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from typing import TYPE_CHECKING
+from .utils import parse_iso, format_iso
+from .sync import SyncResult
+
+if TYPE_CHECKING:
+    from .video import VideoClient
+
+DEFAULT_BATCH_SIZE = 1000
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS videos (
+    id TEXT PRIMARY KEY,
+    title TEXT,
+    uploader TEXT,
+    when_uploaded TEXT,
+    when_published TEXT,
+    when_modified TEXT,
+    has_transcription INTEGER,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS video_categories (
+    video_id TEXT NOT NULL,
+    category TEXT NOT NULL,
+    PRIMARY KEY (video_id, category)
+);
+CREATE TABLE IF NOT EXISTS video_tags (
+    video_id TEXT NOT NULL,
+    tag TEXT NOT NULL,
+    PRIMARY KEY (video_id, tag)
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_videos_uploader ON videos (uploader);
+CREATE INDEX IF NOT EXISTS idx_videos_when_uploaded ON videos (when_uploaded);
+CREATE INDEX IF NOT EXISTS idx_videos_when_published ON videos (when_published);
+CREATE INDEX IF NOT EXISTS idx_videos_when_modified ON videos (when_modified);
+CREATE INDEX IF NOT EXISTS idx_video_categories_category ON video_categories (category, video_id);
+CREATE INDEX IF NOT EXISTS idx_video_tags_tag ON video_tags (tag, video_id);
+'''
+
+def _date(val):
+    # normalize so dates compare correctly as strings
+    if not val:
+        return None
+    return format_iso(val if isinstance(val, datetime) else parse_iso(val))
+
+def _uploader(video):
+    val = video.get('uploadedBy') or video.get('uploader')
+    if isinstance(val, dict):
+        val = val.get('username') or val.get('fullname')
+    return val
+
+def _categories(video):
+    # categories can be plain names, or objects with id/name/path - index all of them
+    names = set()
+    for cat in video.get('categories') or []:
+        if isinstance(cat, dict):
+            names.update(val for val in (cat.get('categoryId'), cat.get('name'), cat.get('fullpath')) if val)
+        elif cat:
+            names.add(cat)
+    return names
+
+def _has_transcription(video):
+    if 'hasTranscription' in video:
+        return int(bool(video['hasTranscription']))
+    for key in ('transcriptionLanguages', 'transcriptionFiles'):
+        if key in video:
+            return int(bool(video[key]))
+    return None
+
+#%%
+class VideoStore():
+    # local SQLite copy of video search results, for answering read queries without calling Rev
+    def __init__(self, path = ':memory:', checkpoint = None, max_age = None, query: dict = {}):
+        self.path = path
+        # search query that refresh() keeps the store in sync with
+        self.query_filter = query
+        # sync checkpoint used by refresh()
+        self.checkpoint = checkpoint or (None if path == ':memory:' else f'{path}.sync.json')
+        # refresh before local_search if the last refresh is older than this many seconds
+        self.max_age = max_age
+        self.lock = threading.RLock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def load(self, videos, batch_size = DEFAULT_BATCH_SIZE) -> int:
+        count = 0
+        batch = []
+        for video in videos:
+            batch.append(video)
+            if len(batch) >= batch_size:
+                count += self._write(batch)
+                batch = []
+        if batch:
+            count += self._write(batch)
+        return count
+
+    def load_search(self, video: 'VideoClient', query: dict = {}, batch_size = DEFAULT_BATCH_SIZE) -> int:
+        return self.load(video.search_stream(query, incremental=True), batch_size)
+
+    def _write(self, videos):
+        # a video can show up twice in one batch (e.g. it changed mid-scroll) - keep the last copy
+        videos = list({ vid['id']: vid for vid in videos }.values())
+        ids = [ (vid['id'],) for vid in videos ]
+        rows = [ (vid['id'], vid.get('title'), _uploader(vid), _date(vid.get('whenUploaded')), _date(vid.get('whenPublished')), _date(vid.get('whenModified')), _has_transcription(vid), json.dumps(vid)) for vid in videos ]
+        categories = [ (vid['id'], cat) for vid in videos for cat in _categories(vid) ]
+        tags = [ (vid['id'], tag) for vid in videos for tag in set(vid.get('tags') or []) ]
+        # one transaction per batch
+        with self.lock, self.db:
+            self.db.executemany('INSERT OR REPLACE INTO videos VALUES (?, ?, ?, ?, ?, ?, ?, ?)', rows)
+            self.db.executemany('DELETE FROM video_categories WHERE video_id = ?', ids)
+            self.db.executemany('DELETE FROM video_tags WHERE video_id = ?', ids)
+            self.db.executemany('INSERT INTO video_categories VALUES (?, ?)', categories)
+            self.db.executemany('INSERT INTO video_tags VALUES (?, ?)', tags)
+        return len(rows)
+
+    def delete(self, video_ids):
+        ids = [ (video_id,) for video_id in video_ids ]
+        with self.lock, self.db:
+            self.db.executemany('DELETE FROM videos WHERE id = ?', ids)
+            self.db.executemany('DELETE FROM video_categories WHERE video_id = ?', ids)
+            self.db.executemany('DELETE FROM video_tags WHERE video_id = ?', ids)
+
+    def refresh(self, video: 'VideoClient', detect_deletions = False, batch_size = DEFAULT_BATCH_SIZE):
+        # apply changes since the last refresh using video.sync
+        if not self.checkpoint:
+            return self._reload(video, batch_size)
+        batch = []
+        deleted = []
+        def on_change(vid):
+            batch.append(vid)
+            if len(batch) >= batch_size:
+                self._write(batch)
+                batch.clear()
+
+        def before_save():
+            # everything is in SQLite before the checkpoint moves past it
+            if batch:
+                self._write(batch)
+                batch.clear()
+            if deleted:
+                self.delete(deleted)
+            self._set_meta('lastRefresh', str(time.time()))
+
+        return video.sync(self.checkpoint, self.query_filter, on_change=on_change, on_delete=deleted.append, detect_deletions=detect_deletions, before_save=before_save)
+
+    def _reload(self, video: 'VideoClient', batch_size):
+        # no checkpoint to sync from, so fetch everything again and drop what's gone
+        seen = set()
+        def videos():
+            for vid in video.search_stream(self.query_filter, incremental=True):
+                seen.add(vid['id'])
+                yield vid
+        count = self.load(videos(), batch_size)
+        with self.lock:
+            stored = [ row[0] for row in self.db.execute('SELECT id FROM videos') ]
+        deleted = sorted(set(stored) - seen)
+        if deleted:
+            self.delete(deleted)
+        self._set_meta('lastRefresh', str(time.time()))
+        return SyncResult(count, deleted, None, True, True)
+
+    @property
+    def age(self):
+        # seconds since last refresh, None if never refreshed
+        last = self._get_meta('lastRefresh')
+        return time.time() - float(last) if last else None
+
+    def query(self, category = None, uploader = None, tag = None, uploaded_after = None, uploaded_before = None, has_transcription = None, limit = None):
+        clauses = []
+        params = []
+        if category:
+            clauses.append('id IN (SELECT video_id FROM video_categories WHERE category = ?)')
+            params.append(category)
+        if tag:
+            clauses.append('id IN (SELECT video_id FROM video_tags WHERE tag = ?)')
+            params.append(tag)
+        if uploader:
+            clauses.append('uploader = ?')
+            params.append(uploader)
+        if uploaded_after:
+            clauses.append('when_uploaded >= ?')
+            params.append(_date(uploaded_after))
+        if uploaded_before:
+            clauses.append('when_uploaded < ?')
+            params.append(_date(uploaded_before))
+        if has_transcription is not None:
+            clauses.append('has_transcription = ?')
+            params.append(int(bool(has_transcription)))
+
+        sql = 'SELECT data FROM videos'
+        if clauses:
+            sql += ' WHERE ' + ' AND '.join(clauses)
+        sql += ' ORDER BY when_uploaded DESC'
+        if limit:
+            sql += ' LIMIT ?'
+            params.append(limit)
+
+        with self.lock:
+            rows = self.db.execute(sql, params).fetchall()
+        return [ json.loads(row[0]) for row in rows ]
+
+    def count(self):
+        with self.lock:
+            return self.db.execute('SELECT COUNT(*) FROM videos').fetchone()[0]
+
+    def _get_meta(self, key):
+        with self.lock:
+            row = self.db.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, key, value):
+        with self.lock, self.db:
+            self.db.execute('INSERT OR REPLACE INTO meta VALUES (?, ?)', (key, value))
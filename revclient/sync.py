@@ -0,0 +1,99 @@
+import json
+import os
+from datetime import timedelta
+from typing import TYPE_CHECKING
+from .utils import parse_iso, format_iso, now_iso, write_json
+
+if TYPE_CHECKING:
+    from .video import VideoClient
+
+# re-fetch a little before the high-water mark, to cover clock skew and search index delay
+SYNC_OVERLAP = timedelta(minutes=5)
+
+#%%
+class SyncResult():
+    def __init__(self, changed, deleted, high_water, full_sync, deletions_checked = False):
+        # changed is the list of changed videos, or just the count if an on_change callback was used
+        self.changed = changed
+        self.deleted = deleted
+        self.high_water = high_water
+        self.full_sync = full_sync
+        # whether this run listed every video id to look for deletions
+        self.deletions_checked = deletions_checked
+
+    def __repr__(self):
+        changed = self.changed if isinstance(self.changed, int) else len(self.changed)
+        return f'SyncResult(changed={changed}, deleted={len(self.deleted)}, high_water={self.high_water}, full_sync={self.full_sync}, deletions_checked={self.deletions_checked})'
+
+def _deletion_scan_due(state, detect_deletions):
+    # detect_deletions is False, True (every run) or the interval between scans - seconds or a timedelta
+    if detect_deletions is True:
+        return True
+    if not detect_deletions:
+        return False
+    interval = detect_deletions if isinstance(detect_deletions, timedelta) else timedelta(seconds=detect_deletions)
+    last_scan = state.get('lastDeletionScan')
+    return not last_scan or now_iso() - parse_iso(last_scan) >= interval
+
+def sync_videos(video: 'VideoClient', checkpoint, query: dict = {}, on_change = None, on_delete = None, detect_deletions = False, date_field = 'whenModified', from_param = 'fromModifiedDate', before_save = None) -> SyncResult:
+    state = {}
+    if os.path.exists(checkpoint):
+        with open(checkpoint, 'r') as fh:
+            state = json.load(fh)
+    # a changed query means the old high-water mark doesn't apply
+    if state.get('query') != query:
+        state = {}
+
+    high_water = parse_iso(state['highWater']) if state.get('highWater') else None
+    search_query = dict(query)
+    if high_water:
+        search_query[from_param] = format_iso(high_water - SYNC_OVERLAP)
+
+    changed = [] if on_change is None else 0
+    changed_ids = set()
+    for vid in video.search_stream(search_query, incremental=True):
+        changed_ids.add(vid['id'])
+        if on_change is None:
+            changed.append(vid)
+        else:
+            on_change(vid)
+            changed += 1
+        if vid.get(date_field):
+            when = parse_iso(vid[date_field])
+            if not high_water or when > high_water:
+                high_water = when
+
+    deleted = []
+    scan = _deletion_scan_due(state, detect_deletions)
+    last_scan = state.get('lastDeletionScan')
+    known_ids = None
+    if scan:
+        # only way to notice deletions is to list every id - a search of the whole catalog, projected and streamed
+        current_ids = { vid['id'] for vid in video.search_stream(query, fields=['id'], incremental=True) }
+        if 'ids' in state:
+            deleted = sorted(set(state['ids']) - current_ids)
+        known_ids = current_ids
+        last_scan = format_iso(now_iso())
+    elif detect_deletions:
+        # between scans, keep new ids too so ones deleted before the next scan are still noticed
+        known_ids = set(state.get('ids', [])) | changed_ids
+
+    if on_delete:
+        for video_id in deleted:
+            on_delete(video_id)
+    # last chance to persist changes handed to on_change/on_delete - if it raises, the checkpoint isn't moved on
+    if before_save:
+        before_save()
+
+    # only saved once everything succeeded - a failed run starts again from the previous mark
+    new_state = {
+        'query': query,
+        'highWater': format_iso(high_water) if high_water else None,
+        'lastSync': format_iso(now_iso())
+    }
+    # the id list is only needed, and only kept, when looking for deletions
+    if known_ids is not None:
+        new_state['ids'] = sorted(known_ids)
+        new_state['lastDeletionScan'] = last_scan
+    write_json(checkpoint, new_state)
+    return SyncResult(changed, deleted, high_water, not state, scan)
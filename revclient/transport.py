@@ -0,0 +1,256 @@
+from http.cookiejar import DefaultCookiePolicy
+import gzip
+import json
+import threading
+import time
+import zlib
+import requests
+from urllib.parse import urlparse
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import ProtocolError, ReadTimeoutError
+
+# number of distinct hosts to keep connection pools for
+DEFAULT_POOL_CONNECTIONS = 10
+# max connections kept open per host
+DEFAULT_POOL_MAXSIZE = 10
+# request bodies smaller than this aren't worth compressing
+DEFAULT_COMPRESS_MIN_BYTES = 1024
+COMPRESSIONS = ('gzip', 'br')
+
+try:
+    import brotli
+except ImportError:
+    # optional, pip install revclient[brotli]
+    brotli = None
+
+# advertised for responses when compression is on, the chosen codec first
+ACCEPT_ENCODINGS = { 'gzip': 'gzip, deflate', 'br': 'br, gzip, deflate' }
+
+# phase timings of the request in flight on this thread
+_phases = threading.local()
+
+def _record_phase(name, seconds):
+    timings = getattr(_phases, 'timings', None)
+    if timings is not None:
+        timings[name] += seconds
+
+#%%
+class _TimedConnection():
+    # times new connections - DNS lookup and TCP connect happen together in _new_conn, then TLS for https
+    def _new_conn(self):
+        start = time.perf_counter()
+        try:
+            return super()._new_conn()
+        finally:
+            _record_phase('connect', time.perf_counter() - start)
+
+    def connect(self):
+        start = time.perf_counter()
+        timings = getattr(_phases, 'timings', None)
+        before = timings['connect'] if timings else 0
+        super().connect()
+        if timings and self.scheme == 'https':
+            timings['tls'] += time.perf_counter() - start - (timings['connect'] - before)
+
+class _TimedHTTPConnection(_TimedConnection, HTTPConnection):
+    scheme = 'http'
+class _TimedHTTPSConnection(_TimedConnection, HTTPSConnection):
+    scheme = 'https'
+
+class _TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _TimedHTTPConnection
+class _TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _TimedHTTPSConnection
+
+class TimedHTTPAdapter(HTTPAdapter):
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = { 'http': _TimedHTTPConnectionPool, 'https': _TimedHTTPSConnectionPool }
+
+def compress(body, compression):
+    if compression == 'br':
+        return brotli.compress(body, quality=4)
+    # level 6 is most of the size reduction of 9 at a fraction of the CPU
+    return gzip.compress(body, 6)
+
+def decompress(body, encoding):
+    encoding = (encoding or '').strip().lower()
+    if not body or encoding in ('', 'identity'):
+        return body
+    if encoding == 'gzip':
+        return zlib.decompress(body, 16 + zlib.MAX_WBITS)
+    if encoding == 'deflate':
+        try:
+            return zlib.decompress(body)
+        except zlib.error:
+            # raw deflate without the zlib header
+            return zlib.decompress(body, -zlib.MAX_WBITS)
+    if encoding == 'br' and brotli:
+        return brotli.decompress(body)
+    raise requests.exceptions.ContentDecodingError(f'Unsupported Content-Encoding {encoding!r}')
+
+class TransferStats():
+    # request/response body sizes before and after compression, for transports with compression on
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.requests = 0
+            self.requests_compressed = 0
+            self.request_bytes = 0
+            self.request_wire_bytes = 0
+            self.compress_seconds = 0.0
+            self.responses = 0
+            self.responses_compressed = 0
+            self.response_bytes = 0
+            self.response_wire_bytes = 0
+            self.decompress_seconds = 0.0
+
+    def record_request(self, size, wire_size, seconds):
+        with self.lock:
+            self.requests += 1
+            self.requests_compressed += wire_size < size
+            self.request_bytes += size
+            self.request_wire_bytes += wire_size
+            self.compress_seconds += seconds
+
+    def record_response(self, size, wire_size, seconds):
+        with self.lock:
+            self.responses += 1
+            self.responses_compressed += wire_size < size
+            self.response_bytes += size
+            self.response_wire_bytes += wire_size
+            self.decompress_seconds += seconds
+
+    def as_dict(self):
+        with self.lock:
+            return { key: val for key, val in vars(self).items() if key != 'lock' }
+
+def encode_body(kwargs, compression, min_bytes, stats: TransferStats):
+    # returns request kwargs with a json/str/bytes body serialized, and compressed if it's at least min_bytes.
+    # Streamed bodies (uploads) and files are sent as they are
+    content_type = None
+    if kwargs.get('json') is not None:
+        body = json.dumps(kwargs['json'], separators=(',', ':')).encode()
+        content_type = 'application/json'
+    elif isinstance(kwargs.get('data'), (str, bytes)):
+        body = kwargs['data'].encode() if isinstance(kwargs['data'], str) else kwargs['data']
+    else:
+        return kwargs
+
+    kwargs = dict(kwargs)
+    kwargs.pop('json', None)
+    headers = dict(kwargs.get('headers') or {})
+    if content_type and not any(key.lower() == 'content-type' for key in headers):
+        headers['Content-Type'] = content_type
+    start = time.perf_counter()
+    wire_body = body
+    if len(body) >= min_bytes:
+        wire_body = compress(body, compression)
+        headers['Content-Encoding'] = compression
+    stats.record_request(len(body), len(wire_body), time.perf_counter() - start)
+    kwargs['data'] = wire_body
+    kwargs['headers'] = headers
+    return kwargs
+
+#%%
+class HttpTransport():
+    # compression = 'gzip' or 'br' compresses request bodies of at least compress_min_bytes, and has responses
+    # decoded here rather than by urllib3 so transfer_stats and the decompress timing show what compression costs
+    def __init__(self, pool_connections = DEFAULT_POOL_CONNECTIONS, pool_maxsize = DEFAULT_POOL_MAXSIZE, pool_block = False, keep_alive = True, compression = None, compress_min_bytes = DEFAULT_COMPRESS_MIN_BYTES):
+        if compression not in (None,) + COMPRESSIONS:
+            raise TypeError(f'compression must be one of {COMPRESSIONS}')
+        if compression == 'br' and brotli is None:
+            raise ImportError('br compression needs the brotli package: pip install revclient[brotli]')
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.pool_block = pool_block
+        self.compression = compression
+        self.compress_min_bytes = compress_min_bytes
+        self.transfer_stats = TransferStats()
+
+        self.http = requests.Session()
+        # behave like the stateless requests.request() - Rev auth is by header, don't persist cookies between calls
+        self.http.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+        if not keep_alive:
+            self.http.headers['Connection'] = 'close'
+        if compression:
+            self.http.headers['Accept-Encoding'] = ACCEPT_ENCODINGS[compression]
+
+        # pool_block = True makes pool_maxsize a hard cap on open connections per host
+        adapter = TimedHTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize, pool_block=pool_block)
+        self.http.mount('https://', adapter)
+        self.http.mount('http://', adapter)
+        # called once the response headers are in, before the body is read
+        self.http.hooks['response'].append(self._headers_received)
+
+    def request(self, method, url, **kwargs):
+        # resp.timings has seconds spent in each phase of the request:
+        # connect (DNS + TCP, 0 for reused connections), tls, server (sending the request until the
+        # response headers arrive), download (reading the body, 0 for streamed responses) and decompress
+        timings = { 'connect': 0.0, 'tls': 0.0, 'server': 0.0, 'download': 0.0, 'decompress': 0.0 }
+        stream = kwargs.get('stream', False)
+        if self.compression:
+            kwargs = encode_body(kwargs, self.compression, self.compress_min_bytes, self.transfer_stats)
+            # read the compressed body below instead of letting urllib3 decode it
+            kwargs['stream'] = True
+        _phases.timings = timings
+        _phases.headers_at = None
+        try:
+            resp = self.http.request(method, url, **kwargs)
+        finally:
+            _phases.timings = None
+        if self.compression and not stream:
+            self._read_compressed(resp, timings)
+        done = time.perf_counter()
+        timings['server'] = max(resp.elapsed.total_seconds() - timings['connect'] - timings['tls'], 0.0)
+        if _phases.headers_at is not None and not stream:
+            timings['download'] = done - _phases.headers_at - timings['decompress']
+        resp.timings = timings
+        return resp
+
+    def _read_compressed(self, resp, timings):
+        try:
+            wire_body = resp.raw.read(decode_content=False)
+        except ReadTimeoutError as err:
+            resp.close()
+            raise requests.Timeout(err, response=resp)
+        except ProtocolError as err:
+            resp.close()
+            raise requests.ConnectionError(err, response=resp)
+        start = time.perf_counter()
+        resp._content = decompress(wire_body, resp.headers.get('Content-Encoding'))
+        resp._content_consumed = True
+        timings['decompress'] = time.perf_counter() - start
+        self.transfer_stats.record_response(len(resp._content), len(wire_body), timings['decompress'])
+        # connection goes back to the pool now the body's been read
+        resp.close()
+
+    def _headers_received(self, resp, **kwargs):
+        _phases.headers_at = time.perf_counter()
+
+    def close_host(self, url):
+        # close the pooled connections to one host, e.g. once nothing is going to call it for a while
+        parsed = urlparse(url)
+        port = parsed.port or (443 if parsed.scheme == 'https' else 80)
+        closed = 0
+        for adapter in set(self.http.adapters.values()):
+            pools = adapter.poolmanager.pools
+            # removing the pool from the container closes it
+            for key in [ key for key in pools.keys() if key.key_scheme == parsed.scheme and key.key_host == parsed.hostname and key.key_port == port ]:
+                pools.pop(key, None)
+                closed += 1
+        return closed
+
+    def close(self):
+        self.http.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
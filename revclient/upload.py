@@ -0,0 +1,313 @@
+import json
+import mimetypes
+import os
+import threading
+import time
+import uuid
+from typing import TYPE_CHECKING
+import requests
+from .bulk import BulkJob
+from .ratelimit import TokenBucket
+from .utils import write_json
+
+if TYPE_CHECKING:
+    from .client import RevClient
+
+MB = 1024 * 1024
+DEFAULT_CHUNK_SIZE = MB
+# how often (in bytes sent) to write upload progress to the checkpoint file
+CHECKPOINT_INTERVAL = 64 * 1024 * 1024
+
+def _quote(value):
+    return str(value).replace('"', '%22').replace('\r', '%0D').replace('\n', '%0A')
+
+def _read_into(file, view):
+    if hasattr(file, 'readinto'):
+        return file.readinto(view)
+    data = file.read(len(view))
+    view[:len(data)] = data
+    return len(data)
+
+#%%
+class MultipartEncoder():
+    # streams a multipart/form-data body, reading files chunk_size bytes at a time into one reused buffer.
+    # fields is a list of (name, value) where value is a str/bytes or a (filename, file, content_type) tuple.
+    # Files must be seekable so Content-Length can be sent up front
+    def __init__(self, fields, boundary = None, chunk_size = DEFAULT_CHUNK_SIZE, on_progress = None):
+        self.boundary = boundary or uuid.uuid4().hex
+        self.content_type = f'multipart/form-data; boundary={self.boundary}'
+        self.chunk_size = chunk_size
+        self.on_progress = on_progress
+
+        self.parts = []
+        length = 0
+        for name, value in fields:
+            if isinstance(value, tuple):
+                filename, file = value[0], value[1]
+                content_type = value[2] if len(value) > 2 else 'application/octet-stream'
+                header = f'--{self.boundary}\r\nContent-Disposition: form-data; name="{_quote(name)}"; filename="{_quote(filename)}"\r\nContent-Type: {content_type}\r\n\r\n'.encode()
+                offset = file.tell()
+                size = file.seek(0, os.SEEK_END) - offset
+                file.seek(offset)
+                self.parts.append((header, None, file, offset, size))
+            else:
+                if isinstance(value, str):
+                    value = value.encode()
+                header = f'--{self.boundary}\r\nContent-Disposition: form-data; name="{_quote(name)}"\r\n\r\n'.encode()
+                size = len(value)
+                self.parts.append((header, value, None, 0, size))
+            length += len(header) + size + 2
+
+        self.footer = f'--{self.boundary}--\r\n'.encode()
+        self.length = length + len(self.footer)
+
+    def __len__(self):
+        return self.length
+
+    def __iter__(self):
+        # chunks are views into a shared buffer - they're only valid until the next chunk is requested
+        buffer = memoryview(bytearray(self.chunk_size))
+        sent = 0
+        start = time.perf_counter()
+
+        for header, body, file, offset, size in self.parts:
+            yield header
+            sent += len(header)
+            if file is None:
+                yield body
+                sent += size
+            else:
+                # always restart from the beginning so the body can be re-sent on retry
+                file.seek(offset)
+                remaining = size
+                while remaining > 0:
+                    count = _read_into(file, buffer[:min(self.chunk_size, remaining)])
+                    if not count:
+                        raise IOError('file was truncated while uploading')
+                    yield buffer[:count]
+                    remaining -= count
+                    sent += count
+                    if self.on_progress:
+                        self.on_progress(sent, self.length, time.perf_counter() - start)
+            yield b'\r\n'
+            sent += 2
+
+        yield self.footer
+        sent += len(self.footer)
+        if self.on_progress:
+            self.on_progress(sent, self.length, time.perf_counter() - start)
+
+#%%
+class UploadCheckpoint():
+    # records upload progress in a json file, so a re-run can skip an upload that already completed
+    def __init__(self, path, source, size, mtime = None):
+        self.path = path
+        self.identity = { 'source': source, 'size': size, 'mtime': mtime }
+        self.state = {}
+        self._last_saved = 0
+
+        if os.path.exists(path):
+            with open(path, 'r') as fh:
+                state = json.load(fh)
+            # only trust the checkpoint if it's for the same file
+            if all(state.get(key) == value for key, value in self.identity.items()):
+                self.state = state
+
+        if not self.state:
+            self.state = dict(self.identity, bytes_sent=0, attempts=0, videoId=None)
+
+    @property
+    def video_id(self):
+        return self.state.get('videoId')
+
+    def start(self):
+        self.state['attempts'] += 1
+        self.state['bytes_sent'] = 0
+        self._last_saved = 0
+        self.save()
+
+    def progress(self, bytes_sent):
+        self.state['bytes_sent'] = bytes_sent
+        if bytes_sent - self._last_saved >= CHECKPOINT_INTERVAL:
+            self._last_saved = bytes_sent
+            self.save()
+
+    def complete(self, video_id):
+        self.state['videoId'] = video_id
+        self.save()
+
+    def save(self):
+        write_json(self.path, self.state)
+
+#%%
+class UploadResult():
+    def __init__(self, path, video_id = None, error = None, size = 0, seconds = 0, attempts = 0, skipped = False, failed_transcriptions = None):
+        self.path = path
+        self.video_id = video_id
+        self.error = error
+        self.size = size
+        self.seconds = seconds
+        self.attempts = attempts
+        self.skipped = skipped
+        # language -> error, for transcriptions that couldn't be added to an uploaded video
+        self.failed_transcriptions = failed_transcriptions or {}
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    @property
+    def partial(self):
+        # the video was uploaded, but some of its transcriptions weren't
+        return self.video_id is not None and bool(self.failed_transcriptions)
+
+    @property
+    def mb_per_sec(self):
+        return self.size / MB / self.seconds if self.seconds > 0 and not self.skipped else 0
+
+    def __repr__(self):
+        return f'UploadResult(path={self.path!r}, video_id={self.video_id!r}, ok={self.ok}, skipped={self.skipped}, partial={self.partial}, seconds={self.seconds:.2f})'
+
+class UploadReport():
+    def __init__(self, results, seconds):
+        self.results = results
+        self.seconds = seconds
+        uploaded = [ res for res in results if res.ok and not res.skipped ]
+        self.uploaded = len(uploaded)
+        self.skipped = sum(1 for res in results if res.skipped)
+        self.failed = sum(1 for res in results if not res.ok)
+        # uploaded videos missing a transcription - counted in failed too
+        self.partial = sum(1 for res in results if res.partial)
+        self.bytes = sum(res.size for res in uploaded)
+        self.mb_per_sec = self.bytes / MB / seconds if seconds > 0 else 0
+
+    def __repr__(self):
+        return f'UploadReport(uploaded={self.uploaded}, skipped={self.skipped}, failed={self.failed}, partial={self.partial}, seconds={self.seconds:.1f}, mb_per_sec={self.mb_per_sec:.2f})'
+
+#%%
+class UploadManager():
+    # uploads many files in parallel. items are (path, metadata) or (path, metadata, { language: transcription_path })
+    def __init__(self, client: 'RevClient', max_workers = 4, max_open_files = None, max_bytes_per_sec = None, retries = 2, manifest = None, chunk_size = DEFAULT_CHUNK_SIZE):
+        self.client = client
+        self.max_workers = max_workers
+        self.open_files = threading.BoundedSemaphore(max_open_files or max_workers)
+        # shared by all upload threads - tokens are bytes
+        self.limiter = TokenBucket(max_bytes_per_sec, chunk_size) if max_bytes_per_sec else None
+        self.retries = retries
+        self.chunk_size = chunk_size
+        self.manifest = manifest
+        self.manifest_lock = threading.Lock()
+        # (path, size, mtime) -> videoId of uploads that already completed
+        self.completed = {}
+        # (path, size, mtime) -> languages of transcriptions already added
+        self.transcribed = {}
+
+        if manifest and os.path.exists(manifest):
+            with open(manifest, 'r') as fh:
+                for line in fh:
+                    if line.strip():
+                        entry = json.loads(line)
+                        key = (entry['path'], entry['size'], entry['mtime'])
+                        self.completed[key] = entry['videoId']
+                        if 'transcription' in entry:
+                            self.transcribed.setdefault(key, set()).add(entry['transcription'])
+
+    def upload_directory(self, path, metadata = {}, extensions = ('.mp4', '.mov', '.m4v', '.avi', '.wmv', '.mkv', '.webm'), on_complete = None) -> UploadReport:
+        # metadata is a dict applied to every file (title defaults to the filename) or a function of the file path
+        def items():
+            for entry in sorted(os.scandir(path), key=lambda entry: entry.name):
+                if entry.is_file() and entry.name.lower().endswith(extensions):
+                    if callable(metadata):
+                        yield entry.path, metadata(entry.path)
+                    else:
+                        yield entry.path, dict({ 'title': os.path.splitext(entry.name)[0] }, **metadata)
+        return self.run(items(), on_complete)
+
+    def run(self, items, on_complete = None) -> UploadReport:
+        tasks = ((item[0], item) for item in items)
+        job = BulkJob(self._upload, tasks, self.max_workers)
+
+        results = []
+        start = time.perf_counter()
+        for res in job:
+            result = res.value if res.ok else UploadResult(res.key, error=res.error, seconds=res.elapsed)
+            results.append(result)
+            if on_complete:
+                on_complete(result)
+        return UploadReport(results, time.perf_counter() - start)
+
+    def _upload(self, path, metadata, transcriptions = None):
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        key = (path, stat.st_size, stat.st_mtime)
+        transcriptions = transcriptions or {}
+        start = time.perf_counter()
+        attempts = 0
+
+        video_id = self.completed.get(key)
+        if video_id is None:
+            def upload():
+                with self.open_files:
+                    return self._upload_file(path, metadata)
+            video_id, attempts = self._retry(upload)
+            # recorded right away, so a failed transcription never leads to the video being uploaded again
+            self._record(key, { 'videoId': video_id, 'seconds': round(time.perf_counter() - start, 3) })
+
+        done = self.transcribed.get(key, set())
+        pending = { language: transcription_path for language, transcription_path in transcriptions.items() if language not in done }
+        if attempts == 0 and not pending:
+            return UploadResult(path, video_id, size=stat.st_size, skipped=True)
+
+        failed = {}
+        for language, transcription_path in pending.items():
+            try:
+                self._retry(lambda: self._upload_transcription(video_id, language, transcription_path))
+            except (requests.RequestException, IOError) as err:
+                failed[language] = err
+                continue
+            self._record(key, { 'videoId': video_id, 'transcription': language })
+
+        error = next(iter(failed.values())) if failed else None
+        return UploadResult(path, video_id, error=error, size=stat.st_size, seconds=time.perf_counter() - start, attempts=attempts, skipped=attempts == 0, failed_transcriptions=failed)
+
+    def _retry(self, fn):
+        # returns (result, attempts)
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                return fn(), attempt
+            except (requests.ConnectionError, requests.Timeout, requests.HTTPError) as err:
+                status = err.response.status_code if getattr(err, 'response', None) is not None else None
+                # don't retry bad requests - only network errors, throttling and server errors
+                if attempt > self.retries or (status and status < 500 and status != 429):
+                    raise
+                time.sleep(2 ** attempt)
+
+    def _upload_file(self, path, metadata):
+        last_sent = [0]
+        def throttle(bytes_sent, total, elapsed):
+            # a retried or re-authenticated request sends the body again from the start
+            if bytes_sent < last_sent[0]:
+                last_sent[0] = 0
+            if bytes_sent > last_sent[0]:
+                self.limiter.acquire(bytes_sent - last_sent[0])
+                last_sent[0] = bytes_sent
+
+        with open(path, 'rb') as file:
+            return self.client.video.upload(file, metadata, filename=os.path.basename(path), content_type=mimetypes.guess_type(path)[0], on_progress=throttle if self.limiter else None, chunk_size=self.chunk_size)
+
+    def _upload_transcription(self, video_id, language, transcription_path):
+        with open(transcription_path, 'rb') as file:
+            self.client.video.upload_transcription(video_id, file, language, os.path.basename(transcription_path))
+
+    def _record(self, key, entry):
+        # one manifest line per uploaded video, and one per transcription added to it
+        with self.manifest_lock:
+            self.completed[key] = entry['videoId']
+            if 'transcription' in entry:
+                self.transcribed.setdefault(key, set()).add(entry['transcription'])
+            if not self.manifest:
+                return
+            with open(self.manifest, 'a') as fh:
+                fh.write(json.dumps(dict({ 'path': key[0], 'size': key[1], 'mtime': key[2] }, **entry)) + '\n')
@@ -1,5 +1,12 @@
+import json
+import math
+import os
+import queue
 import re
-from datetime import datetime, timezone
+import sys
+import threading
+from datetime import date, datetime, timedelta, timezone
+from functools import lru_cache
 from typing import TYPE_CHECKING
 
 if TYPE_CHECKING:
@@ -8,13 +15,61 @@ if TYPE_CHECKING:
 MAX_INT = (2**31 - 1)
 
 #%%
-iso_re = re.compile('([\d:T-]+)(\.\d+)?(\+\d+:\d+|Z)?')
+# full ISO-8601 timestamp - extended or basic format, any number of fraction digits, Z or +HH[:MM] offset
+iso_re = re.compile(r'^(\d{4})-?(\d\d)-?(\d\d)(?:[T ](\d\d)(?::?(\d\d)(?::?(\d\d)(?:[.,](\d+))?)?)?)?\s*(Z|z|[+-]\d\d(?::?\d\d)?)?$')
+# date fields in Rev video/search results
+DATE_FIELDS = ('whenUploaded', 'whenPublished', 'whenModified', 'expirationDate', 'lastViewed')
 
-def parse_iso(val):
-    cleaned = iso_re.match(val)
-    return datetime.fromisoformat((cleaned[1] + '.000+00:00') if cleaned else val)
+# fromisoformat only accepts Z and more than 6 fraction digits from python 3.11
+_fromisoformat_z = sys.version_info >= (3, 11)
+
+def _parse_iso(val):
+    # fast path - fromisoformat is implemented in C
+    try:
+        parsed = datetime.fromisoformat(val if _fromisoformat_z or val[-1:] not in ('Z', 'z') else val[:-1] + '+00:00')
+    except ValueError:
+        match = iso_re.match(val.strip())
+        if not match:
+            raise ValueError(f'Invalid ISO-8601 date: {val!r}')
+        year, month, day, hour, minute, second, fraction, offset = match.groups()
+        tz = timezone.utc
+        if offset and offset not in ('Z', 'z'):
+            sign = -1 if offset[0] == '-' else 1
+            digits = offset[1:].replace(':', '')
+            tz = timezone(sign * timedelta(hours=int(digits[:2]), minutes=int(digits[2:4] or 0)))
+        # more than microsecond precision is truncated
+        micros = int((fraction or '0')[:6].ljust(6, '0'))
+        parsed = datetime(int(year), int(month), int(day), int(hour or 0), int(minute or 0), int(second or 0), micros, tz)
+    # no offset means UTC
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+# timezone-aware datetime, keeping the offset and fractional seconds. Cached since the same
+# timestamps come up again and again in search results (whenModified == whenUploaded etc)
+parse_iso = lru_cache(maxsize=8192)(_parse_iso)
+
+def parse_iso_many(values):
+    # parse a batch of timestamps (e.g. one page of results), each distinct value only once. None stays None
+    parsed = { None: None }
+    for val in values:
+        if val not in parsed:
+            parsed[val] = parse_iso(val)
+    return [ parsed[val] for val in values ]
+
+def parse_date_fields(items, fields = DATE_FIELDS):
+    # replace date strings in a list of dicts with datetimes, in place
+    for field in fields:
+        values = [ item.get(field) for item in items ]
+        for item, val in zip(items, parse_iso_many(values)):
+            if val is not None:
+                item[field] = val
+    return items
 
 def format_iso(val):
+    # always UTC, millisecond precision: 2021-01-02T03:04:05.678Z
+    if val.tzinfo is None:
+        val = val.replace(tzinfo=timezone.utc)
+    elif val.utcoffset():
+        val = val.astimezone(timezone.utc)
     return val.isoformat(timespec='milliseconds').replace('+00:00', 'Z')
 
 def now_iso():
@@ -22,8 +77,10 @@ def now_iso():
 
 def coerce_iso(val):
     if isinstance(val, datetime):
-        return val
-    
+        return val if val.tzinfo else val.replace(tzinfo=timezone.utc)
+    if isinstance(val, date):
+        return datetime(val.year, val.month, val.day, tzinfo=timezone.utc)
+    return parse_iso(val)
 
 def omit(items, omit_keys, asItems=False):
     if isinstance(items, dict):
@@ -34,6 +91,57 @@ def omit(items, omit_keys, asItems=False):
     else:
         return dict(result)
 
+def write_json(path, value):
+    # write to a temp file then rename, so a crash never leaves a half-written file behind
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w') as fh:
+        json.dump(value, fh)
+    os.replace(tmp_path, path)
+
+def percentile(sorted_values, pct):
+    # nearest-rank percentile of an already sorted list
+    if not sorted_values:
+        return None
+    rank = max(math.ceil(pct / 100 * len(sorted_values)) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+def read_ahead(iterable, depth = 1):
+    # consume iterable on a background thread, holding at most depth items ahead of the caller
+    buffer = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+    end = object()
+
+    def put(entry):
+        while not stop.is_set():
+            try:
+                buffer.put(entry, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for item in iterable:
+                if not put((item, None)):
+                    return
+            put((end, None))
+        except Exception as err:
+            put((end, err))
+
+    threading.Thread(target=produce, daemon=True).start()
+    try:
+        while True:
+            item, err = buffer.get()
+            if item is end:
+                if err:
+                    raise err
+                return
+            yield item
+    finally:
+        # let the producer exit if the caller stops early
+        stop.set()
+
 
 
 class NamespacedClient(object):
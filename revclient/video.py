@@ -3,101 +3,198 @@ from io import IOBase
 import json
 from posixpath import join
 import re
+import os
 from os.path import basename
 from typing import Dict
+import requests
 from .utils import NamespacedClient, format_iso, parse_iso
+from .bulk import BulkJob, DEFAULT_BULK_WORKERS
+from .upload import MultipartEncoder, UploadCheckpoint, DEFAULT_CHUNK_SIZE
+from .jsonstream import projection
+from .search import parallel_search, DEFAULT_WINDOW_RESULTS
+from .sync import sync_videos, SyncResult
+from .store import VideoStore
+from .download import FileDownload, DownloadResult, DEFAULT_DOWNLOAD_CHUNK_SIZE, DEFAULT_RANGE_SIZE, DEFAULT_DOWNLOAD_WORKERS
+from .watch import wait_for_status, WaitResult, DEFAULT_MIN_POLL_INTERVAL, DEFAULT_MAX_POLL_INTERVAL, DEFAULT_WATCH_WORKERS, DEFAULT_PROCESSING_BYTES_PER_SEC
 
 is_date_re = re.compile('\d\d\d\d-\d\d-\d\d')
 
-def append_path(key, val):
-    if isinstance(val, (list, tuple)):
-        return f'/{key.title()}/-'
-    else:
-        return f'/{key.title()}'
+# fields that can be changed with video.patch, and how their values are sent
+PATCH_FIELDS = (
+    ('Title', 'value'),
+    ('Categories', 'array'),
+    ('Description', 'value'),
+    ('Tags', 'array'),
+    ('IsActive', 'bool'),
+    ('ExpirationDate', 'date'),
+    ('EnableRatings', 'bool'),
+    ('EnableDownloads', 'bool'),
+    ('EnableComments', 'bool'),
+    ('VideoAccessControl', 'value'),
+    ('AccessControlEntities', 'array'),
+    ('CustomFields', 'array'),
+    ('Unlisted', 'bool'),
+    ('UserTags', 'array')
+)
+# case-insensitive field name -> (path, kind), so 'isActive', 'IsActive' and 'isactive' all map to /IsActive
+patch_schema = { name.lower(): (f'/{name}', kind) for name, kind in PATCH_FIELDS }
+
+def migrate_params(username = None, when_uploaded = None, when_published = None) -> Dict:
+    params = {}
+    if username:
+        params['UserName'] = username
+    if when_uploaded:
+        if (isinstance(when_uploaded, datetime)):
+            when_uploaded = format_iso(when_uploaded)
+        params['whenUploaded'] = when_uploaded
+    if when_published:
+        if isinstance(when_published, datetime):
+            # only want date part (YYYY-MM-DD), so coerce into correct format
+            when_published = format_iso(when_published)
+        elif not isinstance(when_published, str):
+            raise TypeError("Invalid value for when_published")
+        elif not is_date_re.fullmatch(when_published):
+            when_published = format_iso(parse_iso(when_published))
+        
+            # only date part (0->10)
+        params['whenPublished'] = when_published[:10]
+    return params
+
+def patch_date(val):
+    # truncate to just the date (YYYY-MM-DD) - datetimes and timestamps are converted to UTC first
+    if isinstance(val, datetime):
+        val = format_iso(val)
+    elif not is_date_re.fullmatch(val):
+        val = format_iso(parse_iso(val))
+    return val[0:10]
+
+def patch_operations(metadata: dict, strict = False):
+    operations = []
+    invalid = {}
+
+    for key, val in metadata.items():
+        field = patch_schema.get(key.lower()) if isinstance(key, str) else None
+        if field is None:
+            if strict:
+                raise TypeError(f'Invalid attribute {key} for Patch operation')
+            invalid[key] = val
+            continue
+
+        path, kind = field
+        if kind == 'array':
+            # array items have values added to the end by appending /- to the key
+            if isinstance(val, (list, tuple)):
+                path = f'{path}/-'
+        elif kind == 'bool':
+            val = bool(val)
+        elif kind == 'date':
+            # nothing to set
+            if not val:
+                continue
+            val = patch_date(val)
+        operations.append({ 'op': 'add', 'path': path, 'value': val })
+    return operations, invalid
+
+def prepare_patches(patches: dict, strict = False) -> dict:
+    # { video_id: metadata } -> { video_id: (operations, invalid) }, ready for video.bulk_send_patches.
+    # Everything is validated before any request is sent
+    return { video_id: patch_operations(metadata, strict) for video_id, metadata in patches.items() }
+
+def upload_args(file, metadata: dict, filename = None, content_type = None, default_uploader = None):
+    if not 'uploader' in metadata:
+        if default_uploader:
+            metadata = metadata.copy()
+            metadata['uploader'] = default_uploader
+        else:
+            raise TypeError('metadata must include uploader parameter')
+
+    if isinstance(file, tuple):
+        if len(file) >= 3:
+            if not content_type:
+                content_type = file[2]
+        if len(file) >= 2:
+            if not filename:
+                filename = file[0]
+            file = file[1]
+        else:
+            file = file[0]
+
+    if isinstance(file, str):
+        if not filename:
+            filename = basename(file)
+        file = open(file, 'rb')
+
+    if not filename:
+        filename = 'video'
+    # just assume mp4 if not otherwise found
+    if not content_type:
+        content_type = 'video/mp4'
+        filename = f'{filename}.mp4'
+
+    # COMBAK no guarantees filename/content_type is right
+    files = { 'VideoFile': (filename, file, content_type) }
+    data = { 'video': json.dumps(metadata) }
+    return files, data
+
+def transcription_args(file, language: str = 'en', filename: str = 'subtitle.srt', content_type: str = 'application/x-subrip'):
+    # set vars from file if already in requests format
+    if isinstance(file, tuple):
+        if len(file) >= 3:
+            filename, file, content_type = file
+        elif len(file) >= 2:
+            filename, file = file
+        else:
+            file = file[0]
+    
+    # Rev expects correct filename format, so assume srt if no extension
+    if not (filename.endswith('srt') or filename.endswith('vtt')):
+        filename += '.srt'
+    
+    # validate language
+    supported_languages = { 'de', 'en', 'en-gb', 'es-es', 'es-419', 'es', 'fr', 'fr-ca', 'id', 'it', 'ko', 'ja', 'nl', 'no', 'pl', 'pt', 'pt-br', 'th', 'tr', 'fi', 'sv', 'ru', 'el', 'zh', 'zh-tw', 'zh-cmn-hans' }
+
+    language = language.lower()
+    if not language in supported_languages:
+        # try removing trailing language specifier
+        if language[:2] in supported_languages:
+            language = language[:2]
+        else:
+            raise TypeError(f'Invalid language {language} - supported values are { supported_languages}')
+
+    json_payload = {'files': [{ 'language': language, 'fileName': filename }]}
+
+    files = {'File': (filename, file, content_type)}
+    data = {'TranscriptionFiles': json.dumps(json_payload)}
+    return files, data
 
 class VideoClient(NamespacedClient):
+    # optional local copy of video metadata used by local_search
+    store: VideoStore = None
+
     def status(self, video_id: str) -> Dict:
         return self.client.get(f'/api/v2/videos/{video_id}/status')
 
     def details(self, video_id: str) -> Dict:
         return self.client.get(f'/api/v2/videos/{video_id}/details')
 
+    # poll many videos' status from one scheduler until each reaches target, see watch.wait_for_status
+    def wait_for_status(self, video_ids, target = 'Ready', timeout = None, min_interval = DEFAULT_MIN_POLL_INTERVAL, max_interval = DEFAULT_MAX_POLL_INTERVAL, rate = None, max_workers = DEFAULT_WATCH_WORKERS, on_complete = None, on_change = None, processing_bytes_per_sec = DEFAULT_PROCESSING_BYTES_PER_SEC) -> WaitResult:
+        return wait_for_status(self, video_ids, target, timeout, min_interval, max_interval, rate, max_workers, on_complete, on_change, processing_bytes_per_sec)
+
     def update(self, video_id: str, metadata: dict) -> None:
         self.client.put(f'/api/v2/videos/{video_id}', metadata)
 
     def migrate(self, video_id: str, username = None, when_uploaded = None, when_published = None) -> Dict:
-        params = {}
-        if username:
-            params['UserName'] = username
-        if when_uploaded:
-            if (isinstance(when_uploaded, datetime)):
-                when_uploaded = format_iso(when_uploaded)
-            params['whenUploaded'] = when_uploaded
-        if when_published:
-            if isinstance(when_published, datetime):
-                # only want date part (YYYY-MM-DD), so coerce into correct format
-                when_published = format_iso(when_published)
-            elif not isinstance(when_published, str):
-                raise TypeError("Invalid value for when_published")
-            elif not is_date_re.fullmatch(when_published):
-                when_published = format_iso(parse_iso(when_published))
-            
-                # only date part (0->10)
-            params['whenPublished'] = when_published[:10]
+        params = migrate_params(username, when_uploaded, when_published)
         self.client.put(f'/api/v2/videos/{video_id}/migration', json = params)
 
     def patch(self, video_id: str, metadata: dict, strict = False) -> None:
-        def add_op(key, val):
-            return { 'op': 'add', 'path': f'/{key.title()}', 'value': val }
-        def arr_op(key, val):
-            # array items have values added to the end by appending /- to the key
-            if isinstance(val, (list, tuple)):
-                return add_op(f'{key}/-', val)
-            else:
-                return add_op(key, val)
-        def bool_op(key, val):
-            add_op(key, bool(val))
-        def date_op(key, val):
-            if not val:
-                return []
-            if isinstance(val, datetime):
-                val = format_iso(val)
-            elif not is_date_re.match(val):
-                val = format_iso(parse_iso(val))
-            # truncate datetime string to just date (YYYY-MM-DD)
-            return add_op(key, val[0:10])
-
-
-        schema = dict(
-            # /Title
-            Title = add_op,
-            Categories = arr_op,
-            Description = add_op,
-            Tags = arr_op,
-            IsActive = bool_op,
-            ExpirationDate = date_op,
-            EnableRatings = bool_op,
-            EnableDownloads = bool_op,
-            EnableComments = bool_op,
-            VideoAccessControl = add_op,
-            AccessControlEntities = arr_op,
-            CustomFields = arr_op,
-            Unlisted = bool_op,
-            UserTags = arr_op
-        )
-        
-        operations = []
-        invalid = {}
-        
-        for key, val in metadata.items():
-            op_func = schema[key]
-            if op_func:
-                operations.append(op_func(key, val))
-            else:
-                if strict:
-                    raise TypeError(f'Invalid attribute {key} for Patch operation')
-                invalid[key] = val
-        
+        return self.send_patch(video_id, patch_operations(metadata, strict))
+
+    def send_patch(self, video_id: str, document) -> None:
+        # document is (operations, invalid) from patch_operations / prepare_patches
+        operations, invalid = document
+
         if (len(operations) > 0):
             self.client.patch(f'/api/v2/videos/{video_id}', json=operations)
         
@@ -106,85 +203,164 @@ class VideoClient(NamespacedClient):
         else:
             return {}
     
-    def upload(self, file, metadata: dict, filename = None, content_type = None):
-        if not 'uploader' in metadata:
-            if self.client.session.username:
-                metadata = metadata.copy()
-                metadata['uploader'] = self.client.session.username
-            else:
-                raise TypeError('metadata must include uploader parameter')
-
-        if isinstance(file, tuple):
-            if len(file) >= 3:
-                if not content_type:
-                    content_type = file[2]
-            if len(file) >= 2:
-                if not filename:
-                    filename = file[0]
-                file = file[1]
-            else:
-                file = file[0]
-
-        if isinstance(file, str):
-            if not filename:
-                filename = basename(file)
-            file = open(file, 'rb')
+    def upload(self, file, metadata: dict, filename = None, content_type = None, on_progress = None, chunk_size = DEFAULT_CHUNK_SIZE, checkpoint = None, retries = 0):
+        files, data = upload_args(file, metadata, filename, content_type, self.client.session.username)
+        video_file = files['VideoFile'][1]
 
-        if not filename:
-            filename = 'video'
-        # just assume mp4 if not otherwise found
-        if not content_type:
-            content_type = 'video/mp4'
-            filename = f'{filename}.mp4'
+        try:
+            encoder = MultipartEncoder(list(data.items()) + list(files.items()), chunk_size=chunk_size)
+        except (OSError, ValueError):
+            # not seekable (pipe etc.) - fall back to building the body in memory
+            resp = self.client.post('/api/v2/uploads/videos', files=files, data=data)
+            return resp.get('videoId')
+
+        tracker = None
+        if checkpoint:
+            try:
+                mtime = os.fstat(video_file.fileno()).st_mtime
+            except (AttributeError, OSError, ValueError):
+                mtime = None
+            tracker = UploadCheckpoint(checkpoint, getattr(video_file, 'name', files['VideoFile'][0]), len(encoder), mtime)
+            if tracker.video_id:
+                return tracker.video_id
 
-        # COMBAK no guarantees filename/content_type is right
-        files = { 'VideoFile': (filename, file, content_type) }
-        data = { 'video': json.dumps(metadata) }
+        def report(bytes_sent, total, elapsed):
+            if tracker:
+                tracker.progress(bytes_sent)
+            if on_progress:
+                on_progress(bytes_sent, total, elapsed)
+        encoder.on_progress = report
 
-        resp = self.client.post('/api/v2/uploads/videos', files=files, data=data)
-        return resp.get('videoId')
+        # Rev doesn't accept partial uploads, so a network error restarts the body from the beginning of the file
+        for attempt in range(retries + 1):
+            if tracker:
+                tracker.start()
+            try:
+                resp = self.client.post('/api/v2/uploads/videos', data=encoder, options={ 'headers': { 'Content-Type': encoder.content_type } })
+                break
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt >= retries:
+                    raise
+
+        video_id = resp.get('videoId')
+        if tracker:
+            tracker.complete(video_id)
+        return video_id
 
     def upload_transcription(self, video_id: str, file, language: str = 'en', filename: str = 'subtitle.srt', content_type: str = 'application/x-subrip'):
-        # set vars from file if already in requests format
-        if isinstance(file, tuple):
-            if len(file) >= 3:
-                filename, file, content_type = file
-            elif len(file) >= 2:
-                filename, file = file
-            else:
-                file = file[0]
-        
-        # Rev expects correct filename format, so assume srt if no extension
-        if not (filename.endswith('srt') or filename.endswith('vtt')):
-            filename += '.srt'
+        files, data = transcription_args(file, language, filename, content_type)
         
-        # validate language
-        supported_languages = { 'de', 'en', 'en-gb', 'es-es', 'es-419', 'es', 'fr', 'fr-ca', 'id', 'it', 'ko', 'ja', 'nl', 'no', 'pl', 'pt', 'pt-br', 'th', 'tr', 'fi', 'sv', 'ru', 'el', 'zh', 'zh-tw', 'zh-cmn-hans' }
+        return self.client.post(f'/api/uploads/transcription-files/{video_id}', files = files, data = data)
 
-        language = language.lower()
-        if not language in supported_languages:
-            # try removing trailing language specifier
-            if language[:2] in supported_languages:
-                language = language[:2]
-            else:
-                raise TypeError(f'Invalid language {language} - supported values are { supported_languages}')
+    def download(self, video_id: str, dest, chunk_size = DEFAULT_DOWNLOAD_CHUNK_SIZE, parallel = 1, range_size = DEFAULT_RANGE_SIZE, on_progress = None, retries = 2) -> DownloadResult:
+        # dest is a file path, or a directory to save {video_id}.{ext} in
+        return FileDownload(self.client, f'/api/v2/videos/{video_id}/download', dest, video_id, chunk_size, parallel, range_size, on_progress, retries).run()
 
-        json_payload = {'files': [{ 'language': language, 'fileName': filename }]}
+    def download_thumbnail(self, video_id: str, dest, retries = 2) -> DownloadResult:
+        url = self.details(video_id).get('thumbnailUrl')
+        if not url:
+            raise TypeError(f'video {video_id} has no thumbnail')
+        return FileDownload(self.client, url, dest, f'{video_id}-thumbnail', retries=retries).run()
 
-        files = {'File': (filename, file, content_type)}
-        data = {'TranscriptionFiles': json.dumps(json_payload)}
-        
-        return self.client.post(f'/api/uploads/transcription-files/{video_id}', files = files, data = data)
+    def download_transcription(self, video_id: str, transcription_id: str, dest, retries = 2) -> DownloadResult:
+        return FileDownload(self.client, f'/api/v2/videos/{video_id}/transcription-files/{transcription_id}', dest, f'{video_id}-{transcription_id}', retries=retries).run()
+
+
+    def bulk_details(self, video_ids, max_workers = DEFAULT_BULK_WORKERS, ordered = False, on_progress = None) -> BulkJob:
+        return self._bulk(self.details, video_ids, max_workers, ordered, on_progress)
+
+    def bulk_status(self, video_ids, max_workers = DEFAULT_BULK_WORKERS, ordered = False, on_progress = None) -> BulkJob:
+        return self._bulk(self.status, video_ids, max_workers, ordered, on_progress)
 
+    def bulk_update(self, updates: dict, max_workers = DEFAULT_BULK_WORKERS, ordered = False, on_progress = None) -> BulkJob:
+        return self._bulk(self.update, updates, max_workers, ordered, on_progress)
 
-    def search_stream(self, query: dict = {}, max_results = None, on_page = None):
-        pager = self.client._scroll('/api/v2/videos/search', 'totalVideos', 'videos', query, max_results=max_results)
+    def bulk_patch(self, patches: dict, strict = False, max_workers = DEFAULT_BULK_WORKERS, ordered = False, on_progress = None) -> BulkJob:
+        return self.bulk_send_patches(prepare_patches(patches, strict), max_workers, ordered, on_progress)
+
+    def bulk_send_patches(self, documents: dict, max_workers = DEFAULT_BULK_WORKERS, ordered = False, on_progress = None) -> BulkJob:
+        # documents is the output of prepare_patches
+        return self._bulk(self.send_patch, documents, max_workers, ordered, on_progress)
+
+    def bulk_migrate(self, migrations: dict, max_workers = DEFAULT_BULK_WORKERS, ordered = False, on_progress = None) -> BulkJob:
+        # migrations is { video_id: { 'username': ..., 'when_uploaded': ..., 'when_published': ... } }
+        return self._bulk(lambda video_id, options: self.migrate(video_id, **options), migrations, max_workers, ordered, on_progress)
+
+    def bulk_download(self, video_ids, dest_dir, max_workers = DEFAULT_DOWNLOAD_WORKERS, parallel = 1, range_size = DEFAULT_RANGE_SIZE, chunk_size = DEFAULT_DOWNLOAD_CHUNK_SIZE, skip_existing = True, ordered = False, on_progress = None) -> BulkJob:
+        # at most max_workers files at once, each split into up to parallel ranges
+        os.makedirs(dest_dir, exist_ok=True)
+        # files already downloaded by an earlier run, by video id - listed once rather than per video
+        existing = {}
+        if skip_existing:
+            for entry in os.scandir(dest_dir):
+                if entry.is_file() and not entry.name.endswith(('.part', '.part.json')):
+                    existing[os.path.splitext(entry.name)[0]] = entry.path
+
+        def download(video_id):
+            if video_id in existing:
+                return DownloadResult(existing[video_id], os.path.getsize(existing[video_id]), skipped=True)
+            return self.download(video_id, dest_dir, chunk_size, parallel, range_size, retries=2)
+        return self._bulk(download, video_ids, max_workers, ordered, on_progress)
+
+    def _bulk(self, fn, items, max_workers, ordered, on_progress):
+        total = len(items) if hasattr(items, '__len__') else None
+        # dict input is { video_id: argument }, otherwise an iterable of video ids
+        if isinstance(items, dict):
+            tasks = ((video_id, (video_id, value)) for video_id, value in items.items())
+        else:
+            tasks = ((video_id, (video_id,)) for video_id in items)
+        return BulkJob(fn, tasks, max_workers, ordered, on_progress, total)
+
+    def search_stream(self, query: dict = {}, max_results = None, on_page = None, prefetch = 0, fields = None, compact = False, incremental = False):
+        project = projection(fields, compact)
+
+        if incremental:
+            if prefetch:
+                raise TypeError('prefetch is not supported with incremental decoding')
+            videos = self.client._scroll_items('/api/v2/videos/search', 'totalVideos', 'videos', query, max_results=max_results, on_page=on_page)
+        else:
+            videos = self._search_pages(query, max_results, on_page, prefetch)
+
+        if project:
+            videos = map(project, videos)
+        for vid in videos:
+            yield vid
+
+    def _search_pages(self, query, max_results, on_page, prefetch):
+        pager = self.client._scroll('/api/v2/videos/search', 'totalVideos', 'videos', query, max_results=max_results, prefetch=prefetch)
 
         for page in pager:
             if on_page:
                 on_page(page)
-            for vid in page.items:
+            for vid in page['items']:
                 yield vid
         
-    def search(self, query: dict = {}, max_results = None, on_page = None):
-        return [ vid for vid in self.search_stream(query, max_results, on_page) ]
\ No newline at end of file
+    def search_parallel(self, query: dict = {}, partitions = 4, max_workers = None, max_window_results = DEFAULT_WINDOW_RESULTS, fields = None, compact = False):
+        # results come back in no particular order
+        project = projection(fields, compact)
+        videos = parallel_search(self.client, query, partitions, max_workers, max_window_results)
+
+        if project:
+            videos = map(project, videos)
+        for vid in videos:
+            yield vid
+
+    # fetch only videos changed since the last sync, tracked in a local checkpoint file
+    def sync(self, checkpoint: str, query: dict = {}, on_change = None, on_delete = None, detect_deletions = False, date_field = 'whenModified', from_param = 'fromModifiedDate', before_save = None) -> SyncResult:
+        return sync_videos(self, checkpoint, query, on_change, on_delete, detect_deletions, date_field, from_param, before_save)
+
+    def use_store(self, store: VideoStore) -> VideoStore:
+        self.store = store
+        return store
+
+    # answer a search from the local store instead of Rev
+    def local_search(self, category = None, uploader = None, tag = None, uploaded_after = None, uploaded_before = None, has_transcription = None, limit = None):
+        if not self.store:
+            raise TypeError('no local store - call video.use_store(VideoStore(path)) first')
+        # keep the copy warm
+        if self.store.max_age is not None and (self.store.age is None or self.store.age > self.store.max_age):
+            self.store.refresh(self)
+        return self.store.query(category, uploader, tag, uploaded_after, uploaded_before, has_transcription, limit)
+
+    def search(self, query: dict = {}, max_results = None, on_page = None, prefetch = 0, fields = None, compact = False, incremental = False):
+        return [ vid for vid in self.search_stream(query, max_results, on_page, prefetch, fields, compact, incremental) ]
\ No newline at end of file
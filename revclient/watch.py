@@ -0,0 +1,199 @@
+import heapq
+import queue
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING
+from requests import HTTPError
+from .ratelimit import TokenBucket
+from .utils import percentile
+
+if TYPE_CHECKING:
+    from .video import VideoClient
+
+# statuses a video won't move on from, unless one is the target
+FAILED_STATUSES = ('UploadFailed', 'DownloadFailed', 'ProcessingFailed', 'ReadyButProcessingFailed', 'RecordingFailed', 'Canceled')
+
+# bounds on the wait between two status calls for the same video, in seconds
+DEFAULT_MIN_POLL_INTERVAL = 2
+DEFAULT_MAX_POLL_INTERVAL = 60
+# rough transcoding speed, used to guess when a video of a known size will be done
+DEFAULT_PROCESSING_BYTES_PER_SEC = 2 * 1024 * 1024
+DEFAULT_WATCH_WORKERS = 4
+
+#%%
+class VideoWait():
+    __slots__ = ('video_id', 'size', 'status', 'progress', 'polls', 'started', 'finished', 'failed', 'error', 'last_poll', 'remaining')
+
+    def __init__(self, video_id, size = None, started = None):
+        self.video_id = video_id
+        # file size in bytes, if known
+        self.size = size
+        self.status = None
+        # overallProgress from the last status call, 0 - 1
+        self.progress = None
+        self.polls = 0
+        self.started = started
+        self.finished = None
+        self.failed = False
+        # last exception from a status call
+        self.error = None
+        # (time, progress) of the last poll, to estimate how fast progress is moving
+        self.last_poll = None
+        # estimated seconds until processing is done, from the progress made between the last two polls
+        self.remaining = None
+
+    @property
+    def done(self):
+        return self.finished is not None
+
+    @property
+    def seconds(self):
+        # time from the start of the wait until the target status was seen
+        return self.finished - self.started if self.finished is not None else None
+
+    def update(self, now, status, progress):
+        self.remaining = None
+        if self.last_poll and progress is not None and 0 < progress < 1:
+            previous_time, previous_progress = self.last_poll
+            if previous_progress is not None and progress > previous_progress:
+                self.remaining = (1 - progress) * (now - previous_time) / (progress - previous_progress)
+        self.last_poll = (now, progress)
+        self.progress = progress
+        self.status = status
+
+    def next_interval(self, now, min_interval, max_interval, processing_bytes_per_sec):
+        elapsed = now - self.started
+        if self.remaining is not None:
+            # progress so far says when it'll be done - check then
+            interval = self.remaining
+        elif self.size and self.size / processing_bytes_per_sec > elapsed:
+            # guessing from the size alone is rough, so go halfway and refine from the progress seen then
+            interval = (self.size / processing_bytes_per_sec - elapsed) / 2
+        else:
+            # nothing to go on, or past the estimate - back off so each poll comes 1.5x later than the last
+            interval = elapsed / 2
+        return min(max(interval, min_interval), max_interval)
+
+    def __repr__(self):
+        return f'VideoWait({self.video_id!r}, status={self.status!r}, polls={self.polls}, seconds={self.seconds})'
+
+class WaitResult():
+    def __init__(self, videos, calls, seconds):
+        # video id -> VideoWait
+        self.videos = videos
+        self.calls = calls
+        self.seconds = seconds
+
+    @property
+    def ready(self):
+        return [ wait for wait in self.videos.values() if wait.done and not wait.failed ]
+
+    @property
+    def failed(self):
+        return [ wait for wait in self.videos.values() if wait.failed ]
+
+    @property
+    def pending(self):
+        # still processing when the timeout was reached
+        return [ wait for wait in self.videos.values() if not wait.done ]
+
+    @property
+    def calls_per_video(self):
+        finished = sum(1 for wait in self.videos.values() if wait.done)
+        return self.calls / finished if finished else float(self.calls)
+
+    def time_to_ready(self, pcts = (50, 95, 100)):
+        values = sorted(wait.seconds for wait in self.ready)
+        return { f'p{pct}': percentile(values, pct) for pct in pcts }
+
+    def __repr__(self):
+        return f'WaitResult(ready={len(self.ready)}, failed={len(self.failed)}, pending={len(self.pending)}, calls={self.calls}, calls_per_video={self.calls_per_video:.1f}, seconds={self.seconds:.1f})'
+
+def wait_for_status(video: 'VideoClient', video_ids, target = 'Ready', timeout = None, min_interval = DEFAULT_MIN_POLL_INTERVAL, max_interval = DEFAULT_MAX_POLL_INTERVAL, rate = None, max_workers = DEFAULT_WATCH_WORKERS, on_complete = None, on_change = None, processing_bytes_per_sec = DEFAULT_PROCESSING_BYTES_PER_SEC) -> WaitResult:
+    # video_ids is a list of ids, or a dict of id -> file size in bytes. target can be one status or a tuple of them.
+    # rate is a TokenBucket (shared with other watchers) or calls per second for status calls
+    targets = (target,) if isinstance(target, str) else tuple(target)
+    sizes = video_ids if isinstance(video_ids, dict) else {}
+    bucket = TokenBucket(rate) if isinstance(rate, (int, float)) else rate
+    started = time.monotonic()
+    deadline = started + timeout if timeout is not None else None
+
+    waits = { video_id: VideoWait(video_id, sizes.get(video_id), started) for video_id in video_ids }
+    # (due, sequence, video id) - sequence keeps ties in order without comparing ids
+    schedule = []
+    for sequence, wait in enumerate(waits.values()):
+        # a video of known size isn't checked until it might be half done, otherwise check right away
+        delay = min(wait.size / processing_bytes_per_sec / 2, max_interval) if wait.size else 0
+        schedule.append((started + delay, sequence, wait.video_id))
+    heapq.heapify(schedule)
+    sequence = len(schedule)
+
+    results = queue.Queue()
+    calls = 0
+    in_flight = 0
+
+    def poll(video_id):
+        try:
+            # never answered from the response cache, the status is what's changing
+            results.put((video_id, video.client.get(f'/api/v2/videos/{video_id}/status', use_cache=False), None))
+        except Exception as err:
+            results.put((video_id, None, err))
+
+    def finish(wait, now, failed = False):
+        wait.finished = now
+        wait.failed = failed
+        if on_complete:
+            on_complete(wait)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        while schedule or in_flight:
+            now = time.monotonic()
+            if deadline is not None and now >= deadline:
+                break
+
+            while schedule and schedule[0][0] <= now and in_flight < max_workers:
+                video_id = heapq.heappop(schedule)[2]
+                if bucket:
+                    bucket.acquire()
+                pool.submit(poll, video_id)
+                in_flight += 1
+                calls += 1
+
+            # sleep until a status call returns or the next one is due
+            wait_seconds = max(schedule[0][0] - time.monotonic(), 0) if schedule and in_flight < max_workers else None
+            if deadline is not None:
+                until_deadline = max(deadline - time.monotonic(), 0)
+                wait_seconds = until_deadline if wait_seconds is None else min(wait_seconds, until_deadline)
+            try:
+                video_id, payload, err = results.get(timeout=wait_seconds)
+            except queue.Empty:
+                continue
+            in_flight -= 1
+
+            now = time.monotonic()
+            wait = waits[video_id]
+            wait.polls += 1
+            if err is not None:
+                wait.error = err
+                if isinstance(err, HTTPError) and err.response is not None and err.response.status_code == 404:
+                    wait.status = 'NotFound'
+                    finish(wait, now, failed=True)
+                    continue
+            else:
+                wait.error = None
+                status = payload.get('status')
+                previous = wait.status
+                wait.update(now, status, payload.get('overallProgress'))
+                if status != previous and on_change:
+                    on_change(wait)
+                if status in targets:
+                    finish(wait, now)
+                    continue
+                if status in FAILED_STATUSES:
+                    finish(wait, now, failed=True)
+                    continue
+
+            heapq.heappush(schedule, (now + wait.next_interval(now, min_interval, max_interval, processing_bytes_per_sec), sequence, video_id))
+            sequence += 1
+
+    return WaitResult(waits, calls, time.monotonic() - started)
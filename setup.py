@@ -10,6 +10,10 @@ setuptools.setup(
     author_email="luke.selden@vbrick.com",
     description="An API Client package to interact with Vbrick Rev",
     install_requires=["requests"],
+    extras_require={
+        "http2": ["httpx[http2]"],
+        "brotli": ["brotli"],
+    },
     keywords='vbrick api',
     license="MIT",
     long_description=long_description,
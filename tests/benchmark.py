@@ -0,0 +1,376 @@
+# %%
+# offline client benchmarks against tests/mockserver.py - results are printed as JSON.
+# Run from the repository root with: python -m tests.benchmark
+# (run as a plain script, revclient has to be installed first, e.g. pip install -e .)
+import json
+import os
+import platform
+import re
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from importlib.util import find_spec
+from datetime import datetime, timedelta, timezone
+
+import requests
+from revclient import RevClient
+from revclient.utils import parse_iso, parse_iso_many
+from revclient.video import patch_operations, prepare_patches
+from revclient.metrics import MetricsCollector
+from revclient.recording import RecordingTransport, ReplayTransport
+# %%
+# benchmark config values - get from environment variables
+iterations = int(os.getenv('BENCH_ITERATIONS', '2000'))
+upload_mb = int(os.getenv('BENCH_UPLOAD_MB', '64'))
+download_mb = int(os.getenv('BENCH_DOWNLOAD_MB', '256'))
+search_videos = int(os.getenv('BENCH_SEARCH_VIDEOS', '20000'))
+# simulated server latency per call, in seconds
+latency = float(os.getenv('BENCH_LATENCY', '0'))
+upload_bytes_per_sec = os.getenv('BENCH_UPLOAD_BYTES_PER_SEC')
+# simulated transcoding speed for uploaded videos
+processing_bytes_per_sec = int(os.getenv('BENCH_PROCESSING_BYTES_PER_SEC', str(64 * 1024)))
+# videos uploaded and waited on by the wait_for_status scenarios
+watch_videos = int(os.getenv('BENCH_WATCH_VIDEOS', '50'))
+# simulated server latency for the HTTP/1.1 vs HTTP/2 scenarios - multiplexing only pays off once requests
+# spend time waiting on the server
+transfer_latency = float(os.getenv('BENCH_TRANSFER_LATENCY', '0.02'))
+transfer_workers = int(os.getenv('BENCH_TRANSFER_WORKERS', '16'))
+# also write results to this file
+output = os.getenv('BENCH_OUTPUT')
+
+MB = 1024 * 1024
+
+tests_dir = os.path.dirname(os.path.abspath(__file__))
+servers = []
+
+def start_server(script, *args):
+	# mock servers run in their own process, so they don't compete for the GIL or count towards peak memory
+	server = subprocess.Popen([sys.executable, os.path.join(tests_dir, script), '--videos', str(search_videos), *args], stdout=subprocess.PIPE, universal_newlines=True)
+	servers.append(server)
+	# first line of output is the url
+	return server.stdout.readline().strip()
+
+server_args = ['--latency', str(latency), '--download-mb', str(download_mb), '--processing-bytes-per-sec', str(processing_bytes_per_sec)]
+if upload_bytes_per_sec:
+	server_args += ['--upload-bytes-per-sec', upload_bytes_per_sec]
+url = start_server('mockserver.py', *server_args)
+# compressed JSON responses, for the compression scenarios
+compress_url = start_server('mockserver.py', '--latency', str(latency), '--compress')
+# the same endpoints over HTTP/1.1 and HTTP/2 (h2c), if httpx and h2 are installed
+h1_url = start_server('mockserver.py', '--latency', str(transfer_latency), '--compress')
+http2_available = bool(find_spec('httpx') and find_spec('h2'))
+h2_url = start_server('h2server.py', '--latency', str(transfer_latency)) if http2_available else None
+
+def video_id(index):
+	return f'{index % search_videos:08x}-0000-4000-8000-{index % search_videos:012x}'
+
+def measure(name, fn, unit, scale = 1):
+	# fn() returns how many units it processed. Timed once normally, then again under tracemalloc for peak memory
+	start = time.perf_counter()
+	count = fn()
+	elapsed = time.perf_counter() - start
+
+	tracemalloc.start()
+	fn()
+	peak = tracemalloc.get_traced_memory()[1]
+	tracemalloc.stop()
+
+	return {
+		'name': name,
+		'count': count,
+		'seconds': round(elapsed, 3),
+		f'{unit}_per_sec': round(count / scale / elapsed, 1),
+		'peak_memory_bytes': peak
+	}
+
+# %%
+results = []
+
+def unpooled_requests():
+	# previous behavior - new connection per call
+	for i in range(iterations):
+		requests.request('GET', f'{url}/api/v2/videos/{video_id(i)}/details', headers={ 'Accept': 'application/json', 'Authorization': f'VBrick {rev.session.token}' }).json()
+	return iterations
+
+def pooled_requests():
+	for i in range(iterations):
+		rev.video.details(video_id(i))
+	return iterations
+
+def bulk_requests():
+	job = rev.video.bulk_details([ video_id(i) for i in range(iterations) ], max_workers=8)
+	return sum(1 for result in job if result.ok)
+
+# more distinct values than parse_iso caches, so every call is a cache miss
+date_values = [ (datetime(2020, 1, 1, tzinfo=timezone.utc) + timedelta(seconds=i * 37)).strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3] + 'Z' for i in range(iterations * 50) ]
+# one page of search results - whenModified/whenPublished mostly repeat whenUploaded
+date_page = [ date_values[i // 3] for i in range(300) ]
+
+# parse_iso before fractional seconds and offsets were kept, for comparison
+legacy_iso_re = re.compile(r'([\d:T-]+)(\.\d+)?(\+\d+:\d+|Z)?')
+def legacy_parse_iso(val):
+	cleaned = legacy_iso_re.match(val)
+	return datetime.fromisoformat((cleaned[1] + '.000+00:00') if cleaned else val)
+
+def parse_dates(parse, values):
+	def run():
+		for val in values:
+			parse(val)
+		return len(values)
+	return run
+
+def parse_date_pages():
+	for _ in range(iterations):
+		parse_iso_many(date_page)
+	return iterations * len(date_page)
+
+patch_metadata = { 'Title': 'patched', 'Description': 'benchmark', 'Tags': ['benchmark'], 'IsActive': True, 'EnableDownloads': 1, 'ExpirationDate': '2030-01-01T00:00:00Z', 'unknownField': 1 }
+
+def build_patch_operations():
+	# client-side cost of turning metadata into JSON Patch operations, no requests sent
+	count = 0
+	for _ in range(iterations * 10):
+		operations, invalid = patch_operations(patch_metadata)
+		count += len(operations)
+	return count
+
+def prepare_patch_documents():
+	documents = prepare_patches({ f'video-{i}': patch_metadata for i in range(iterations * 10) })
+	return sum(len(operations) for operations, invalid in documents.values())
+
+def patch_requests():
+	for i in range(iterations):
+		rev.video.patch(video_id(i), { 'Title': f'patched {i}', 'Tags': ['benchmark'] })
+	return iterations
+
+upload_file = tempfile.NamedTemporaryFile(suffix='.mp4', delete=False)
+with upload_file:
+	block = bytes(range(256)) * 4096
+	for _ in range(upload_mb):
+		upload_file.write(block)
+
+def upload():
+	video_id = rev.video.upload(upload_file.name, { 'uploader': 'benchmark', 'title': 'benchmark upload' })
+	assert video_id, 'upload failed'
+	return upload_mb * MB
+
+download_dir = tempfile.mkdtemp()
+
+def download(parallel):
+	def run():
+		result = rev.video.download(video_id(0), os.path.join(download_dir, f'download-{parallel}.mp4'), parallel=parallel, range_size=16 * MB)
+		os.remove(result.path)
+		return result.size
+	return run
+
+# 64KB - 512KB, so processing takes 1 - 8 seconds at the default speed
+watch_sizes = [ (i % 8 + 1) * 64 * 1024 for i in range(watch_videos) ]
+watch_calls = {}
+
+def server_calls():
+	return sum(row['count'] for row in status_metrics.summary())
+
+def upload_for_watch(size):
+	with tempfile.NamedTemporaryFile(suffix='.mp4', delete=False) as fh:
+		fh.write(bytes(size))
+	try:
+		return rev.video.upload(fh.name, { 'uploader': 'benchmark', 'title': 'benchmark processing' })
+	finally:
+		os.remove(fh.name)
+
+def poll_status_loop():
+	# previous behavior - check every video in turn, every half second
+	pending = set(upload_for_watch(size) for size in watch_sizes)
+	before = server_calls()
+	while pending:
+		for video_id in list(pending):
+			if rev.video.status(video_id)['status'] == 'Ready':
+				pending.discard(video_id)
+		time.sleep(0.5)
+	watch_calls['status polling loop'] = (server_calls() - before) / watch_videos
+	return watch_videos
+
+def wait_for_ready():
+	video_ids = [ upload_for_watch(size) for size in watch_sizes ]
+	before = server_calls()
+	result = rev.video.wait_for_status(video_ids, min_interval=0.25, max_interval=5)
+	assert len(result.ready) == watch_videos, result
+	watch_calls['video.wait_for_status'] = (server_calls() - before) / watch_videos
+	return watch_videos
+
+recording = os.path.join(tempfile.mkdtemp(), 'traffic.jsonl.gz')
+
+def record_traffic():
+	# one pass of search and details calls, replayed below without the server to time the client on its own
+	with RecordingTransport(recording) as recorder, RevClient(url, apiKey='benchmark', secret='benchmark', transport=recorder) as recording_client:
+		recording_client.connect()
+		for video in recording_client.video.search_stream({}, incremental=True):
+			pass
+		for i in range(min(iterations, 500)):
+			recording_client.video.details(video_id(i))
+
+def replayed(fn):
+	def run():
+		# the recording is loaded once, outside the timed and memory traced calls
+		with RevClient(url, apiKey='benchmark', secret='benchmark', transport=replay_transport) as replay_client:
+			replay_client.connect()
+			return fn(replay_client)
+	return run
+
+def replayed_search(client):
+	return sum(1 for _ in client.video.search_stream({}, incremental=True))
+
+def replayed_details(client):
+	for i in range(iterations):
+		client.video.details(video_id(i))
+	return iterations
+
+# figures from the first run of each transfer scenario, keyed by name
+transfer = {}
+
+def transfer_run(name, client_url, fn, make_transport = None, **client_options):
+	# a new client (and transport) per run, so connection counts start from zero
+	def run():
+		transport = make_transport() if make_transport else None
+		try:
+			with RevClient(client_url, apiKey='benchmark', secret='benchmark', transport=transport, **client_options) as client:
+				connections = []
+				client.add_hook('post_response', lambda event: connections.append(event) if event.timings['connect'] else None)
+				client.connect()
+				# leave the login out of the byte counts
+				client.transport.transfer_stats.reset()
+				metrics = MetricsCollector().attach(client)
+				count = fn(client)
+				if name not in transfer:
+					transfer[name] = transfer_figures(client, max(metrics.summary(), key=lambda row: row['count']), len(connections))
+				return count
+		finally:
+			if transport:
+				transport.close()
+	return run
+
+def http2_transport():
+	from revclient.http2 import Http2Transport
+	# prior knowledge HTTP/2, since the stub is plain http
+	return Http2Transport(max_connections=transfer_workers, http1=False)
+
+def transfer_figures(client, row, connections):
+	stats = client.transport.transfer_stats
+	# compressing transports decode responses themselves and know the decoded size, otherwise it's what came in
+	decoded = stats.response_bytes / stats.responses if stats.responses else row['bytesReceived'] / row['count']
+	return {
+		'p50_ms': round(row['p50'] * 1000, 2),
+		'p95_ms': round(row['p95'] * 1000, 2),
+		'connections': connections,
+		'wire_bytes_sent_per_request': round(row['bytesSent'] / row['count']),
+		'wire_bytes_received_per_request': round(row['bytesReceived'] / row['count']),
+		'decoded_bytes_received_per_request': round(decoded),
+		'decompress_ms_per_request': round(row['phases'].get('decompress', 0.0) * 1000, 3)
+	}
+
+def concurrent_details(client):
+	job = client.video.bulk_details([ video_id(i) for i in range(iterations) ], max_workers=transfer_workers)
+	return sum(1 for result in job if result.ok)
+
+# a few KB of JSON Patch per video - the kind of body worth compressing
+large_patch = { 'Description': ' '.join(f'benchmark description line {i}.' for i in range(100)), 'Tags': [ f'benchmark-tag-{i}' for i in range(50) ] }
+
+def compressed_patches(client):
+	job = client.video.bulk_send_patches(prepare_patches({ video_id(i): large_patch for i in range(iterations) }), max_workers=transfer_workers)
+	return sum(1 for result in job if result.ok)
+
+def search_pages(client):
+	# not incremental, so whole pages go through the transport's decompress step
+	return sum(1 for _ in client.video.search_stream({}))
+
+def identity_search_pages(client):
+	# same server as the compressed runs, asked not to compress
+	client.transport.http.headers['Accept-Encoding'] = 'identity'
+	return search_pages(client)
+
+def search_export():
+	return sum(1 for _ in rev.video.search_stream({}, incremental=True))
+
+def search_export_compact():
+	return sum(1 for _ in rev.video.search_stream({}, fields=['id', 'title', 'whenUploaded'], compact=True, incremental=True))
+
+try:
+	with RevClient(url, apiKey='benchmark', secret='benchmark') as rev:
+		rev.connect()
+		results.append(measure('requests.request', unpooled_requests, 'requests'))
+		results.append(measure('video.details (pooled)', pooled_requests, 'requests'))
+		results.append(measure('video.bulk_details (8 workers)', bulk_requests, 'requests'))
+		results.append(measure('parse_iso (legacy)', parse_dates(legacy_parse_iso, date_values), 'dates'))
+		results.append(measure('parse_iso', parse_dates(parse_iso, date_values), 'dates'))
+		results.append(measure('parse_iso (repeated values)', parse_dates(parse_iso, date_values[:1000] * 50), 'dates'))
+		results.append(measure('parse_iso_many (search pages)', parse_date_pages, 'dates'))
+		results.append(measure('patch_operations', build_patch_operations, 'operations'))
+		results.append(measure('prepare_patches', prepare_patch_documents, 'operations'))
+		results.append(measure('video.patch', patch_requests, 'requests'))
+		results.append(measure('video.search_stream', search_export, 'items'))
+		results.append(measure('video.search_stream (compact)', search_export_compact, 'items'))
+		record_traffic()
+		replay_transport = ReplayTransport(recording)
+		results.append(measure('video.search_stream (replayed)', replayed(replayed_search), 'items'))
+		results.append(measure('video.details (replayed)', replayed(replayed_details), 'requests'))
+		results.append(measure('video.download', download(1), 'mb', MB))
+		results.append(measure('video.download (4 ranges)', download(4), 'mb', MB))
+		status_metrics = MetricsCollector().attach(rev)
+		for name, fn in (('status polling loop', poll_status_loop), ('video.wait_for_status', wait_for_ready)):
+			status_metrics.reset()
+			results.append(dict(measure(name, fn, 'videos'), status_calls_per_video=round(watch_calls[name], 1)))
+		status_metrics.detach(rev)
+		# last, since uploads add to the videos searched
+		results.append(measure('video.upload', upload, 'mb', MB))
+
+	# each scenario on a new client
+	transfer_scenarios = [
+		(f'video.bulk_details (HTTP/1.1, {transfer_workers} workers)', h1_url, concurrent_details, 'requests', { 'pool_maxsize': transfer_workers }),
+		(f'video.bulk_details (HTTP/2, {transfer_workers} workers)', h2_url, concurrent_details, 'requests', { 'make_transport': http2_transport }),
+		('video.bulk_send_patches (uncompressed)', compress_url, compressed_patches, 'requests', { 'pool_maxsize': transfer_workers }),
+		('video.bulk_send_patches (gzip)', compress_url, compressed_patches, 'requests', { 'pool_maxsize': transfer_workers, 'compression': 'gzip' }),
+		('video.bulk_send_patches (br)', compress_url, compressed_patches, 'requests', { 'pool_maxsize': transfer_workers, 'compression': 'br' }),
+		('video.search_stream (identity responses)', compress_url, identity_search_pages, 'items', {}),
+		('video.search_stream (gzip responses)', compress_url, search_pages, 'items', { 'compression': 'gzip' }),
+		('video.search_stream (br responses)', compress_url, search_pages, 'items', { 'compression': 'br' }),
+	]
+	for name, scenario_url, fn, unit, client_options in transfer_scenarios:
+		if client_options.get('make_transport') is http2_transport and not http2_available:
+			results.append({ 'name': name, 'skipped': 'needs httpx and h2: pip install revclient[http2]' })
+			continue
+		if client_options.get('compression') == 'br' and not find_spec('brotli'):
+			results.append({ 'name': name, 'skipped': 'needs brotli: pip install revclient[brotli]' })
+			continue
+		results.append(dict(measure(name, transfer_run(name, scenario_url, fn, **client_options), unit), **transfer[name]))
+finally:
+	os.remove(upload_file.name)
+	os.rmdir(download_dir)
+	if os.path.exists(recording):
+		os.remove(recording)
+	os.rmdir(os.path.dirname(recording))
+	for server in servers:
+		server.terminate()
+		server.wait()
+
+# %%
+try:
+	from importlib.metadata import version
+	client_version = version('revclient')
+except Exception:
+	client_version = None
+
+report = {
+	'revclient': client_version,
+	'python': platform.python_version(),
+	'platform': platform.platform(),
+	'timestamp': datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ'),
+	'config': { 'iterations': iterations, 'upload_mb': upload_mb, 'download_mb': download_mb, 'search_videos': search_videos, 'latency': latency, 'upload_bytes_per_sec': upload_bytes_per_sec, 'processing_bytes_per_sec': processing_bytes_per_sec, 'watch_videos': watch_videos, 'transfer_latency': transfer_latency, 'transfer_workers': transfer_workers },
+	'results': results
+}
+print(json.dumps(report, indent=2))
+
+if output:
+	with open(output, 'w') as fh:
+		json.dump(report, fh, indent=2)
@@ -0,0 +1,29 @@
+# %%
+# shared fixtures - every test gets its own mock Rev server (tests/mockserver.py) and a client logged in to it
+import pytest
+
+from revclient import RevClient
+from tests.mockserver import MockRevServer
+
+# the mock server only filters search results by upload date, so syncs track that instead of whenModified
+DATE_ARGS = { 'date_field': 'whenUploaded', 'from_param': 'fromUploadDate' }
+
+@pytest.fixture
+def server():
+	with MockRevServer(videos=250, download_size=3 * 1024 * 1024 + 7) as mock:
+		yield mock
+
+@pytest.fixture
+def rev(server):
+	client = RevClient(server.url, apiKey='key', secret='secret')
+	client.connect()
+	yield client
+	client.close()
+
+def remove_video(server, video_id):
+	# stand-in for a video being deleted in Rev
+	with server.lock:
+		index = [ video['id'] for video in server.videos ].index(video_id)
+		del server.videos[index]
+		del server.upload_dates[index]
+		del server.by_id[video_id]
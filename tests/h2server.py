@@ -0,0 +1,207 @@
+# %%
+# HTTP/2 stand-in for the Rev API endpoints the HTTP/2 benchmarks call - login, video details, search and patch.
+# Cleartext HTTP/2 with prior knowledge (h2c), so clients need http1=False. Needs the h2 package.
+# Run standalone with: python tests/h2server.py --port 8081 --latency 0.02
+import argparse
+import json
+import re
+import socket
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from urllib.parse import urlparse, parse_qs
+
+import h2.config
+import h2.connection
+import h2.events
+import h2.exceptions
+from mockserver import make_video, encode_response, decode_request, SEARCH_PAGE_SIZE
+
+READ_SIZE = 64 * 1024
+
+#%%
+class H2ConnectionHandler():
+	# one per client connection. Requests are answered on their own threads after the simulated latency, so many
+	# can be in flight at once on the same connection - h2 state is only touched while holding lock
+	def __init__(self, server: 'MockH2Server', sock):
+		self.server = server
+		self.sock = sock
+		self.conn = h2.connection.H2Connection(config=h2.config.H2Configuration(client_side=False, header_encoding='utf-8'))
+		self.lock = threading.Lock()
+		# signalled when the client opens up its flow control window
+		self.window_open = threading.Condition(self.lock)
+		self.requests = {}
+		self.closed = False
+
+	def run(self):
+		with self.lock:
+			self.conn.initiate_connection()
+			self.sock.sendall(self.conn.data_to_send())
+		try:
+			while not self.closed:
+				data = self.sock.recv(READ_SIZE)
+				if not data:
+					break
+				with self.lock:
+					events = self.conn.receive_data(data)
+					for event in events:
+						self.handle_event(event)
+					self.sock.sendall(self.conn.data_to_send())
+		except (ConnectionResetError, BrokenPipeError, OSError, h2.exceptions.ProtocolError):
+			pass
+		finally:
+			with self.lock:
+				self.closed = True
+				self.window_open.notify_all()
+			self.sock.close()
+
+	def handle_event(self, event):
+		if isinstance(event, h2.events.RequestReceived):
+			self.requests[event.stream_id] = (dict(event.headers), bytearray())
+		elif isinstance(event, h2.events.DataReceived):
+			self.requests[event.stream_id][1].extend(event.data)
+			self.conn.acknowledge_received_data(event.flow_controlled_length, event.stream_id)
+		elif isinstance(event, h2.events.StreamEnded):
+			headers, body = self.requests.pop(event.stream_id)
+			self.server.count_request(len(body))
+			threading.Thread(target=self.respond, args=(event.stream_id, headers, bytes(body)), daemon=True).start()
+		elif isinstance(event, (h2.events.WindowUpdated, h2.events.RemoteSettingsChanged)):
+			self.window_open.notify_all()
+		elif isinstance(event, h2.events.StreamReset):
+			self.requests.pop(event.stream_id, None)
+		elif isinstance(event, h2.events.ConnectionTerminated):
+			self.closed = True
+
+	def respond(self, stream_id, headers, body):
+		if self.server.latency:
+			time.sleep(self.server.latency)
+		status, payload = self.server.route(headers[':method'], headers[':path'], decode_request(body, headers.get('content-encoding')))
+		body = json.dumps(payload).encode() if payload is not None else b''
+		response_headers = [(':status', str(status))]
+		if body:
+			body, encoding = encode_response(body, headers.get('accept-encoding'))
+			response_headers.append(('content-type', 'application/json'))
+			if encoding:
+				response_headers.append(('content-encoding', encoding))
+		response_headers.append(('content-length', str(len(body))))
+		self.server.count_sent(len(body))
+
+		try:
+			with self.lock:
+				self.conn.send_headers(stream_id, response_headers, end_stream=not body)
+				self.sock.sendall(self.conn.data_to_send())
+				offset = 0
+				while offset < len(body) and not self.closed:
+					window = min(self.conn.local_flow_control_window(stream_id), self.conn.max_outbound_frame_size)
+					if window <= 0:
+						self.window_open.wait()
+						continue
+					chunk = body[offset:offset + window]
+					offset += len(chunk)
+					self.conn.send_data(stream_id, chunk, end_stream=offset >= len(body))
+					self.sock.sendall(self.conn.data_to_send())
+		except (OSError, h2.exceptions.ProtocolError, h2.exceptions.StreamClosedError):
+			pass
+
+class MockH2Server():
+	def __init__(self, videos = 1000, latency = 0, host = '127.0.0.1', port = 0):
+		# seconds before each response is sent
+		self.latency = latency
+		self.videos = [ make_video(index) for index in range(videos) ]
+		self.by_id = { video['id']: video for video in self.videos }
+		self.connections = 0
+		self.total_requests = 0
+		# request/response body bytes as sent over the wire
+		self.bytes_received = 0
+		self.bytes_sent = 0
+		self.lock = threading.Lock()
+
+		self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+		self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+		self.sock.bind((host, port))
+		self.sock.listen(128)
+		self.thread = None
+		self.stopped = False
+
+	@property
+	def url(self):
+		host, port = self.sock.getsockname()[:2]
+		return f'http://{host}:{port}'
+
+	def serve_forever(self):
+		while not self.stopped:
+			try:
+				client, address = self.sock.accept()
+			except OSError:
+				break
+			client.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+			with self.lock:
+				self.connections += 1
+			threading.Thread(target=H2ConnectionHandler(self, client).run, daemon=True).start()
+
+	def start(self):
+		self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+		self.thread.start()
+		return self
+
+	def stop(self):
+		self.stopped = True
+		self.sock.close()
+
+	def __enter__(self):
+		return self.start()
+
+	def __exit__(self, *args):
+		self.stop()
+
+	def count_request(self, size):
+		with self.lock:
+			self.total_requests += 1
+			self.bytes_received += size
+
+	def count_sent(self, size):
+		with self.lock:
+			self.bytes_sent += size
+
+	def route(self, method, path, body):
+		url = urlparse(path)
+		query = { key: values[-1] for key, values in parse_qs(url.query).items() }
+		if method == 'POST' and re.match(r'^/api/v2/(authenticate|user/login)$', url.path):
+			expires = (datetime.now(timezone.utc) + timedelta(minutes=20)).strftime('%Y-%m-%dT%H:%M:%S.000Z')
+			return 200, { 'token': uuid.uuid4().hex, 'id': str(uuid.uuid4()), 'expiration': expires }
+		match = re.match(r'^/api/v2/videos/([^/]+)(/details)?$', url.path)
+		if match and method == 'GET' and match.group(2):
+			video = self.by_id.get(match.group(1))
+			return (200, video) if video else (404, { 'code': 'NotFound' })
+		if match and method == 'PATCH' and not match.group(2):
+			operations = json.loads(body) if body else None
+			if not isinstance(operations, list) or match.group(1) not in self.by_id:
+				return 400, { 'code': 'InvalidRequest' }
+			return 204, None
+		if method == 'GET' and url.path == '/api/v2/videos/search':
+			start = int(query.get('scrollId') or 0)
+			count = int(query.get('count') or SEARCH_PAGE_SIZE)
+			page = self.videos[start:start + count]
+			scroll_id = str(start + count) if start + count < len(self.videos) else None
+			return 200, { 'videos': page, 'totalVideos': len(self.videos), 'scrollId': scroll_id, 'statusCode': 'Success' }
+		return 404, { 'code': 'NotFound', 'detail': url.path }
+
+# %%
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description='Mock HTTP/2 Rev API server for offline benchmarks')
+	parser.add_argument('--host', default='127.0.0.1')
+	parser.add_argument('--port', type=int, default=0)
+	parser.add_argument('--videos', type=int, default=1000)
+	parser.add_argument('--latency', type=float, default=0)
+	args = parser.parse_args()
+
+	mock = MockH2Server(args.videos, args.latency, host=args.host, port=args.port)
+	# first line of output is the url, so a parent process can find the port
+	print(mock.url, flush=True)
+	try:
+		mock.serve_forever()
+	except KeyboardInterrupt:
+		pass
+	sys.exit(0)
@@ -0,0 +1,442 @@
+# %%
+# local stand-in for the Rev API, for benchmarking the client without a live tenant.
+# Run standalone with: python tests/mockserver.py --port 8080 --videos 10000
+import argparse
+import gzip
+import json
+import re
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+try:
+	import brotli
+except ImportError:
+	brotli = None
+
+READ_SIZE = 64 * 1024
+SEARCH_PAGE_SIZE = 100
+# responses smaller than this are sent uncompressed
+COMPRESS_MIN_BYTES = 1024
+
+def video_id(index):
+	# guid format, so endpoints normalize like real Rev ids
+	return f'{index:08x}-0000-4000-8000-{index:012x}'
+
+def make_video(index, start = datetime(2020, 1, 1, tzinfo=timezone.utc)):
+	when = (start + timedelta(hours=index)).strftime('%Y-%m-%dT%H:%M:%S.000Z')
+	return {
+		'id': video_id(index),
+		'title': f'Benchmark video {index}',
+		'description': 'Generated by the mock Rev server. ' * 4,
+		'categories': [ { 'categoryId': video_id(index % 10), 'name': f'Category {index % 10}' } ],
+		'tags': [ f'tag{index % 7}', f'tag{index % 13}' ],
+		'uploadedBy': f'user{index % 25}',
+		'whenUploaded': when,
+		'whenModified': when,
+		'whenPublished': when,
+		'status': 'Ready',
+		'isActive': True,
+		'duration': '00:05:00'
+	}
+
+def encode_response(body, accept_encoding):
+	# returns (body, content encoding) - brotli if the client takes it and it's installed, then gzip
+	accepted = [ value.split(';')[0].strip() for value in (accept_encoding or '').split(',') ]
+	if len(body) < COMPRESS_MIN_BYTES:
+		return body, None
+	if 'br' in accepted and brotli:
+		return brotli.compress(body, quality=4), 'br'
+	if 'gzip' in accepted:
+		return gzip.compress(body, 6), 'gzip'
+	return body, None
+
+def decode_request(body, content_encoding):
+	if content_encoding == 'gzip':
+		return gzip.decompress(body)
+	if content_encoding == 'br':
+		return brotli.decompress(body)
+	return body
+
+def parse_date(value):
+	value = value.replace('Z', '+00:00')
+	if len(value) == 10:
+		value += 'T00:00:00+00:00'
+	parsed = datetime.fromisoformat(value) if hasattr(datetime, 'fromisoformat') else datetime.strptime(value[:19], '%Y-%m-%dT%H:%M:%S')
+	return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+#%%
+class MockRevHandler(BaseHTTPRequestHandler):
+	protocol_version = 'HTTP/1.1'
+	# avoid delayed-ACK stalls on keep-alive connections
+	disable_nagle_algorithm = True
+
+	routes = [
+		('POST', re.compile(r'^/api/v2/(authenticate|user/login)$'), 'login'),
+		('POST', re.compile(r'^/api/v2/(auth|user)/extend-session-timeout(/[^/]+)?$'), 'extend'),
+		('POST', re.compile(r'^/api/v2/user/logoff$'), 'logoff'),
+		('DELETE', re.compile(r'^/api/v2/tokens/[^/]+$'), 'logoff'),
+		('GET', re.compile(r'^/api/v2/videos/search$'), 'search'),
+		('GET', re.compile(r'^/api/v2/videos/([^/]+)/details$'), 'details'),
+		('GET', re.compile(r'^/api/v2/videos/([^/]+)/status$'), 'status'),
+		('GET', re.compile(r'^/api/v2/videos/([^/]+)/download$'), 'download'),
+		('PATCH', re.compile(r'^/api/v2/videos/([^/]+)$'), 'patch'),
+		('PUT', re.compile(r'^/api/v2/videos/([^/]+)$'), 'update'),
+		('POST', re.compile(r'^/api/v2/uploads/videos$'), 'upload'),
+	]
+
+	def handle(self):
+		try:
+			super().handle()
+		except (ConnectionResetError, BrokenPipeError):
+			# client gave up on the response, e.g. a cancelled download
+			pass
+
+	@property
+	def mock(self) -> 'MockRevServer':
+		return self.server.mock
+
+	def handle_request(self):
+		url = urlparse(self.path)
+		self.query = { key: values[-1] for key, values in parse_qs(url.query).items() }
+		self.mock.count(self.command, url.path)
+
+		for method, pattern, name in self.routes:
+			match = pattern.match(url.path)
+			if method == self.command and match:
+				break
+		else:
+			self.read_body()
+			return self.send_json(404, { 'code': 'NotFound', 'detail': url.path })
+
+		if self.mock.throttle_every and self.mock.total_requests % self.mock.throttle_every == 0:
+			self.read_body()
+			return self.send_json(429, { 'code': 'TooManyRequests' }, { 'Retry-After': '0' })
+
+		if name != 'login' and not self.mock.valid_token(self.headers.get('Authorization')):
+			self.read_body()
+			return self.send_json(401, { 'code': 'Unauthorized' })
+
+		if self.mock.latency:
+			time.sleep(self.mock.latency)
+		getattr(self, f'do_{name}')(*match.groups())
+
+	do_GET = do_POST = do_PUT = do_PATCH = do_DELETE = handle_request
+
+	def read_body(self, on_chunk = None):
+		# returns the body, or just its size if on_chunk is handling the data
+		chunks = []
+		size = 0
+		if self.headers.get('Transfer-Encoding', '').lower() == 'chunked':
+			sizes = iter(lambda: int(self.rfile.readline().split(b';')[0], 16), 0)
+			for length in sizes:
+				chunk = self.rfile.read(length)
+				self.rfile.readline()
+				size += len(chunk)
+				if on_chunk:
+					on_chunk(chunk)
+				else:
+					chunks.append(chunk)
+			self.rfile.readline()
+		else:
+			remaining = int(self.headers.get('Content-Length') or 0)
+			while remaining > 0:
+				chunk = self.rfile.read(min(remaining, READ_SIZE))
+				if not chunk:
+					break
+				remaining -= len(chunk)
+				size += len(chunk)
+				if on_chunk:
+					on_chunk(chunk)
+				else:
+					chunks.append(chunk)
+		return size if on_chunk else b''.join(chunks)
+
+	def read_json(self):
+		body = self.read_body()
+		self.mock.count_bytes(received=len(body))
+		body = decode_request(body, self.headers.get('Content-Encoding'))
+		return json.loads(body) if body else {}
+
+	def send_json(self, status, payload = None, headers = {}):
+		body = json.dumps(payload).encode() if payload is not None else b''
+		if self.mock.compress_responses:
+			body, encoding = encode_response(body, self.headers.get('Accept-Encoding'))
+			if encoding:
+				headers = dict(headers, **{ 'Content-Encoding': encoding })
+		self.mock.count_bytes(sent=len(body))
+		self.send_response(status)
+		if body:
+			self.send_header('Content-Type', 'application/json')
+		self.send_header('Content-Length', str(len(body)))
+		for key, val in headers.items():
+			self.send_header(key, val)
+		self.end_headers()
+		self.wfile.write(body)
+
+	def do_login(self, *args):
+		self.read_json()
+		token, expires = self.mock.issue_token()
+		self.send_json(200, { 'token': token, 'id': str(uuid.uuid4()), 'expiration': expires })
+
+	def do_extend(self, *args):
+		self.read_body()
+		token = self.headers.get('Authorization', '').replace('VBrick ', '')
+		self.send_json(200, { 'expiration': self.mock.extend_token(token) })
+
+	def do_logoff(self, *args):
+		self.read_body()
+		self.send_json(204)
+
+	def do_details(self, video_id):
+		video = self.mock.video(video_id)
+		if video is None:
+			return self.send_json(404, { 'code': 'NotFound' })
+		self.send_json(200, video)
+
+	def do_status(self, video_id):
+		video = self.mock.video(video_id)
+		if video is None:
+			return self.send_json(404, { 'code': 'NotFound' })
+		progress = self.mock.processing_progress(video_id)
+		self.send_json(200, { 'videoId': video_id, 'status': video['status'], 'isProcessing': progress < 1, 'overallProgress': progress })
+
+	def do_patch(self, video_id):
+		operations = self.read_json()
+		if not isinstance(operations, list) or self.mock.video(video_id) is None:
+			return self.send_json(400 if self.mock.video(video_id) else 404, { 'code': 'InvalidRequest' })
+		self.send_json(204)
+
+	def do_update(self, video_id):
+		self.read_json()
+		if self.mock.video(video_id) is None:
+			return self.send_json(404, { 'code': 'NotFound' })
+		self.send_json(204)
+
+	def do_download(self, video_id):
+		if self.mock.video(video_id) is None:
+			return self.send_json(404, { 'code': 'NotFound' })
+		size = self.mock.download_size
+		etag = f'"{video_id}-{size}"'
+		start, end = 0, size - 1
+		status = 200
+		match = re.match(r'bytes=(\d+)-(\d*)$', self.headers.get('Range', ''))
+		# If-Range with an old ETag means the whole file is sent
+		if match and self.headers.get('If-Range', etag) == etag:
+			start = int(match.group(1))
+			end = min(int(match.group(2)), size - 1) if match.group(2) else size - 1
+			if start >= size:
+				return self.send_json(416, None, { 'Content-Range': f'bytes */{size}' })
+			status = 206
+
+		self.send_response(status)
+		self.send_header('Content-Type', 'video/mp4')
+		self.send_header('Content-Length', str(end - start + 1))
+		self.send_header('Content-Disposition', f'attachment; filename="{video_id}.mp4"')
+		self.send_header('Accept-Ranges', 'bytes')
+		self.send_header('ETag', etag)
+		if status == 206:
+			self.send_header('Content-Range', f'bytes {start}-{end}/{size}')
+		self.end_headers()
+
+		# file content is the byte offset modulo 251, so clients can check any range they received
+		block = self.mock.download_block
+		position = start
+		while position <= end:
+			offset = position % 251
+			count = min(end - position + 1, len(block) - 251)
+			self.wfile.write(block[offset:offset + count])
+			position += count
+
+	def do_search(self, *args):
+		start = int(self.query.get('scrollId') or 0)
+		count = int(self.query.get('count') or SEARCH_PAGE_SIZE)
+		videos = self.mock.search(self.query.get('fromUploadDate'), self.query.get('toUploadDate'))
+		page = videos[start:start + count]
+		scroll_id = str(start + count) if start + count < len(videos) else None
+		self.send_json(200, { 'videos': page, 'totalVideos': len(videos), 'scrollId': scroll_id, 'statusCode': 'Success' })
+
+	def do_upload(self, *args):
+		content_type = self.headers.get('Content-Type', '')
+		if 'multipart/form-data' not in content_type or 'boundary=' not in content_type:
+			self.read_body()
+			return self.send_json(400, { 'code': 'InvalidRequest', 'detail': 'expected multipart/form-data' })
+		boundary = content_type.split('boundary=', 1)[1].strip('"').encode()
+		# only the start (metadata part) and end (closing boundary) of the body are kept
+		head = bytearray()
+		tail = bytearray()
+		started = time.perf_counter()
+		received = [0]
+
+		def on_chunk(chunk):
+			if len(head) < READ_SIZE:
+				head.extend(chunk[:READ_SIZE - len(head)])
+			tail.extend(chunk)
+			del tail[:-256]
+			received[0] += len(chunk)
+			if self.mock.upload_bytes_per_sec:
+				# bandwidth cap - sleep until the bytes so far would have taken that long
+				delay = received[0] / self.mock.upload_bytes_per_sec - (time.perf_counter() - started)
+				if delay > 0:
+					time.sleep(delay)
+
+		size = self.read_body(on_chunk)
+		if b'name="video"' not in head or b'name="VideoFile"' not in head or not bytes(tail).rstrip().endswith(b'--' + boundary + b'--'):
+			return self.send_json(400, { 'code': 'InvalidRequest', 'detail': 'malformed multipart body' })
+
+		metadata = re.search(rb'name="video"\r\n(?:[^\r\n]+\r\n)*\r\n(.*?)\r\n--' + re.escape(boundary), bytes(head), re.S)
+		video = self.mock.add_video(json.loads(metadata.group(1)) if metadata else {}, size)
+		self.send_json(200, { 'videoId': video['id'] })
+
+	def log_message(self, *args):
+		pass
+
+class MockRevServer():
+	def __init__(self, videos = 1000, latency = 0, upload_bytes_per_sec = None, throttle_every = 0, session_minutes = 20, download_size = 16 * 1024 * 1024, processing_bytes_per_sec = None, compress_responses = False, host = '127.0.0.1', port = 0):
+		# seconds added to every authenticated call
+		self.latency = latency
+		# cap on upload speed, bytes per second
+		self.upload_bytes_per_sec = upload_bytes_per_sec
+		# answer every nth request with 429 Too Many Requests
+		self.throttle_every = throttle_every
+		self.session_minutes = session_minutes
+		# size of every video's download
+		self.download_size = download_size
+		self.download_block = memoryview(bytes(range(251)) * (READ_SIZE // 251 + 2))
+		# uploads take size / processing_bytes_per_sec seconds to become Ready, or stay Processing if None
+		self.processing_bytes_per_sec = processing_bytes_per_sec
+		# video id -> (started, seconds) for videos still processing
+		self.processing = {}
+		# gzip/brotli JSON responses for clients that accept it
+		self.compress_responses = compress_responses
+		# JSON body bytes as sent over the wire (compressed size)
+		self.json_bytes_received = 0
+		self.json_bytes_sent = 0
+
+		self.videos = [ make_video(index) for index in range(videos) ]
+		self.by_id = { video['id']: video for video in self.videos }
+		self.upload_dates = [ parse_date(video['whenUploaded']) for video in self.videos ]
+		self.tokens = {}
+		self.requests = {}
+		self.total_requests = 0
+		self.uploaded_bytes = 0
+		self.lock = threading.Lock()
+
+		self.httpd = ThreadingHTTPServer((host, port), MockRevHandler)
+		self.httpd.daemon_threads = True
+		self.httpd.mock = self
+		self.thread = None
+
+	@property
+	def url(self):
+		host, port = self.httpd.server_address[:2]
+		return f'http://{host}:{port}'
+
+	def start(self):
+		self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+		self.thread.start()
+		return self
+
+	def stop(self):
+		self.httpd.shutdown()
+		self.httpd.server_close()
+
+	def __enter__(self):
+		return self.start()
+
+	def __exit__(self, *args):
+		self.stop()
+
+	def count(self, method, path):
+		with self.lock:
+			self.total_requests += 1
+			key = f'{method} {path}'
+			self.requests[key] = self.requests.get(key, 0) + 1
+
+	def count_bytes(self, received = 0, sent = 0):
+		with self.lock:
+			self.json_bytes_received += received
+			self.json_bytes_sent += sent
+
+	def issue_token(self):
+		token = uuid.uuid4().hex
+		return token, self.extend_token(token)
+
+	def extend_token(self, token):
+		expires = datetime.now(timezone.utc) + timedelta(minutes=self.session_minutes)
+		with self.lock:
+			self.tokens[token] = expires
+		return expires.strftime('%Y-%m-%dT%H:%M:%S.000Z')
+
+	def valid_token(self, header):
+		if not header or not header.startswith('VBrick '):
+			return False
+		expires = self.tokens.get(header[len('VBrick '):])
+		return bool(expires and expires > datetime.now(timezone.utc))
+
+	def video(self, video_id):
+		return self.by_id.get(video_id)
+
+	def search(self, from_date = None, to_date = None):
+		if not from_date and not to_date:
+			return self.videos
+		start = parse_date(from_date) if from_date else None
+		end = parse_date(to_date) if to_date else None
+		return [ video for video, when in zip(self.videos, self.upload_dates) if (not start or when >= start) and (not end or when < end) ]
+
+	def add_video(self, metadata, size):
+		with self.lock:
+			video = make_video(len(self.videos))
+			video.update({ 'title': metadata.get('title', video['title']), 'uploadedBy': metadata.get('uploader'), 'status': 'Processing', 'size': size })
+			self.videos.append(video)
+			self.by_id[video['id']] = video
+			self.upload_dates.append(parse_date(video['whenUploaded']))
+			self.uploaded_bytes += size
+		if self.processing_bytes_per_sec:
+			self.start_processing(video['id'], size / self.processing_bytes_per_sec)
+		return video
+
+	def start_processing(self, video_id, seconds):
+		# video reports Processing, with overallProgress moving linearly, until seconds from now
+		with self.lock:
+			self.by_id[video_id]['status'] = 'Processing'
+			self.processing[video_id] = (time.monotonic(), seconds)
+
+	def processing_progress(self, video_id):
+		with self.lock:
+			if video_id not in self.processing:
+				return 1.0 if self.by_id[video_id]['status'] == 'Ready' else 0.0
+			started, seconds = self.processing[video_id]
+			progress = (time.monotonic() - started) / seconds if seconds > 0 else 1.0
+			if progress >= 1:
+				self.by_id[video_id]['status'] = 'Ready'
+				del self.processing[video_id]
+				return 1.0
+			return round(progress, 4)
+
+# %%
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description='Mock Rev API server for offline benchmarks')
+	parser.add_argument('--host', default='127.0.0.1')
+	parser.add_argument('--port', type=int, default=0)
+	parser.add_argument('--videos', type=int, default=1000)
+	parser.add_argument('--latency', type=float, default=0)
+	parser.add_argument('--upload-bytes-per-sec', type=float, default=None)
+	parser.add_argument('--throttle-every', type=int, default=0)
+	parser.add_argument('--download-mb', type=float, default=16)
+	parser.add_argument('--processing-bytes-per-sec', type=float, default=None)
+	parser.add_argument('--compress', action='store_true', help='gzip/brotli JSON responses')
+	args = parser.parse_args()
+
+	mock = MockRevServer(args.videos, args.latency, args.upload_bytes_per_sec, args.throttle_every, download_size=int(args.download_mb * 1024 * 1024), processing_bytes_per_sec=args.processing_bytes_per_sec, compress_responses=args.compress, host=args.host, port=args.port)
+	# first line of output is the url, so a parent process can find the port
+	print(mock.url, flush=True)
+	try:
+		mock.httpd.serve_forever()
+	except KeyboardInterrupt:
+		pass
+	sys.exit(0)
@@ -0,0 +1,89 @@
+# %%
+import asyncio
+import threading
+
+import pytest
+from requests import HTTPError
+
+from revclient import AsyncRevClient
+from tests.mockserver import MockRevServer, video_id
+
+def async_client(server, **options):
+	return AsyncRevClient(server.url, apiKey='key', secret='secret', **options)
+
+# no pytest-asyncio, so each test runs its coroutine with asyncio.run
+def test_concurrent_logins_are_single_flight(server):
+	async def login():
+		async with async_client(server) as rev:
+			results = await asyncio.gather(*[ rev.lazy_extend_session(verify=False) for _ in range(10) ])
+			# fresh session, nothing left to do
+			return results, await rev.lazy_extend_session(verify=False)
+
+	results, again = asyncio.run(login())
+	assert server.requests['POST /api/v2/authenticate'] == 1
+	assert results.count(True) == 1
+	assert not again
+
+def test_gather_details(server):
+	ids = [ video['id'] for video in server.videos[:30] ]
+
+	async def details():
+		async with async_client(server) as rev:
+			await rev.connect()
+			return await asyncio.gather(*[ rev.video.details(id) for id in ids ])
+
+	assert [ video['id'] for video in asyncio.run(details()) ] == ids
+
+def test_errors_are_raised_in_the_caller(server):
+	async def details():
+		async with async_client(server) as rev:
+			await rev.connect()
+			await rev.video.details(video_id(999999))
+
+	with pytest.raises(HTTPError):
+		asyncio.run(details())
+
+def test_max_concurrency():
+	with MockRevServer(videos=20, latency=0.05) as server:
+		lock = threading.Lock()
+		in_flight = [0, 0]
+
+		def started(event):
+			with lock:
+				in_flight[0] += 1
+				in_flight[1] = max(in_flight)
+
+		def finished(event):
+			with lock:
+				in_flight[0] -= 1
+
+		async def details():
+			async with async_client(server, max_concurrency=4) as rev:
+				await rev.connect()
+				rev.client.add_hook('pre_request', started)
+				rev.client.add_hook('post_response', finished)
+				return await asyncio.gather(*[ rev.video.details(video['id']) for video in server.videos ])
+
+		assert len(asyncio.run(details())) == 20
+		assert in_flight[1] == 4
+
+@pytest.mark.parametrize('prefetch', [0, 2])
+def test_search_stream_keeps_order(server, prefetch):
+	async def search():
+		async with async_client(server) as rev:
+			await rev.connect()
+			pages = []
+			ids = [ video['id'] async for video in rev.video.search_stream(on_page=pages.append, prefetch=prefetch) ]
+			return ids, pages
+
+	ids, pages = asyncio.run(search())
+	assert ids == [ video['id'] for video in server.videos ]
+	assert len(pages) == 3
+
+def test_search_max_results(server):
+	async def search():
+		async with async_client(server) as rev:
+			await rev.connect()
+			return await rev.video.search(max_results=120)
+
+	assert len(asyncio.run(search())) == 120
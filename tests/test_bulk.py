@@ -0,0 +1,42 @@
+# %%
+import time
+
+from requests import HTTPError
+
+from revclient.bulk import BulkJob
+
+def slow_square(value):
+	# later items finish first, so completion order differs from input order
+	time.sleep((10 - value) * 0.005)
+	return value * value
+
+def test_ordered_results_keep_input_order():
+	job = BulkJob(slow_square, ((value, (value,)) for value in range(10)), max_workers=4, ordered=True)
+	results = list(job)
+	assert [ res.key for res in results ] == list(range(10))
+	assert [ res.value for res in results ] == [ value * value for value in range(10) ]
+	assert job.summary.count == 10 and job.summary.errors == 0
+
+def test_unordered_results_are_all_returned():
+	results = BulkJob(slow_square, ((value, (value,)) for value in range(10)), max_workers=4).results()
+	assert sorted(res.key for res in results) == list(range(10))
+
+def test_errors_are_captured_per_item():
+	def check(value):
+		if value % 3 == 0:
+			raise ValueError(value)
+		return value
+	progress = []
+	job = BulkJob(check, ((value, (value,)) for value in range(9)), max_workers=3, ordered=True, on_progress=lambda done, total, result: progress.append(done), total=9)
+	results = list(job)
+	assert [ res.key for res in results if not res.ok ] == [0, 3, 6]
+	assert all(isinstance(res.error, ValueError) for res in results if not res.ok)
+	assert job.summary.errors == 3
+	assert sorted(progress) == list(range(1, 10))
+
+def test_bulk_details(rev, server):
+	video_ids = [ video['id'] for video in server.videos[:20] ] + ['00000000-0000-4000-8000-ffffffffffff']
+	results = list(rev.video.bulk_details(video_ids, max_workers=4, ordered=True))
+	assert [ res.value['id'] for res in results[:20] ] == video_ids[:20]
+	assert isinstance(results[20].error, HTTPError)
+	assert results[20].error.response.status_code == 404
@@ -0,0 +1,49 @@
+# %%
+from revclient import RevClient
+from revclient.cache import ResponseCache
+
+def cached_client(server, cache):
+	client = RevClient(server.url, apiKey='key', secret='secret', cache=cache)
+	client.connect()
+	return client
+
+def test_details_are_cached(server):
+	cache = ResponseCache(ttl=60)
+	with cached_client(server, cache) as rev:
+		video_id = server.videos[0]['id']
+		first = rev.video.details(video_id)
+		# callers get their own copy
+		first['title'] = 'changed'
+		assert rev.video.details(video_id)['title'] == server.videos[0]['title']
+		assert server.requests[f'GET /api/v2/videos/{video_id}/details'] == 1
+		assert cache.stats['hits'] == 1
+
+def test_writes_invalidate_the_video(server):
+	cache = ResponseCache(ttl=60)
+	with cached_client(server, cache) as rev:
+		video_id = server.videos[0]['id']
+		rev.video.details(video_id)
+		rev.video.status(video_id)
+		# other videos aren't affected
+		rev.video.details(server.videos[1]['id'])
+		rev.video.patch(video_id, { 'Title': 'new' })
+		assert cache.stats['invalidations'] == 2
+		rev.video.details(video_id)
+		rev.video.details(server.videos[1]['id'])
+		assert server.requests[f'GET /api/v2/videos/{video_id}/details'] == 2
+		assert server.requests[f'GET /api/v2/videos/{server.videos[1]["id"]}/details'] == 1
+
+def test_search_pages_are_not_cached(server):
+	cache = ResponseCache(ttl=60)
+	with cached_client(server, cache) as rev:
+		list(rev.video.search_stream())
+		list(rev.video.search_stream())
+		assert cache.stats['entries'] == 0
+		assert server.requests['GET /api/v2/videos/search'] == 6
+
+def test_ttls_override_defaults():
+	cache = ResponseCache(ttl=60, ttls=[(r'/status$', 0), (r'/videos/search$', 30)])
+	assert cache.ttl_for('/api/v2/videos/abc/status') == 0
+	assert cache.ttl_for('/api/v2/videos/search') == 30
+	assert cache.ttl_for('/api/v2/videos/abc/details') == 60
+	assert ResponseCache().ttl_for('/api/v2/videos/search') == 0
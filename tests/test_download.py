@@ -0,0 +1,38 @@
+# %%
+import os
+
+import pytest
+
+def expected_content(size):
+	# the mock server's file content is the byte offset modulo 251
+	return (bytes(range(251)) * (size // 251 + 1))[:size]
+
+class Interrupted(Exception):
+	pass
+
+def interrupt_after(limit):
+	def on_progress(received, total, elapsed):
+		if received > limit:
+			raise Interrupted()
+	return on_progress
+
+def test_download(rev, server, tmp_path):
+	result = rev.video.download(server.videos[0]['id'], str(tmp_path))
+	assert result.size == server.download_size and result.resumed == 0
+	assert os.path.basename(result.path) == f'{server.videos[0]["id"]}.mp4'
+	with open(result.path, 'rb') as fh:
+		assert fh.read() == expected_content(server.download_size)
+
+@pytest.mark.parametrize('parallel', [1, 3])
+def test_interrupted_download_resumes(rev, server, tmp_path, parallel):
+	video_id = server.videos[0]['id']
+	dest = str(tmp_path / 'video.mp4')
+	with pytest.raises(Interrupted):
+		rev.video.download(video_id, dest, parallel=parallel, range_size=1024 * 1024, chunk_size=64 * 1024, on_progress=interrupt_after(1024 * 1024))
+	assert os.path.exists(f'{dest}.part') and not os.path.exists(dest)
+
+	result = rev.video.download(video_id, dest, parallel=parallel, range_size=1024 * 1024)
+	assert result.resumed > 0
+	assert not os.path.exists(f'{dest}.part')
+	with open(dest, 'rb') as fh:
+		assert fh.read() == expected_content(server.download_size)
@@ -0,0 +1,29 @@
+# %%
+import json
+
+from revclient.jsonstream import iter_array_items
+
+def test_incremental_search_matches_full_decode(rev):
+	assert list(rev.video.search_stream(incremental=True)) == list(rev.video.search_stream())
+
+def test_incremental_search_projects_fields(rev, server):
+	videos = list(rev.video.search_stream(incremental=True, fields=['id', 'title']))
+	assert videos[0] == { 'id': server.videos[0]['id'], 'title': server.videos[0]['title'] }
+	assert len(videos) == len(server.videos)
+
+def test_compact_records(rev, server):
+	video = next(rev.video.search_stream(fields=['id', 'whenUploaded'], compact=True))
+	assert video['id'] == server.videos[0]['id']
+	assert video.as_dict() == { 'id': server.videos[0]['id'], 'whenUploaded': server.videos[0]['whenUploaded'] }
+
+def test_iter_array_items_across_chunk_boundaries():
+	body = json.dumps({ 'totalVideos': 2, 'videos': [ { 'id': 'a', 'tags': ['x, y', '}'] }, { 'id': 'b\\"', 'title': 'café' } ], 'scrollId': None }, ensure_ascii=False).encode()
+	meta = {}
+	# one byte per chunk, so every token and multi-byte character is split
+	items = list(iter_array_items((body[index:index + 1] for index in range(len(body))), 'videos', meta))
+	assert items == json.loads(body)['videos']
+	assert meta == { 'totalVideos': 2, 'scrollId': None }
+
+def test_iter_array_items_empty():
+	assert list(iter_array_items(iter([b'{"videos": []}']), 'videos')) == []
+	assert list(iter_array_items(iter([]), 'videos')) == []
@@ -0,0 +1,89 @@
+# %%
+import pytest
+from requests import HTTPError
+
+from revclient import RevClient
+from revclient.metrics import MetricsCollector, endpoint_template
+from tests.mockserver import MockRevServer, video_id
+
+MISSING_ID = video_id(999999)
+
+def test_endpoint_template():
+	assert endpoint_template(f'/api/v2/videos/{MISSING_ID}/details') == '/api/v2/videos/{id}/details'
+	assert endpoint_template('/api/v2/videos/search') == '/api/v2/videos/search'
+
+def test_unknown_hook_event(rev):
+	with pytest.raises(TypeError):
+		rev.add_hook('on_success', print)
+
+def test_hooks_fire_per_attempt_and_call(rev, server):
+	events = { name: [] for name in ('pre_request', 'post_response', 'on_error') }
+	for name, calls in events.items():
+		rev.add_hook(name, lambda event, calls=calls: calls.append((event.template, event.status)))
+	rev.video.details(server.videos[0]['id'])
+	assert events['pre_request'] == [('/api/v2/videos/{id}/details', None)]
+	assert events['post_response'] == [('/api/v2/videos/{id}/details', 200)]
+	assert events['on_error'] == []
+
+	with pytest.raises(HTTPError):
+		rev.video.details(MISSING_ID)
+	assert events['on_error'] == [('/api/v2/videos/{id}/details', 404)]
+	assert events['post_response'][-1] == ('/api/v2/videos/{id}/details', 404)
+
+def test_remove_hook(rev, server):
+	calls = []
+	rev.remove_hook('post_response', rev.add_hook('post_response', calls.append))
+	rev.video.details(server.videos[0]['id'])
+	assert calls == []
+
+def test_on_retry_hook():
+	with MockRevServer(videos=5, throttle_every=3) as server:
+		with RevClient(server.url, apiKey='key', secret='secret') as rev:
+			rev.connect()
+			# the event is reused for the next attempt, so note the status when the hook runs
+			retries = []
+			rev.add_hook('on_retry', lambda event: retries.append((event.status, event.retry_delay)))
+			for video in server.videos:
+				rev.video.details(video['id'])
+			assert retries and all(status == 429 for status, delay in retries)
+			assert len(retries) == rev.retry_stats.as_dict()['throttled']
+
+def test_collector_summary(rev, server):
+	metrics = MetricsCollector().attach(rev)
+	for video in server.videos[:3]:
+		rev.video.details(video['id'])
+	with pytest.raises(HTTPError):
+		rev.video.details(MISSING_ID)
+	rows = { (row['method'], row['endpoint']): row for row in metrics.summary() }
+	row = rows[('GET', '/api/v2/videos/{id}/details')]
+	assert row['count'] == 4
+	assert row['errors'] == 1
+	assert row['retries'] == 0
+	assert 0 < row['p50'] <= row['p95'] <= row['p99']
+
+	metrics.detach(rev)
+	rev.video.details(server.videos[0]['id'])
+	assert metrics.summary()[0]['count'] == 4
+	metrics.reset()
+	assert metrics.summary() == []
+
+def test_prometheus_export(rev, server):
+	metrics = MetricsCollector().attach(rev)
+	rev.video.details(server.videos[0]['id'])
+	text = metrics.export()
+	labels = 'method="GET",endpoint="/api/v2/videos/{id}/details"'
+	assert '# TYPE revclient_request_duration_seconds histogram' in text
+	assert f'revclient_request_duration_seconds_bucket{{{labels},le="+Inf"}} 1' in text
+	assert f'revclient_request_duration_seconds_count{{{labels}}} 1' in text
+	assert '# TYPE revclient_requests_total counter' in text
+	assert f'revclient_requests_total{{{labels},status="200"}} 1' in text
+	assert not text.rstrip().endswith('# EOF')
+
+def test_openmetrics_export(rev, server):
+	metrics = MetricsCollector(prefix='rev').attach(rev)
+	rev.video.details(server.videos[0]['id'])
+	text = metrics.export(openmetrics=True)
+	# counter families drop the _total suffix, their samples keep it
+	assert '# TYPE rev_requests counter' in text
+	assert 'rev_requests_total{' in text
+	assert text.endswith('# EOF\n')
@@ -0,0 +1,44 @@
+# %%
+import io
+import json
+
+from urllib3.filepost import encode_multipart_formdata
+
+from revclient.upload import MultipartEncoder
+
+def fields(data):
+	return [
+		('video', json.dumps({ 'uploader': 'user', 'title': 'café "quoted"' })),
+		('VideoFile', ('video.mp4', io.BytesIO(data), 'video/mp4'))
+	]
+
+def encode(encoder):
+	return b''.join(bytes(chunk) for chunk in encoder)
+
+def test_body_matches_urllib3():
+	data = bytes(range(256)) * 1000
+	encoder = MultipartEncoder(fields(data), boundary='testboundary', chunk_size=4096)
+	expected, content_type = encode_multipart_formdata([ ('video', fields(data)[0][1]), ('VideoFile', ('video.mp4', data, 'video/mp4')) ], boundary='testboundary')
+	body = encode(encoder)
+	assert body == expected
+	assert len(encoder) == len(body)
+	assert encoder.content_type == content_type
+
+def test_body_can_be_sent_again():
+	data = b'x' * 10000 + b'y' * 10000
+	encoder = MultipartEncoder(fields(data), chunk_size=3000)
+	assert encode(encoder) == encode(encoder)
+
+def test_progress_reaches_length():
+	progress = []
+	encoder = MultipartEncoder(fields(b'z' * 50000), chunk_size=8192, on_progress=lambda sent, total, elapsed: progress.append((sent, total)))
+	encode(encoder)
+	assert progress[-1] == (len(encoder), len(encoder))
+	assert [ sent for sent, total in progress ] == sorted(sent for sent, total in progress)
+
+def test_upload_streams_file(rev, server):
+	data = b'v' * (3 * 1024 * 1024 + 1)
+	video_id = rev.video.upload(('video.mp4', io.BytesIO(data), 'video/mp4'), { 'uploader': 'user', 'title': 'streamed' }, chunk_size=64 * 1024)
+	assert server.video(video_id)['title'] == 'streamed'
+	# the whole multipart body was received
+	assert server.uploaded_bytes > len(data)
@@ -0,0 +1,31 @@
+# %%
+from tests.mockserver import parse_date
+
+# the mock server's 250 videos are uploaded an hour apart from 2020-01-01
+QUERY = { 'fromUploadDate': '2020-01-01T00:00:00Z', 'toUploadDate': '2020-02-01T00:00:00Z' }
+
+def test_finds_every_video(rev, server):
+	ids = [ video['id'] for video in rev.video.search_parallel(QUERY, partitions=4) ]
+	assert sorted(ids) == sorted(video['id'] for video in server.videos)
+
+def test_large_windows_are_split(rev, server):
+	ids = [ video['id'] for video in rev.video.search_parallel(QUERY, partitions=2, max_window_results=40) ]
+	assert sorted(ids) == sorted(video['id'] for video in server.videos)
+	# the first page of each too-large window is thrown away, and the window searched again in two halves
+	assert server.requests['GET /api/v2/videos/search'] > 250 // 40
+
+def test_boundary_videos_are_not_repeated(rev, server):
+	# Rev includes both ends of a date range, so a video on a window boundary comes back from both windows
+	def inclusive_search(from_date = None, to_date = None):
+		start = parse_date(from_date) if from_date else None
+		end = parse_date(to_date) if to_date else None
+		return [ video for video, when in zip(server.videos, server.upload_dates) if (not start or when >= start) and (not end or when <= end) ]
+	server.search = inclusive_search
+	# 250 hours in 5 windows, so every boundary lands on a video's upload time
+	query = { 'fromUploadDate': '2020-01-01T00:00:00Z', 'toUploadDate': '2020-01-11T10:00:00Z' }
+	ids = [ video['id'] for video in rev.video.search_parallel(query, partitions=5) ]
+	assert len(ids) == len(set(ids)) == len(server.videos)
+
+def test_fields_projection(rev, server):
+	videos = list(rev.video.search_parallel(QUERY, fields=['id']))
+	assert all(list(video) == ['id'] for video in videos)
@@ -0,0 +1,41 @@
+# %%
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from revclient.video import patch_operations, patch_date, prepare_patches
+
+def test_bool_fields_send_booleans():
+	operations, invalid = patch_operations({ 'isActive': 0, 'EnableDownloads': 'yes', 'unlisted': True })
+	assert operations == [
+		{ 'op': 'add', 'path': '/IsActive', 'value': False },
+		{ 'op': 'add', 'path': '/EnableDownloads', 'value': True },
+		{ 'op': 'add', 'path': '/Unlisted', 'value': True }
+	]
+	assert invalid == {}
+
+def test_field_names_are_case_insensitive():
+	operations, _ = patch_operations({ 'title': 'a', 'TAGS': ['x'], 'Categories': 'c' })
+	assert [ op['path'] for op in operations ] == ['/Title', '/Tags/-', '/Categories']
+
+def test_invalid_fields():
+	operations, invalid = patch_operations({ 'Title': 'a', 'Nope': 1 })
+	assert len(operations) == 1
+	assert invalid == { 'Nope': 1 }
+	with pytest.raises(TypeError):
+		patch_operations({ 'Nope': 1 }, strict=True)
+
+def test_dates_are_utc_for_datetimes_and_strings():
+	eastern = timezone(timedelta(hours=-5))
+	assert patch_date(datetime(2024, 1, 1, 22, tzinfo=eastern)) == '2024-01-02'
+	assert patch_date('2024-01-01T22:00:00-05:00') == '2024-01-02'
+	assert patch_date('2024-01-01') == '2024-01-01'
+	# empty dates are left out
+	assert patch_operations({ 'ExpirationDate': None }) == ([], {})
+
+def test_prepare_and_send_patches(rev, server):
+	video_ids = [ video['id'] for video in server.videos[:3] ]
+	patches = prepare_patches({ video_id: { 'Title': 'new', 'IsActive': False } for video_id in video_ids })
+	results = list(rev.video.bulk_send_patches(patches))
+	assert all(res.ok for res in results)
+	assert server.requests[f'PATCH /api/v2/videos/{video_ids[0]}'] == 1
@@ -0,0 +1,114 @@
+# %%
+import threading
+import time
+
+import pytest
+
+from revclient import RevClientPool
+from revclient.pool import FairScheduler
+
+LOGOFF = 'DELETE /api/v2/tokens/key'
+
+def wait_until(check, timeout = 5):
+	deadline = time.monotonic() + timeout
+	while not check():
+		assert time.monotonic() < deadline, 'timed out'
+		time.sleep(0.01)
+
+def queue_requests(scheduler, requests, order):
+	# starts a thread per (tenant, label), each queued only once the one before it is waiting
+	threads = []
+	for tenant, label in requests:
+		def run(tenant=tenant, label=label):
+			scheduler.acquire(tenant)
+			order.append(label)
+			scheduler.release(tenant)
+		queued = sum(scheduler.waiting.values())
+		thread = threading.Thread(target=run, daemon=True)
+		thread.start()
+		threads.append(thread)
+		wait_until(lambda: sum(scheduler.waiting.values()) > queued)
+	return threads
+
+def test_waiting_tenants_take_turns():
+	scheduler = FairScheduler(1)
+	scheduler.acquire('busy')
+	order = []
+	threads = queue_requests(scheduler, [('a', 'a1'), ('a', 'a2'), ('a', 'a3'), ('b', 'b1'), ('c', 'c1')], order)
+	assert scheduler.waiting == { 'a': 3, 'b': 1, 'c': 1 }
+	scheduler.release('busy')
+	for thread in threads:
+		thread.join(5)
+	assert order == ['a1', 'b1', 'c1', 'a2', 'a3']
+	assert scheduler.in_flight() == 0
+	assert scheduler.granted == 6
+
+def test_per_tenant_cap():
+	scheduler = FairScheduler(3, per_tenant=2)
+	assert scheduler.acquire('a') == 0.0
+	assert scheduler.acquire('a') == 0.0
+	order = []
+	# 'a' is at its cap, so 'b' goes ahead of it into the free slot
+	threads = queue_requests(scheduler, [('a', 'a3')], order)
+	assert scheduler.acquire('b') == 0.0
+	assert scheduler.in_flight('a') == 2 and scheduler.in_flight('b') == 1
+	assert order == []
+	scheduler.release('b')
+	assert order == []
+	scheduler.release('a')
+	threads[0].join(5)
+	assert order == ['a3']
+	scheduler.release('a')
+	assert scheduler.in_flight() == 0
+
+def make_pool(server, names, **options):
+	pool = RevClientPool(**options)
+	for name in names:
+		pool.add_tenant(name, server.url, apiKey='key', secret='secret')
+	return pool
+
+def test_unknown_tenant(server):
+	with make_pool(server, []) as pool:
+		with pytest.raises(KeyError):
+			pool.get('missing')
+
+def test_clients_are_reused(server):
+	with make_pool(server, ['a']) as pool:
+		assert pool['a'] is pool['a']
+		assert pool['a'].video.details(server.videos[0]['id'])['id'] == server.videos[0]['id']
+		assert server.requests['POST /api/v2/authenticate'] == 1
+
+def test_least_recently_used_evicted_past_max_clients(server):
+	with make_pool(server, ['a', 'b', 'c'], max_clients=2, logoff_on_evict=True) as pool:
+		a = pool['a']
+		pool['b']
+		pool['a']
+		pool['c']
+		assert list(pool.clients) == ['a', 'c']
+		assert pool.stats['evictions'] == 1
+		assert server.requests[LOGOFF] == 1
+		assert pool['a'] is a
+
+def test_idle_clients_evicted(server):
+	with make_pool(server, ['a', 'b'], idle_timeout=0.2) as pool:
+		pool['a']
+		pool['b']
+		assert pool.evict_idle() == 0
+		time.sleep(0.3)
+		# getting a client also closes the idle ones
+		pool['b']
+		assert list(pool.clients) == ['b']
+		time.sleep(0.3)
+		assert pool.evict_idle() == 1
+		assert pool.stats['evictions'] == 2
+		# left to expire on the server
+		assert LOGOFF not in server.requests
+
+def test_clients_in_use_not_evicted(server):
+	with make_pool(server, ['a'], idle_timeout=0) as pool:
+		pool['a']
+		pool.scheduler.acquire('a')
+		time.sleep(0.01)
+		assert pool.evict_idle() == 0
+		pool.scheduler.release('a')
+		assert pool.evict_idle() == 1
@@ -0,0 +1,57 @@
+# %%
+import pytest
+
+from revclient import RevClient
+from revclient.ratelimit import TokenBucket, FileTokenBucket, RateLimiter
+
+def test_bucket_allows_bursts_up_to_capacity():
+	bucket = TokenBucket(rate=10, capacity=5)
+	now = bucket.updated
+	assert [ bucket._reserve(1, now) for _ in range(5) ] == [0] * 5
+	# the next token is a tenth of a second away, the one after that two
+	assert bucket._reserve(1, now) == pytest.approx(0.1)
+	assert bucket._reserve(1, now) == pytest.approx(0.2)
+
+def test_bucket_refills_to_capacity_only():
+	bucket = TokenBucket(rate=10, capacity=5)
+	now = bucket.updated
+	bucket._reserve(5, now)
+	assert bucket._reserve(1, now + 100) == 0
+	assert bucket.tokens == 4
+
+def test_bucket_rejects_empty_counts():
+	bucket = TokenBucket(rate=100, capacity=10)
+	for tokens in (0, -1000):
+		with pytest.raises(TypeError):
+			bucket.acquire(tokens)
+	assert bucket.tokens <= bucket.capacity
+
+def test_acquire_waits():
+	bucket = TokenBucket(rate=50, capacity=1)
+	assert bucket.acquire() == 0
+	assert bucket.acquire() == pytest.approx(0.02, abs=0.01)
+
+def test_file_bucket_is_shared(tmp_path):
+	# two buckets on the same file stand in for two processes
+	path = str(tmp_path / 'bucket')
+	first = FileTokenBucket(path, rate=1, capacity=3)
+	second = FileTokenBucket(path, rate=1, capacity=3)
+	assert first.acquire(3) == 0
+	assert second.acquire() > 0.5
+	first.close()
+	second.close()
+
+def test_limiter_rules(server):
+	search = TokenBucket(rate=1000)
+	default = TokenBucket(rate=1000)
+	limiter = RateLimiter([ (r'/videos/search$', search) ], default=default)
+	assert limiter.bucket_for('GET', '/api/v2/videos/search') is search
+	assert limiter.bucket_for('GET', '/api/v2/videos/abc/details') is default
+	assert RateLimiter().acquire('GET', '/api/v2/videos/search') == 0
+
+	with RevClient(server.url, apiKey='key', secret='secret', rate_limiter=limiter) as rev:
+		rev.connect()
+		rev.video.details(server.videos[0]['id'])
+		list(rev.video.search_stream(max_results=10))
+	# login, details and one search page
+	assert limiter.acquired == 3
@@ -0,0 +1,56 @@
+# %%
+from revclient import RevClient
+from revclient.recording import RecordingTransport, ReplayTransport, load_recording, replay_traffic, REDACTED
+
+def record(server, path, **credentials):
+	with RecordingTransport(path) as recorder:
+		with RevClient(server.url, transport=recorder, **credentials) as rev:
+			rev.connect()
+			rev.video.details(server.videos[0]['id'])
+			rev.video.patch(server.videos[0]['id'], { 'Title': 'new' })
+			user_id = rev.session.userId
+			token = rev.session.token
+			rev.disconnect()
+	return user_id, token
+
+def test_login_is_redacted(server, tmp_path):
+	path = str(tmp_path / 'traffic.jsonl')
+	user_id, token = record(server, path, username='alice', password='hunter2')
+	with open(path, 'r') as fh:
+		text = fh.read()
+	for secret in ('alice', 'hunter2', token):
+		assert secret not in text
+
+	entries = load_recording(path)
+	login = next(entry for entry in entries if entry['path'] == '/api/v2/user/login')
+	assert login['request']['json'] == REDACTED
+	assert login['redacted'] and 'json' not in login
+	assert user_id not in str(login)
+
+def test_api_key_is_redacted(server, tmp_path):
+	path = str(tmp_path / 'traffic.jsonl.gz')
+	record(server, path, apiKey='my-key', secret='my-secret')
+	entries = load_recording(path)
+	text = str(entries)
+	assert 'my-key' not in text and 'my-secret' not in text
+	assert any(entry['path'] == f'/api/v2/tokens/{REDACTED}' for entry in entries)
+
+def test_replay_answers_from_recording(server, tmp_path):
+	path = str(tmp_path / 'traffic.jsonl')
+	record(server, path, apiKey='key', secret='secret')
+	with RevClient(server.url, apiKey='key', secret='secret', transport=ReplayTransport(path)) as rev:
+		rev.connect()
+		assert not rev.session.is_expired
+		# any video id gets the recorded details response
+		assert rev.video.details(server.videos[5]['id'])['id'] == server.videos[0]['id']
+	# nothing was sent to the server
+	assert f'GET /api/v2/videos/{server.videos[5]["id"]}/details' not in server.requests
+
+def test_replay_traffic_skips_logins(rev, server, tmp_path):
+	path = str(tmp_path / 'traffic.jsonl')
+	record(server, path, username='alice', password='hunter2')
+	before = dict(server.requests)
+	sent = replay_traffic(rev, path)
+	assert sent == 2
+	assert server.requests['POST /api/v2/user/login'] == before['POST /api/v2/user/login']
+	assert server.requests[f'PATCH /api/v2/videos/{server.videos[0]["id"]}'] == 2
@@ -0,0 +1,65 @@
+# %%
+from datetime import timedelta
+from email.utils import format_datetime
+
+import pytest
+from requests import HTTPError
+
+from revclient import RevClient
+from revclient.retry import RetryPolicy, parse_retry_after
+from revclient.utils import now_iso
+from tests.mockserver import MockRevServer
+
+def test_retry_after_seconds_and_dates():
+	assert parse_retry_after('3') == 3
+	assert parse_retry_after('-1') == 0
+	assert parse_retry_after(None) is None
+	assert parse_retry_after('soon') is None
+	later = format_datetime(now_iso() + timedelta(seconds=30), usegmt=True)
+	assert 25 < parse_retry_after(later) <= 30
+	earlier = format_datetime(now_iso() - timedelta(seconds=30), usegmt=True)
+	assert parse_retry_after(earlier) == 0
+
+class FakeResponse():
+	def __init__(self, retry_after):
+		self.headers = { 'Retry-After': retry_after }
+
+def test_backoff():
+	policy = RetryPolicy(backoff_factor=0.5, max_backoff=3, jitter=False, max_retry_after=60)
+	assert [ policy.backoff(attempt) for attempt in range(4) ] == [0.5, 1, 2, 3]
+	assert policy.backoff(0, FakeResponse('10')) == 10
+	assert policy.backoff(0, FakeResponse('600')) == 60
+
+def test_post_is_only_retried_when_throttled():
+	policy = RetryPolicy()
+	assert not policy.should_retry('POST', 0, 503)
+	assert not policy.should_retry('POST', 0, None)
+	assert policy.should_retry('POST', 0, 429)
+	assert policy.should_retry('GET', 0, 503)
+	assert policy.should_retry('GET', 0, None)
+	assert not policy.should_retry('GET', 3, 503)
+	assert not policy.should_retry('GET', 0, 404)
+
+def test_throttled_requests_are_retried():
+	# every 3rd request gets a 429 with Retry-After: 0
+	with MockRevServer(videos=10, throttle_every=3) as server:
+		with RevClient(server.url, apiKey='key', secret='secret') as rev:
+			rev.connect()
+			for video in server.videos:
+				assert rev.video.details(video['id'])['id'] == video['id']
+			stats = rev.retry_stats.as_dict()
+			assert stats['throttled'] > 0 and stats['retries'] == stats['throttled']
+
+def test_logs_in_again_after_401(rev, server):
+	# the server forgets the session, as if it was revoked
+	server.tokens.clear()
+	assert rev.video.details(server.videos[0]['id'])['id'] == server.videos[0]['id']
+	assert server.requests['POST /api/v2/authenticate'] == 2
+	assert rev.retry_stats.reauthentications == 1
+
+def test_only_one_login_per_401(rev, server):
+	server.valid_token = lambda header: False
+	with pytest.raises(HTTPError) as err:
+		rev.video.details(server.videos[0]['id'])
+	assert err.value.response.status_code == 401
+	assert server.requests['POST /api/v2/authenticate'] == 2
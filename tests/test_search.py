@@ -0,0 +1,26 @@
+# %%
+from revclient.client import ScrollCursor, MAX_INT
+from tests.mockserver import SEARCH_PAGE_SIZE
+
+def test_search_stream_scrolls_every_page(rev, server):
+	ids = [ video['id'] for video in rev.video.search_stream() ]
+	assert ids == [ video['id'] for video in server.videos ]
+	assert server.requests['GET /api/v2/videos/search'] == -(-len(server.videos) // SEARCH_PAGE_SIZE)
+
+def test_search_stream_max_results(rev):
+	assert len(list(rev.video.search_stream(max_results=120))) == 120
+
+def test_search_stream_prefetch_keeps_order(rev, server):
+	ids = [ video['id'] for video in rev.video.search_stream(prefetch=2) ]
+	assert ids == [ video['id'] for video in server.videos ]
+
+def test_search_stream_on_page(rev, server):
+	pages = []
+	list(rev.video.search_stream(on_page=pages.append))
+	assert sum(len(page['items']) for page in pages) == len(server.videos)
+
+def test_empty_page_ends_scroll():
+	cursor = ScrollCursor('totalVideos', 'videos', {}, MAX_INT)
+	page = cursor.advance({ 'videos': [], 'totalVideos': 10, 'scrollId': 'abc' })
+	assert page['items'] == []
+	assert cursor.done
@@ -0,0 +1,26 @@
+# %%
+from revclient import RevClient
+from tests.mockserver import MockRevServer
+
+def extend_calls(server):
+	return sum(count for key, count in server.requests.items() if 'extend-session-timeout' in key)
+
+def test_lazy_extend_threshold_is_in_minutes():
+	# session expires in 2 minutes, which is inside a 3 minute threshold
+	with MockRevServer(videos=1, session_minutes=2) as server:
+		with RevClient(server.url, apiKey='key', secret='secret') as rev:
+			rev.connect()
+			assert rev.lazy_extend_session(refresh_threshold_minutes=3, verify=False)
+			assert extend_calls(server) == 1
+
+def test_lazy_extend_skips_fresh_session():
+	with MockRevServer(videos=1, session_minutes=20) as server:
+		with RevClient(server.url, apiKey='key', secret='secret') as rev:
+			rev.connect()
+			assert not rev.lazy_extend_session(refresh_threshold_minutes=3, verify=False)
+			assert extend_calls(server) == 0
+
+def test_lazy_extend_logs_in_when_expired(rev, server):
+	rev.session.expires = None
+	assert rev.lazy_extend_session(verify=False)
+	assert server.requests['POST /api/v2/authenticate'] == 2
@@ -0,0 +1,65 @@
+# %%
+import pytest
+
+from revclient.store import VideoStore
+from tests.conftest import remove_video, DATE_ARGS
+
+def test_failed_sync_keeps_checkpoint(rev, server, tmp_path):
+	checkpoint = str(tmp_path / 'sync.json')
+	rev.video.sync(checkpoint, **DATE_ARGS)
+	with open(checkpoint, 'r') as fh:
+		saved = fh.read()
+	server.add_video({}, 10)
+	def fail():
+		raise RuntimeError('write failed')
+	with pytest.raises(RuntimeError):
+		rev.video.sync(checkpoint, before_save=fail, **DATE_ARGS)
+	with open(checkpoint, 'r') as fh:
+		assert fh.read() == saved
+
+def test_store_refresh(rev, server, tmp_path):
+	store = VideoStore(str(tmp_path / 'store.db'))
+	store.refresh(rev.video, detect_deletions=True)
+	assert store.count() == len(server.videos)
+
+	gone = server.videos[0]['id']
+	remove_video(server, gone)
+	result = store.refresh(rev.video, detect_deletions=True)
+	assert result.deleted == [gone]
+	assert store.count() == len(server.videos)
+	store.close()
+
+def test_store_checkpoint_waits_for_sqlite(rev, server, tmp_path):
+	store = VideoStore(str(tmp_path / 'store.db'))
+	store.refresh(rev.video, detect_deletions=True)
+	with open(store.checkpoint, 'r') as fh:
+		saved = fh.read()
+	remove_video(server, server.videos[0]['id'])
+
+	def fail(video_ids):
+		raise RuntimeError('disk full')
+	store.delete = fail
+	with pytest.raises(RuntimeError):
+		store.refresh(rev.video, detect_deletions=True)
+	with open(store.checkpoint, 'r') as fh:
+		assert fh.read() == saved
+	store.close()
+
+def test_local_search_on_memory_store(rev, server):
+	store = rev.video.use_store(VideoStore(max_age=3600))
+	videos = rev.video.local_search(uploader='user3')
+	assert store.count() == len(server.videos)
+	assert videos and all(video['uploadedBy'] == 'user3' for video in videos)
+	# fresh, so no second search
+	rev.video.local_search(tag='tag1')
+	assert server.requests['GET /api/v2/videos/search'] == 3
+
+def test_load_same_video_twice(server):
+	store = VideoStore()
+	first = dict(server.videos[0])
+	second = dict(first, title='renamed', tags=['other'])
+	assert store.load([first, second]) == 1
+	assert store.count() == 1
+	assert store.query(tag='other')[0]['title'] == 'renamed'
+	assert store.query(tag=first['tags'][0]) == []
+	store.close()
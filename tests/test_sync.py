@@ -0,0 +1,51 @@
+# %%
+import json
+from datetime import timedelta
+
+from tests.conftest import remove_video, DATE_ARGS
+
+def test_sync_only_fetches_changes(rev, server, tmp_path):
+	checkpoint = str(tmp_path / 'sync.json')
+	result = rev.video.sync(checkpoint, **DATE_ARGS)
+	assert result.full_sync and len(result.changed) == len(server.videos)
+
+	new_video = server.add_video({ 'title': 'new' }, 10)
+	result = rev.video.sync(checkpoint, **DATE_ARGS)
+	assert not result.full_sync
+	# videos within the overlap before the high-water mark are fetched again
+	assert new_video['id'] in [ video['id'] for video in result.changed ]
+	assert len(result.changed) < 5
+
+def test_sync_checkpoint_has_no_ids_by_default(rev, tmp_path):
+	checkpoint = str(tmp_path / 'sync.json')
+	result = rev.video.sync(checkpoint, **DATE_ARGS)
+	assert not result.deletions_checked
+	with open(checkpoint, 'r') as fh:
+		assert 'ids' not in json.load(fh)
+
+def test_sync_detects_deletions(rev, server, tmp_path):
+	checkpoint = str(tmp_path / 'sync.json')
+	rev.video.sync(checkpoint, detect_deletions=True, **DATE_ARGS)
+	gone = server.videos[0]['id']
+	remove_video(server, gone)
+	deleted = []
+	result = rev.video.sync(checkpoint, on_delete=deleted.append, detect_deletions=True, **DATE_ARGS)
+	assert result.deletions_checked
+	assert result.deleted == deleted == [gone]
+
+def test_sync_deletion_interval(rev, server, tmp_path):
+	checkpoint = str(tmp_path / 'sync.json')
+	rev.video.sync(checkpoint, detect_deletions=True, **DATE_ARGS)
+	gone = server.videos[0]['id']
+	remove_video(server, gone)
+	result = rev.video.sync(checkpoint, detect_deletions=timedelta(days=1), **DATE_ARGS)
+	assert not result.deletions_checked and result.deleted == []
+
+	# pretend the last scan was long ago
+	with open(checkpoint, 'r') as fh:
+		state = json.load(fh)
+	state['lastDeletionScan'] = '2020-01-01T00:00:00.000Z'
+	with open(checkpoint, 'w') as fh:
+		json.dump(state, fh)
+	result = rev.video.sync(checkpoint, detect_deletions=timedelta(days=1), **DATE_ARGS)
+	assert result.deletions_checked and result.deleted == [gone]
@@ -0,0 +1,90 @@
+# %%
+import gzip
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from revclient import RevClient
+from revclient.transport import HttpTransport, decompress
+from tests.mockserver import MockRevServer
+
+# a patch body well over DEFAULT_COMPRESS_MIN_BYTES
+METADATA = { 'description': 'compress me ' * 500, 'tags': ['one', 'two'] }
+
+def test_decompress():
+	body = b'{"id": 1}' * 100
+	assert decompress(gzip.compress(body), 'gzip') == body
+	assert decompress(body, 'identity') == body
+	assert decompress(body, None) == body
+
+def test_unknown_compression():
+	with pytest.raises(TypeError):
+		HttpTransport(compression='zstd')
+
+@pytest.mark.parametrize('compression', ['gzip', 'br'])
+def test_compressed_requests_and_responses(compression):
+	if compression == 'br':
+		pytest.importorskip('brotli')
+	with MockRevServer(videos=50, compress_responses=True) as server:
+		with RevClient(server.url, apiKey='key', secret='secret', compression=compression) as rev:
+			rev.connect()
+			video = server.videos[0]
+			assert rev.video.details(video['id']) == video
+			# search pages are big enough for the server to compress
+			assert [ item['id'] for item in rev.video.search_stream() ] == [ item['id'] for item in server.videos ]
+			rev.video.patch(video['id'], METADATA)
+			stats = rev.transport.transfer_stats.as_dict()
+			# only the patch body is big enough to compress
+			assert stats['requests_compressed'] == 1
+			assert stats['request_wire_bytes'] < stats['request_bytes']
+			assert stats['responses_compressed'] >= 1
+			assert stats['response_wire_bytes'] < stats['response_bytes']
+			assert server.json_bytes_received == stats['request_wire_bytes']
+
+def test_small_bodies_sent_as_is(server):
+	with RevClient(server.url, apiKey='key', secret='secret', compression='gzip') as rev:
+		rev.connect()
+		rev.video.patch(server.videos[0]['id'], { 'title': 'short' })
+		stats = rev.transport.transfer_stats.as_dict()
+		assert stats['requests'] == 2 and stats['requests_compressed'] == 0
+
+@pytest.fixture(scope='module')
+def h2_server():
+	pytest.importorskip('httpx')
+	pytest.importorskip('h2')
+	# h2server imports mockserver as a top level module, as when it's run standalone
+	sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+	try:
+		from h2server import MockH2Server
+	finally:
+		sys.path.pop(0)
+	with MockH2Server(videos=20) as server:
+		yield server
+
+def h2_client(server, compression = None):
+	from revclient.http2 import Http2Transport
+	return RevClient(server.url, apiKey='key', secret='secret', transport=Http2Transport(max_connections=4, compression=compression, http1=False))
+
+def test_http2_requests_share_a_connection(h2_server):
+	with h2_client(h2_server) as rev:
+		rev.connect()
+		resp = rev.request('GET', f'/api/v2/videos/{h2_server.videos[0]["id"]}/details', payload_only=False)
+		assert resp.http_version == 'HTTP/2'
+		with ThreadPoolExecutor(8) as executor:
+			details = list(executor.map(rev.video.details, [ video['id'] for video in h2_server.videos ]))
+		assert details == h2_server.videos
+		assert rev.transport.connections == 1
+	# the client leaves a transport it was given open
+	rev.transport.close()
+
+def test_http2_search_and_compression(h2_server):
+	with h2_client(h2_server, 'gzip') as rev:
+		rev.connect()
+		assert [ video['id'] for video in rev.video.search_stream() ] == [ video['id'] for video in h2_server.videos ]
+		rev.video.patch(h2_server.videos[0]['id'], METADATA)
+		stats = rev.transport.transfer_stats.as_dict()
+		assert stats['requests_compressed'] == 1
+		assert stats['responses_compressed'] >= 1
+	rev.transport.close()
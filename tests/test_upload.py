@@ -0,0 +1,69 @@
+# %%
+import json
+
+from revclient import RevClient, UploadManager
+from tests.mockserver import MockRevServer
+
+def write_files(directory, count):
+	paths = []
+	for index in range(count):
+		path = directory / f'video{index}.mp4'
+		path.write_bytes(bytes([index]) * (64 * 1024 + index))
+		paths.append(str(path))
+	return paths
+
+def read_manifest(path):
+	with open(path, 'r') as fh:
+		return [ json.loads(line) for line in fh if line.strip() ]
+
+def test_manifest_skips_completed_uploads(rev, server, tmp_path):
+	paths = write_files(tmp_path, 3)
+	manifest = str(tmp_path / 'uploads.jsonl')
+	items = [ (path, { 'uploader': 'user', 'title': f'video {index}' }) for index, path in enumerate(paths) ]
+
+	report = UploadManager(rev, max_workers=2, manifest=manifest).run(items)
+	assert report.uploaded == 3 and report.failed == 0
+	assert len(read_manifest(manifest)) == 3
+
+	# a new manager, as after a restart
+	report = UploadManager(rev, max_workers=2, manifest=manifest).run(items)
+	assert report.skipped == 3 and report.uploaded == 0
+	assert server.requests['POST /api/v2/uploads/videos'] == 3
+
+def test_failed_transcription_keeps_video(rev, server, tmp_path):
+	# the mock server has no transcription endpoint, so those uploads fail
+	path = write_files(tmp_path, 1)[0]
+	srt = tmp_path / 'video0.srt'
+	srt.write_text('1\n00:00:00,000 --> 00:00:01,000\nhello\n')
+	manifest = str(tmp_path / 'uploads.jsonl')
+	items = [ (path, { 'uploader': 'user' }, { 'en': str(srt) }) ]
+
+	report = UploadManager(rev, manifest=manifest).run(items)
+	result = report.results[0]
+	assert result.partial and not result.ok
+	assert result.video_id is not None
+	assert list(result.failed_transcriptions) == ['en']
+	assert read_manifest(manifest)[0]['videoId'] == result.video_id
+
+	# the re-run retries the transcription, not the video
+	report = UploadManager(rev, manifest=manifest).run(items)
+	assert report.results[0].video_id == result.video_id
+	assert report.results[0].partial
+	assert server.requests['POST /api/v2/uploads/videos'] == 1
+
+def test_bandwidth_limit_survives_resent_body(tmp_path):
+	# every 2nd request gets a 429, so the upload (after the login) is sent twice
+	with MockRevServer(videos=1, throttle_every=2) as server:
+		with RevClient(server.url, apiKey='key', secret='secret') as rev:
+			rev.connect()
+			path = write_files(tmp_path, 1)[0]
+			manager = UploadManager(rev, max_bytes_per_sec=100 * 1024 * 1024, chunk_size=16 * 1024)
+			acquired = []
+			acquire = manager.limiter.acquire
+			manager.limiter.acquire = lambda tokens: acquired.append(tokens) or acquire(tokens)
+
+			report = manager.run([ (path, { 'uploader': 'user' }) ])
+			assert report.uploaded == 1
+			assert server.requests['POST /api/v2/uploads/videos'] == 2
+			assert min(acquired) > 0
+			assert manager.limiter.tokens <= manager.limiter.capacity
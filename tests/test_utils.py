@@ -0,0 +1,36 @@
+# %%
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from revclient.utils import parse_iso, parse_iso_many, format_iso
+
+def test_parse_iso_keeps_fraction_and_offset():
+	parsed = parse_iso('2021-01-02T03:04:05.678901+05:30')
+	assert parsed == datetime(2021, 1, 2, 3, 4, 5, 678901, timezone(timedelta(hours=5, minutes=30)))
+
+@pytest.mark.parametrize('value, expected', [
+	('2021-01-02T03:04:05Z', datetime(2021, 1, 2, 3, 4, 5, tzinfo=timezone.utc)),
+	('2021-01-02T03:04:05', datetime(2021, 1, 2, 3, 4, 5, tzinfo=timezone.utc)),
+	('2021-01-02', datetime(2021, 1, 2, tzinfo=timezone.utc)),
+	('20210102T030405Z', datetime(2021, 1, 2, 3, 4, 5, tzinfo=timezone.utc)),
+	('2021-01-02T03:04:05.1234567Z', datetime(2021, 1, 2, 3, 4, 5, 123456, timezone.utc)),
+	('2021-01-02T03:04:05-0800', datetime(2021, 1, 2, 11, 4, 5, tzinfo=timezone.utc)),
+])
+def test_parse_iso_formats(value, expected):
+	assert parse_iso(value) == expected
+	assert parse_iso(value).tzinfo is not None
+
+def test_parse_iso_invalid():
+	with pytest.raises(ValueError):
+		parse_iso('not a date')
+
+def test_parse_iso_many():
+	values = ['2021-01-02T00:00:00Z', None, '2021-01-02T00:00:00Z']
+	assert parse_iso_many(values) == [datetime(2021, 1, 2, tzinfo=timezone.utc), None, datetime(2021, 1, 2, tzinfo=timezone.utc)]
+
+def test_format_iso_is_utc_milliseconds():
+	eastern = timezone(timedelta(hours=-5))
+	assert format_iso(datetime(2021, 1, 2, 3, 4, 5, 678901, eastern)) == '2021-01-02T08:04:05.678Z'
+	assert format_iso(datetime(2021, 1, 2)) == '2021-01-02T00:00:00.000Z'
+	assert format_iso(parse_iso('2021-01-02T03:04:05.678Z')) == '2021-01-02T03:04:05.678Z'
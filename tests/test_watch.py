@@ -0,0 +1,40 @@
+# %%
+import pytest
+
+from revclient.watch import FAILED_STATUSES
+
+FAST = { 'min_interval': 0.02, 'max_interval': 0.1 }
+
+def test_waits_until_ready(rev, server):
+	video_ids = [ video['id'] for video in server.videos[:3] ]
+	for index, video_id in enumerate(video_ids):
+		server.start_processing(video_id, 0.1 * (index + 1))
+	changes = []
+	result = rev.video.wait_for_status(video_ids, timeout=10, on_change=lambda wait: changes.append((wait.video_id, wait.status)), **FAST)
+	assert sorted(wait.video_id for wait in result.ready) == sorted(video_ids)
+	assert not result.failed and not result.pending
+	assert (video_ids[0], 'Ready') in changes
+
+@pytest.mark.parametrize('status', FAILED_STATUSES)
+def test_end_states_fail(rev, server, status):
+	video_id = server.videos[0]['id']
+	server.by_id[video_id]['status'] = status
+	# no timeout - it has to give up on its own
+	result = rev.video.wait_for_status([video_id], **FAST)
+	assert [ wait.status for wait in result.failed ] == [status]
+
+def test_failed_status_can_be_the_target(rev, server):
+	video_id = server.videos[0]['id']
+	server.by_id[video_id]['status'] = 'ReadyButProcessingFailed'
+	result = rev.video.wait_for_status([video_id], target=('Ready', 'ReadyButProcessingFailed'), **FAST)
+	assert len(result.ready) == 1
+
+def test_missing_video_fails(rev):
+	result = rev.video.wait_for_status(['00000000-0000-4000-8000-ffffffffffff'], **FAST)
+	assert result.failed[0].status == 'NotFound'
+
+def test_timeout_leaves_pending(rev, server):
+	video_id = server.videos[0]['id']
+	server.start_processing(video_id, 60)
+	result = rev.video.wait_for_status([video_id], timeout=0.3, **FAST)
+	assert [ wait.video_id for wait in result.pending ] == [video_id]